@@ -0,0 +1,190 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Persistent store of the ISA and GS control numbers already received.
+
+The control numbers are kept in a local SQLite file, so a control number
+repeated in a later file, or on a later day, can be found.  A number is
+keyed by the segment, the sender and the receiver.
+"""
+
+import sqlite3
+import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS control_numbers (
+    seg_id TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    receiver TEXT NOT NULL,
+    control_number TEXT NOT NULL,
+    source TEXT,
+    received TEXT,
+    PRIMARY KEY (seg_id, sender, receiver, control_number)
+)
+"""
+
+
+def get_isa_key(seg_data):
+    """
+    @param seg_data: ISA segment
+    @type seg_data: L{segment<segment.Segment>}
+    @return: The store key of the interchange control number
+    @rtype: tuple(string, string, string, string)
+    """
+    return ('ISA', (seg_data.get_value('ISA06') or '').strip(),
+            (seg_data.get_value('ISA08') or '').strip(), seg_data.get_value('ISA13') or '')
+
+
+def get_gs_key(seg_data):
+    """
+    @param seg_data: GS segment
+    @type seg_data: L{segment<segment.Segment>}
+    @return: The store key of the group control number
+    @rtype: tuple(string, string, string, string)
+    """
+    return ('GS', (seg_data.get_value('GS02') or '').strip(),
+            (seg_data.get_value('GS03') or '').strip(), seg_data.get_value('GS06') or '')
+
+
+def get_envelope_keys(interchanges):
+    """
+    @param interchanges: Records from L{scan_envelopes<x12envelope.scan_envelopes>}
+    @return: The store keys of the ISA and GS control numbers
+    @rtype: list[tuple(string, string, string, string)]
+    """
+    keys = []
+    for isa in interchanges:
+        keys.append(('ISA', (isa['sender'] or '').strip(), (isa['receiver'] or '').strip(),
+                     isa['control_number'] or ''))
+        for gs in isa['groups']:
+            keys.append(('GS', (gs['sender'] or '').strip(), (gs['receiver'] or '').strip(),
+                         gs['control_number'] or ''))
+    return keys
+
+
+class ControlNumberStore(object):
+    """
+    SQLite file of received control numbers
+    """
+    def __init__(self, filename, timeout=30.0):
+        """
+        @param filename: SQLite database file.  Created if missing
+        @type filename: string
+        @param timeout: Seconds to wait for a lock held by another process
+        @type timeout: float
+        """
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, timeout)
+        self.conn.text_factory = str
+        with self.conn:
+            self.conn.execute(SCHEMA)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def find(self, key):
+        """
+        @param key: (segment id, sender, receiver, control number)
+        @type key: tuple(string, string, string, string)
+        @return: (source, date received) of an earlier use, or None
+        @rtype: tuple(string, string)
+        """
+        return self.conn.execute(
+            'SELECT source, received FROM control_numbers '
+            'WHERE seg_id = ? AND sender = ? AND receiver = ? AND control_number = ?', key).fetchone()
+
+    def find_all(self, keys):
+        """
+        @param keys: Store keys
+        @type keys: list[tuple(string, string, string, string)]
+        @return: The keys already in the store, with (source, date received)
+        @rtype: dict
+        """
+        found = {}
+        for key in keys:
+            row = self.find(key)
+            if row is not None:
+                found[key] = row
+        return found
+
+    def add(self, keys, source=None):
+        """
+        Record control numbers in one transaction.  Keys already in the
+        store keep their first source.
+
+        @param keys: Store keys
+        @type keys: list[tuple(string, string, string, string)]
+        @param source: Name of the source file
+        @type source: string
+        """
+        received = datetime.datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO control_numbers VALUES (?, ?, ?, ?, ?, ?)',
+                [tuple(key) + (source, received) for key in keys])
+
+    def claim(self, key, source=None):
+        """
+        Record a control number, unless it is already in the store
+
+        @param key: (segment id, sender, receiver, control number)
+        @type key: tuple(string, string, string, string)
+        @param source: Name of the source file
+        @type source: string
+        @return: (source, date received) of an earlier use, or None
+        @rtype: tuple(string, string)
+        """
+        return self.claim_all([key], source).get(key)
+
+    def claim_all(self, keys, source=None):
+        """
+        Record control numbers in one transaction, and find those already
+        in the store.  Each key is inserted before it is looked up, so when
+        two processes record the same key only one of them gets it, and
+        the other finds it.  A key repeated in keys is not found.
+
+        @param keys: Store keys
+        @type keys: list[tuple(string, string, string, string)]
+        @param source: Name of the source file
+        @type source: string
+        @return: The keys already in the store, with (source, date received)
+        @rtype: dict
+        """
+        received = datetime.datetime.now().isoformat()
+        found = {}
+        seen = set()
+        with self.conn:
+            for key in keys:
+                key = tuple(key)
+                if key in seen:
+                    continue
+                seen.add(key)
+                cur = self.conn.execute(
+                    'INSERT OR IGNORE INTO control_numbers VALUES (?, ?, ?, ?, ?, ?)',
+                    key + (source, received))
+                if cur.rowcount == 0:
+                    found[key] = self.find(key)
+        return found
+
+    def check_envelopes(self, interchanges, source=None):
+        """
+        Record the control numbers of a scanned file, and find those which
+        were already received
+
+        @param interchanges: Records from L{scan_envelopes<x12envelope.scan_envelopes>}
+        @param source: Name of the source file
+        @type source: string
+        @return: The repeated keys, with (source, date received)
+        @rtype: dict
+        """
+        return self.claim_all(get_envelope_keys(interchanges), source)
@@ -55,8 +55,26 @@ class error_997_visitor(error_visitor.error_visitor):
         self.st_control_num = 0
         self.st_loop_count = 0
 
+    def set_fd(self, fd):
+        """
+        @param fd: target file of the following segments
+        @type fd: file descriptor
+        """
+        self.fd = fd
+
     def visit_root_pre(self, errh):
         """
+        @param errh: Error handler
+        @type errh: L{error_handler.err_handler}
+        """
+        self.gs_loop_count = 0
+        self.st_loop_count = 0
+        self.write_header(errh)
+
+    def write_header(self, errh):
+        """
+        Write the ISA and GS segments, for the last ISA and GS loops
+
         @param errh: Error handler
         @type errh: L{error_handler.err_handler}
         """
@@ -82,7 +100,6 @@ class error_997_visitor(error_visitor.error_visitor):
         isa_seg.append(self.subele_term)
         self._write(isa_seg)
         self.isa_seg = isa_seg
-        self.gs_loop_count = 0
 
         # GS*FA*ENCOUNTER*00GR*20030425*150153*653500001*X*004010
         seg = errh.cur_gs_node.seg_data
@@ -99,7 +116,6 @@ class error_997_visitor(error_visitor.error_visitor):
         self.gs_seg = gs_seg
         self.gs_id = seg.get_value('GS06')
         #self.gs_997_count = 0
-        self.st_loop_count = 0
         self.gs_loop_count += 1
 
     def __get_isa_errors(self, err_isa):
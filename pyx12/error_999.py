@@ -51,8 +51,26 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         self.vriic = '005010X231'
 
 
+    def set_fd(self, fd):
+        """
+        @param fd: target file of the following segments
+        @type fd: file descriptor
+        """
+        self.fd = fd
+        self.wr.fd_out = fd
+
     def visit_root_pre(self, errh):
         """
+        @param errh: Error handler
+        @type errh: L{error_handler.err_handler}
+        """
+        self.write_header(errh)
+
+    def write_header(self, errh):
+        """
+        Write the ISA and GS segments, for the last ISA and GS loops.  The
+        count of the ST loops already written is kept for the GE.
+
         @param errh: Error handler
         @type errh: L{error_handler.err_handler}
 
@@ -60,6 +78,7 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         isa_node seg_data
         gs_node seg_data
         """
+        st_count = self.wr.st_count
         seg = errh.cur_isa_node.seg_data
         #ISA*00*          *00*          *ZZ*ENCOUNTER      *ZZ*00GR           *030425*1501*U*00501*000065350*0*T*:~
         self.isa_control_num = ('%s%s' % (time.strftime('%y%m%d'),
@@ -94,6 +113,7 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         gs_seg.set('07', seg.get_value('GS07'))
         gs_seg.set('08', self.vriic)
         self.wr.Write(gs_seg)
+        self.wr.st_count = st_count
 
     def __get_isa_errors(self, err_isa):
         """
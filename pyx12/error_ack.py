@@ -0,0 +1,125 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Write the 997/999 response a functional group at a time.
+
+The response for a GS loop is generated once the loop is closed, and the
+loop is then dropped from the error tree.  The ISA and GS segments of the
+response are taken from the last ISA and GS loops of the source, and the
+version of the last GS loop selects a 997 or a 999.  Neither is known
+until the end of the source, so the groups are spooled as both a 997 and a
+999, and nothing is written to the output until L{ack_writer.finish} is
+called.  The result is the same as visiting the whole error tree at the end.
+"""
+
+import sys
+import logging
+import tempfile
+import traceback
+
+# Intrapackage imports
+import pyx12.error_997
+import pyx12.error_999
+
+# Size of the spooled responses kept in memory
+SPOOL_SIZE = 1024 * 1024
+
+logger = logging.getLogger('pyx12')
+
+
+def get_ack_type(fic, vriic):
+    """
+    @param fic: Functional Identifier Code of the last GS loop
+    @param vriic: Version of the last GS loop
+    @return: 997, 999, or None if no response is generated
+    @rtype: string
+    """
+    if fic == 'FA' or not vriic:
+        return None
+    if vriic[:6] == '004010':
+        return '997'
+    if vriic[:6] == '005010':
+        return '999'
+    return None
+
+
+class ack_writer(object):
+    """
+    Generate the 997 and 999 responses for each closed GS loop.  Only the
+    one for the version of the last GS loop is written.  A closed GS loop
+    is not kept once it has been generated.
+    """
+    def __init__(self, errh, fd, term):
+        """
+        @param errh: Error handler.  Its closed GS loops are dropped
+        @type errh: L{error_handler.err_handler}
+        @param fd: 997/999 output document
+        @type fd: file descriptor
+        @param term: Source terminators
+        """
+        self.errh = errh
+        self.fd = fd
+        self.spools = {}
+        self.visitors = {}
+        self.failures = {}  # Formatted exception which stopped a response
+        for (ack_type, visitor_class) in (('997', pyx12.error_997.error_997_visitor),
+                                          ('999', pyx12.error_999.error_999_visitor)):
+            self.spools[ack_type] = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+            self.visitors[ack_type] = visitor_class(self.spools[ack_type], term)
+        errh.add_group_callback(self.visit_gs)
+
+    def visit_gs(self, err_gs):
+        """
+        Generate the responses for a GS loop.  An error stops the
+        response, as it does when visiting the whole tree.  Only the
+        formatted traceback is kept, as its frames refer to the loop.
+
+        @param err_gs: GS Loop error handler
+        @type err_gs: L{error_handler.err_gs}
+        """
+        for (ack_type, visitor) in self.visitors.items():
+            if ack_type not in self.failures:
+                try:
+                    err_gs.accept(visitor)
+                except Exception:
+                    self.failures[ack_type] = ''.join(traceback.format_exception(*sys.exc_info()))
+
+    def finish(self, fic, vriic):
+        """
+        Write the response: the envelope, the spooled groups, then any
+        groups left in the tree
+
+        @param fic: Functional Identifier Code of the last GS loop
+        @param vriic: Version of the last GS loop
+        """
+        ack_type = get_ack_type(fic, vriic)
+        if self.fd and ack_type is not None:
+            visitor = self.visitors[ack_type]
+            spool = self.spools[ack_type]
+            try:
+                visitor.set_fd(self.fd)
+                visitor.write_header(self.errh)
+                spool.seek(0)
+                for line in spool:
+                    self.fd.write(line)
+                if ack_type in self.failures:
+                    logger.error('Failed to create %s response\n%s' %
+                                 (ack_type, self.failures[ack_type].rstrip()))
+                else:
+                    for isa_node in self.errh.children:
+                        for gs_node in isa_node.children:
+                            gs_node.accept(visitor)
+                    visitor.visit_root_post(self.errh)
+            except Exception:
+                logger.exception('Failed to create %s response' % (ack_type))
+        for spool in self.spools.values():
+            spool.close()
+        self.failures = {}
@@ -16,6 +16,7 @@ import logging
 
 # Intrapackage imports
 from errors import IterOutOfBounds  # , IterDone
+import error_sink
 
 logger = logging.getLogger('pyx12.error_handler')
 
@@ -77,18 +78,32 @@ class err_iter(object):
 class err_handler(object):
     """
     The interface to the error handling structures.
+
+    Each error is also passed as an event to the registered sinks, when it
+    is raised.
     """
-    def __init__(self):
+    def __init__(self, keep_tree=True):
         """
+        @param keep_tree: If False, the errors of a closed ST loop are
+            dropped from the tree, and only its counts kept.  The loop is
+            dropped at the next ST, GS, GE, ISA or IEA segment, so the errors
+            of segments after its SE are still counted.  The tree can then
+            not be used to generate a 997/999 or the HTML output.
+        @type keep_tree: boolean
         """
 
         self.id = 'ROOT'
+        self.keep_tree = keep_tree
+        self.sinks = []
+        self.group_callbacks = []
+        self.done_isa_pos = 0  # ISA loops before this have no groups left
         #self.isa_loop_count = 0
         self.children = []
         self.cur_node = self
         self.cur_isa_node = None
         self.cur_gs_node = None
         self.cur_st_node = None
+        self.closed_st_node = None  # Closed ST loop, still to be dropped
         self.cur_seg_node = None
         self.seg_node_added = False
         self.cur_ele_node = None
@@ -103,6 +118,74 @@ class err_handler(object):
             child.accept(visitor)
         visitor.visit_root_post(self)
 
+    def add_sink(self, sink, err_types=None):
+        """
+        Register a receiver of error events
+
+        @param sink: Called with each L{error event<error_sink.error_event>}
+        @type sink: callable
+        @param err_types: If not None, the error types passed to the sink
+        @type err_types: list[string]
+        """
+        if err_types is not None:
+            sink = error_sink.TypeFilter(sink, err_types)
+        self.sinks.append(sink)
+
+    def _emit(self, err_type, err_cde, err_str, err_val, line, err_ele=None):
+        """
+        Pass an error event to the sinks
+        """
+        event = error_sink.error_event(
+            err_type, err_cde, err_str, err_val, line,
+            self._get_open_id(self.cur_isa_node, 'isa_trn_set_id'),
+            self._get_open_id(self.cur_gs_node, 'gs_control_num'),
+            self._get_open_id(self.cur_st_node, 'trn_set_control_num'))
+        seg_node = self.cur_seg_node
+        if err_type in ('seg', 'ele') and isinstance(seg_node, err_seg):
+            event['seg_id'] = seg_node.seg_id
+            event['seg_count'] = seg_node.seg_count
+            event['ls_id'] = seg_node.ls_id
+        if err_ele is not None:
+            event['ele_pos'] = err_ele.ele_pos
+            event['subele_pos'] = err_ele.subele_pos
+            event['refdes'] = err_ele.ele_ref_num
+        for sink in self.sinks:
+            sink(event)
+
+    def add_group_callback(self, callback):
+        """
+        Call a function with each closed GS loop, once no more errors can
+        be added to it, then drop the loop from the tree.  This is at the
+        first ST loop of a later group.
+
+        @param callback: Called with the L{err_gs}
+        @type callback: callable
+        """
+        self.group_callbacks.append(callback)
+
+    def _release_closed_groups(self):
+        """
+        Pass the leading closed GS loops to the group callbacks, in file
+        order, and drop them.  Stops at the first group still open.
+        """
+        while self.done_isa_pos < len(self.children):
+            isa_node = self.children[self.done_isa_pos]
+            while isa_node.children and isa_node.children[0] is not self.cur_gs_node \
+                    and isa_node.children[0].is_closed():
+                gs_node = isa_node.children[0]
+                for callback in self.group_callbacks:
+                    callback(gs_node)
+                isa_node.drop_gs(gs_node)
+            if isa_node.children or isa_node is self.cur_isa_node:
+                break
+            self.done_isa_pos += 1
+
+    @staticmethod
+    def _get_open_id(node, attr):
+        if node is None or node.is_closed():
+            return None
+        return getattr(node, attr)
+
     def handle_errors(self, err_list):
         """
         @param err_list: list of errors to apply
@@ -135,6 +218,7 @@ class err_handler(object):
         @type seg_data: L{segment<segment.Segment>}
         """
         #logger.debug('add_isa loop')
+        self._drop_closed_st()
         self.children.append(err_isa(self, seg_data, src))
         self.cur_isa_node = self.children[-1]
         self.cur_seg_node = self.cur_isa_node
@@ -146,6 +230,7 @@ class err_handler(object):
         @type seg_data: L{segment<segment.Segment>}
         """
         #logger.debug('add_gs loop')
+        self._drop_closed_st()
         parent = self.cur_isa_node
         parent.children.append(err_gs(parent, seg_data, src))
         self.cur_gs_node = parent.children[-1]
@@ -158,11 +243,14 @@ class err_handler(object):
         @type seg_data: L{segment<segment.Segment>}
         """
         #logger.debug('add_st loop')
+        self._drop_closed_st()
         parent = self.cur_gs_node
         parent.children.append(err_st(parent, seg_data, src))
         self.cur_st_node = parent.children[-1]
         self.cur_seg_node = self.cur_st_node
         self.seg_node_added = True
+        if self.group_callbacks:
+            self._release_closed_groups()
 
     def add_seg(self, map_node, seg_data, seg_count, cur_line, ls_id):
         """
@@ -230,6 +318,8 @@ class err_handler(object):
         sout += 'ISA:%s - %s' % (err_cde, err_str)
         logger.error(sout)
         self.cur_isa_node.add_error(err_cde, err_str)
+        if self.sinks:
+            self._emit('isa', err_cde, err_str, None, self.cur_isa_node.get_cur_line())
 
     def gs_error(self, err_cde, err_str):
         """
@@ -243,6 +333,8 @@ class err_handler(object):
         sout += 'GS:%s - %s' % (err_cde, err_str)
         logger.error(sout)
         self.cur_gs_node.add_error(err_cde, err_str)
+        if self.sinks:
+            self._emit('gs', err_cde, err_str, None, self.cur_gs_node.get_cur_line())
 
     def st_error(self, err_cde, err_str):
         """
@@ -256,6 +348,8 @@ class err_handler(object):
         sout += 'ST:%s - %s' % (err_cde, err_str)
         logger.error(sout)
         self.cur_st_node.add_error(err_cde, err_str)
+        if self.sinks:
+            self._emit('st', err_cde, err_str, None, self.cur_st_node.get_cur_line())
 
     def seg_error(self, err_cde, err_str, err_value=None, src_line=None):
         """
@@ -270,15 +364,20 @@ class err_handler(object):
             self.cur_seg_node.add_error(err_cde, err_str, err_value)
         except:
             sout += 'No current segment in error_handler. '
+        line = None
         if src_line:
-            sout += 'Line:%i ' % (src_line)
+            line = src_line
         else:
             if self.cur_seg_node is not None:
-                sout += 'Line:%i ' % (self.cur_seg_node.get_cur_line())
+                line = self.cur_seg_node.get_cur_line()
+        if line is not None:
+            sout += 'Line:%i ' % (line)
         sout += 'SEG:%s - %s' % (err_cde, err_str)
         if err_value:
             sout += ' (%s)' % err_value
         logger.error(sout)
+        if self.sinks:
+            self._emit('seg', err_cde, err_str, err_value, line)
 
     def ele_error(self, err_cde, err_str, bad_value, refdes=None):
         """
@@ -296,11 +395,15 @@ class err_handler(object):
         if bad_value:
             sout += ' (%s)' % (bad_value)
         logger.error(sout)
+        if self.sinks:
+            self._emit('ele', err_cde, err_str, bad_value,
+                       self.cur_seg_node.get_cur_line(), self.cur_ele_node)
         #print self.cur_ele_node.errors
 
     def close_isa_loop(self, node, seg, src):
         """
         """
+        self._drop_closed_st()
         self.cur_isa_node.close(node, seg, src)
         self.cur_seg_node = self.cur_isa_node
         self.seg_node_added = True
@@ -308,6 +411,7 @@ class err_handler(object):
     def close_gs_loop(self, node, seg, src):
         """
         """
+        self._drop_closed_st()
         self.cur_gs_node.close(node, seg, src)
         self.cur_seg_node = self.cur_gs_node
         self.seg_node_added = True
@@ -318,6 +422,16 @@ class err_handler(object):
         self.cur_st_node.close(node, seg, src)
         self.cur_seg_node = self.cur_st_node
         self.seg_node_added = True
+        if not self.keep_tree:
+            self.closed_st_node = self.cur_st_node
+
+    def _drop_closed_st(self):
+        """
+        Drop the last closed ST loop, once no more errors can be added to it
+        """
+        if self.closed_st_node is not None:
+            self.closed_st_node.parent.drop_st(self.closed_st_node)
+            self.closed_st_node = None
 
     def find_node(self, type):
         """
@@ -494,6 +608,9 @@ class err_isa(err_node):
         self.orig_time = seg_data.get_value('ISA10')
         self.id = 'ISA'
 
+        # Count of the errors of the dropped GS loops
+        self.dropped_err_count = 0
+
         self.parent = parent
         self.children = []
         self.errors = []
@@ -529,6 +646,16 @@ class err_isa(err_node):
     def close(self, node, seg, src):
         self.cur_line_iea = src.get_cur_line()
 
+    def drop_gs(self, err_gs):
+        """
+        Remove a closed GS loop, keeping its error count
+
+        @param err_gs: GS Loop error handler
+        @type err_gs: L{error_handler.err_gs}
+        """
+        self.children.remove(err_gs)
+        self.dropped_err_count += err_gs.get_error_count()
+
     def get_cur_line(self):
         """
         @return: Current file line number
@@ -542,7 +669,7 @@ class err_isa(err_node):
     def get_error_count(self):
         """
         """
-        count = 0
+        count = self.dropped_err_count
         for ele in self.elements:
             count += ele.get_error_count()
         for child in self.children:
@@ -606,6 +733,10 @@ class err_gs(err_node):
         self.st_count_recv = 0  # AK903
         #self.st_count_accept = None # AK904
 
+        # Counts of the dropped ST loops
+        self.dropped_err_count = 0
+        self.dropped_failed_st = 0
+
         self.parent = parent
         self.children = []
         self.errors = []
@@ -644,7 +775,21 @@ class err_gs(err_node):
         self.st_count_recv = src.st_count  # AK903
         #self.st_count_accept = self.st_count_recv - len(self.children) # AK904
 
+    def drop_st(self, err_st):
+        """
+        Remove a closed ST loop, keeping its counts
+
+        @param err_st: ST Loop error handler
+        @type err_st: L{error_handler.err_st}
+        """
+        self.children.remove(err_st)
+        self.dropped_err_count += err_st.get_error_count()
+        if err_st.ack_code not in ['A', 'E']:
+            self.dropped_failed_st += 1
+
     def _get_ack_code(self):
+        if self.dropped_err_count > 0:
+            return 'R'
         for child in self.children:
             if child.get_error_count() > 0:
                 return 'R'
@@ -660,7 +805,7 @@ class err_gs(err_node):
         return 'A'
 
     def count_failed_st(self):
-        ct = 0
+        ct = self.dropped_failed_st
         for child in self.children:
             if child.ack_code not in ['A', 'E']:
                 ct += 1
@@ -679,7 +824,7 @@ class err_gs(err_node):
     def get_error_count(self):
         """
         """
-        count = 0
+        count = self.dropped_err_count
         for ele in self.elements:
             count += ele.get_error_count()
         for child in self.children:
@@ -0,0 +1,110 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Receivers of validation error events.
+
+An error event is a dict, passed to each registered sink as soon as the
+error is raised.  Its keys are:
+    - err_type: isa, gs, st, seg or ele
+    - err_cde: The error code
+    - err_str: Description of the error
+    - err_val: The bad value, or None
+    - line: Source file line (segment) number, or None
+    - isa_id, gs_id, st_id: Control numbers of the open envelopes
+    - seg_id, seg_count, ls_id: The segment, for seg and ele errors
+    - ele_pos, subele_pos, refdes: The element, for ele errors
+
+A sink is any callable taking one event.
+"""
+
+import json
+
+ERR_TYPES = ('isa', 'gs', 'st', 'seg', 'ele')
+
+
+def error_event(err_type, err_cde, err_str, err_val=None, line=None,
+                isa_id=None, gs_id=None, st_id=None):
+    """
+    @param err_type: isa, gs, st, seg or ele
+    @type err_type: string
+    @param err_cde: Error code
+    @type err_cde: string
+    @param err_str: Description of the error
+    @type err_str: string
+    @return: An error event with the segment and element keys empty
+    @rtype: dict
+    """
+    return {'err_type': err_type, 'err_cde': err_cde, 'err_str': err_str,
+            'err_val': err_val, 'line': line,
+            'isa_id': isa_id, 'gs_id': gs_id, 'st_id': st_id,
+            'seg_id': None, 'seg_count': None, 'ls_id': None,
+            'ele_pos': None, 'subele_pos': None, 'refdes': None}
+
+
+class TypeFilter(object):
+    """
+    Pass the events of some error types to another sink
+    """
+    def __init__(self, sink, err_types):
+        """
+        @param sink: Receiver of the matching events
+        @type sink: callable
+        @param err_types: Error types to pass on
+        @type err_types: list[string]
+        """
+        self.sink = sink
+        self.err_types = frozenset(err_types)
+
+    def __call__(self, event):
+        if event['err_type'] in self.err_types:
+            self.sink(event)
+
+
+class ErrorCounter(object):
+    """
+    Count the error events by error type and code
+    """
+    def __init__(self):
+        self.total = 0
+        self.counts = {}  # (err_type, err_cde) -> count
+
+    def __call__(self, event):
+        key = (event['err_type'], event['err_cde'])
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+
+    def get_count(self, err_type=None, err_cde=None):
+        """
+        @param err_type: If not None, count only this error type
+        @type err_type: string
+        @param err_cde: If not None, count only this error code
+        @type err_cde: string
+        @rtype: int
+        """
+        return sum([ct for ((etype, ecde), ct) in self.counts.items()
+                    if err_type in (None, etype) and err_cde in (None, ecde)])
+
+
+class JsonLinesWriter(object):
+    """
+    Write each error event as one line of JSON.  Bad values which are not
+    ASCII are read as Latin-1.
+    """
+    def __init__(self, fd):
+        """
+        @param fd: target file
+        @type fd: file descriptor
+        """
+        self.fd = fd
+
+    def __call__(self, event):
+        self.fd.write(json.dumps(event, sort_keys=True, encoding='latin-1'))
+        self.fd.write('\n')
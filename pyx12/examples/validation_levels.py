@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+"""
+Time the validation of the bundled test files at each validation level
+"""
+import sys
+import time
+import logging
+import argparse
+from StringIO import StringIO
+
+import pyx12.params
+import pyx12.x12n_document
+from pyx12.test.x12testdata import datafiles
+
+
+def get_sources():
+    """
+    @return: The bundled test files which validate without an exception
+    @rtype: list[string]
+    """
+    sources = []
+    for (name, datafile) in sorted(datafiles.items()):
+        try:
+            pyx12.x12n_document.x12n_document(pyx12.params.params(), StringIO(datafile['source']),
+                                              None, None, None)
+        except Exception:
+            continue
+        sources.append(datafile['source'])
+    return sources
+
+
+def time_level(sources, level, repeat):
+    """
+    @return: The best time, in seconds, to validate all sources at the level
+    @rtype: float
+    """
+    best = None
+    for i in range(repeat):
+        param = pyx12.params.params()
+        param.set('validation_level', level)
+        start = time.time()
+        for source in sources:
+            pyx12.x12n_document.x12n_document(param, StringIO(source), StringIO(), None, None)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validation level benchmark')
+    parser.add_argument('--repeat', '-r', action='store', type=int, default=5,
+                        help='Runs of each level, the best is shown')
+    parser.add_argument('--copies', '-n', action='store', type=int, default=10,
+                        help='Copies of the test files in each run')
+    args = parser.parse_args()
+    logging.getLogger('pyx12').addHandler(logging.NullHandler())
+    sources = get_sources() * args.copies
+    sys.stdout.write('%i source files\n' % (len(sources)))
+    times = {}
+    for level in pyx12.params.VALIDATION_LEVELS:
+        time_level(sources[:1], level, 1)  # load the maps
+        times[level] = time_level(sources, level, args.repeat)
+    for level in pyx12.params.VALIDATION_LEVELS:
+        sys.stdout.write('%-10s %8.3fs %6.2fx\n' % (level, times[level], times['full'] / times[level]))
+    return True
+
+if __name__ == '__main__':
+    sys.exit(not main())
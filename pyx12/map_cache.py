@@ -0,0 +1,122 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Persistent cache of compiled map objects.
+
+Compiled objects are pickled to a cache directory.  The cache key is a
+hash of the pyx12 version, the contents of the source files the object
+was built from, and any parameters which change the result.  A changed
+source file gives a new key, so a stale entry is never used.
+"""
+
+import os
+import os.path
+import hashlib
+import logging
+import tempfile
+from pkg_resources import resource_string
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Intrapackage imports
+from pyx12.version import __version__
+
+PICKLE_PROTOCOL = 2
+# Increment when the layout of the cached objects changes
+CACHE_FORMAT = 10
+
+logger = logging.getLogger('pyx12.map_cache')
+
+
+def read_map_source(file_name, map_path=None):
+    """
+    Get the contents of a file in the map directory
+
+    @param file_name: map, codes, or data element file name
+    @type file_name: string
+    @param map_path: Override directory containing map xml files.  If None,
+        uses package resource folder
+    @type map_path: string
+    @rtype: string
+    """
+    if map_path is not None:
+        with open(os.path.join(map_path, file_name), 'rb') as fd:
+            return fd.read()
+    return resource_string(__name__, os.path.join('map', file_name))
+
+
+class MapCache(object):
+    """
+    Directory of pickled map objects
+    """
+    def __init__(self, cache_path):
+        """
+        @param cache_path: Directory holding the cached objects.  Created
+            when the first object is saved
+        @type cache_path: string
+        """
+        self.cache_path = cache_path
+
+    def get_key(self, name, sources, params=()):
+        """
+        @param name: Name of the cached object, usually the map file name
+        @type name: string
+        @param sources: Contents of each file the object is built from
+        @type sources: list[string]
+        @param params: Parameter values which change the built object
+        @type params: tuple
+        @return: Cache key
+        @rtype: string
+        """
+        digest = hashlib.sha1()
+        digest.update(__version__)
+        digest.update(str(CACHE_FORMAT))
+        digest.update(repr(tuple(params)))
+        for source in sources:
+            digest.update(hashlib.sha1(source).hexdigest())
+        return '%s.%s' % (os.path.basename(name), digest.hexdigest())
+
+    def _get_filename(self, key):
+        return os.path.join(self.cache_path, key + '.pickle')
+
+    def load(self, key):
+        """
+        @return: The cached object, or None if not found or unreadable
+        """
+        filename = self._get_filename(key)
+        try:
+            with open(filename, 'rb') as fd:
+                return pickle.load(fd)
+        except IOError:
+            return None
+        except Exception:
+            logger.warning('Cached map file "%s" is unreadable' % (filename))
+            return None
+
+    def save(self, key, obj):
+        """
+        Write the object to the cache.  Failures are logged, not raised.
+        """
+        filename = self._get_filename(key)
+        tmp_filename = None
+        try:
+            if not os.path.isdir(self.cache_path):
+                os.makedirs(self.cache_path)
+            (fd, tmp_filename) = tempfile.mkstemp(dir=self.cache_path)
+            with os.fdopen(fd, 'wb') as fd_tmp:
+                pickle.dump(obj, fd_tmp, PICKLE_PROTOCOL)
+            os.rename(tmp_filename, filename)
+        except Exception:
+            logger.warning('Could not save cached map file "%s"' % (filename))
+            if tmp_filename is not None and os.path.isfile(tmp_filename):
+                os.remove(tmp_filename)
@@ -15,16 +15,18 @@ import os.path
 import string
 import sys
 import re
+from bisect import bisect_left
 import xml.etree.cElementTree as et
-from pkg_resources import resource_stream
 
 # Intrapackage imports
 from errors import EngineError
 import codes
 import dataele
+import map_cache
+import nodeCounter
 import path
 import validation
-from syntax import is_syntax_valid
+from syntax import is_syntax_valid, compile_syntax, check_syntax
 
 MAXINT = 2147483647
 
@@ -38,9 +40,17 @@ class x12_node(object):
         self.name = None
         self.parent = None
         self.children = []
+        self.child_nodes = ()
+        self.child_pos = ()
+        self.seg_id_index = {}
+        self.missing_child_idx = ()
+        self.first_seg_ids = frozenset()
+        self.reports_missing = False
         self.path = ''
         self._x12path = None
         self._fullpath = None
+        self._counter_id = None
+        self.walk_plans = {}
 
     def __eq__(self, other):
         if isinstance(other, x12_node):
@@ -130,6 +140,72 @@ class x12_node(object):
 
     x12path = property(_get_x12_path, None, None)
 
+    def _get_counter_id(self):
+        """
+        @return: Process-wide id of the node path, used by the walker's
+            NodeCounter
+        @rtype: int
+        """
+        if self._counter_id is None:
+            self._counter_id = nodeCounter.get_path_id(self.x12path)
+        return self._counter_id
+
+    counter_id = property(_get_counter_id, None, None)
+
+    def __getstate__(self):
+        # Path ids are only valid in this process.  Walk plans are compiled
+        # again when needed.
+        state = self.__dict__.copy()
+        state['_counter_id'] = None
+        state['walk_plans'] = {}
+        return state
+
+    def _index_children(self):
+        """
+        Build the ordered child tuple and its parallel ordinal tuple from
+        pos_map.  Map trees do not change after load.
+
+        Also index the children by the segment IDs which can match them,
+        and list the children which can report a missing mandatory segment
+        or loop when they are skipped.
+        """
+        child_nodes = []
+        child_pos = []
+        for ord1 in sorted(self.pos_map):
+            for child in self.pos_map[ord1]:
+                child_nodes.append(child)
+                child_pos.append(ord1)
+        self.child_nodes = tuple(child_nodes)
+        self.child_pos = tuple(child_pos)
+        seg_id_index = {}
+        missing_child_idx = []
+        for (idx, child) in enumerate(self.child_nodes):
+            for seg_id in child.first_seg_ids:
+                seg_id_index.setdefault(seg_id, []).append(idx)
+            if child.reports_missing:
+                missing_child_idx.append(idx)
+        self.seg_id_index = dict([(k, tuple(v)) for (k, v) in seg_id_index.items()])
+        self.missing_child_idx = tuple(missing_child_idx)
+
+    def get_candidate_idx(self, seg_id):
+        """
+        @param seg_id: data segment ID
+        @type seg_id: string
+        @return: Indexes into child_nodes of the children which might
+            match a segment with this ID
+        @rtype: tuple(int)
+        """
+        return self.seg_id_index.get(seg_id, ())
+
+    def get_child_nodes_from(self, pos):
+        """
+        @param pos: map ordinal
+        @type pos: int
+        @return: Child nodes with an ordinal >= pos, in map order
+        @rtype: tuple
+        """
+        return self.child_nodes[bisect_left(self.child_pos, pos):]
+
     def is_first_seg_in_loop(self):
         """
         @rtype: boolean
@@ -174,10 +250,14 @@ class map_if(x12_node):
     """
     Map file interface
     """
-    def __init__(self, eroot, param, base_path=None):
+    def __init__(self, eroot, param, base_path=None, ext_codes=None, data_elements=None):
         """
         @param eroot: ElementTree root
         @param param: map of parameters
+        @param ext_codes: Shared external codes.  If None, loads codes.xml
+        @type ext_codes: L{codes.ExternalCodes}
+        @param data_elements: Shared data elements.  If None, loads dataele.xml
+        @type data_elements: L{dataele.DataElements}
         """
         x12_node.__init__(self)
         self.children = None
@@ -187,9 +267,13 @@ class map_if(x12_node):
         #self.cur_iter_node = self
         self.param = param
         #global codes
-        self.ext_codes = codes.ExternalCodes(base_path,
-                                             param.get('exclude_external_codes'))
-        self.data_elements = dataele.DataElements(base_path)
+        if ext_codes is None:
+            ext_codes = codes.ExternalCodes(base_path,
+                                            param.get('exclude_external_codes'))
+        self.ext_codes = ext_codes
+        if data_elements is None:
+            data_elements = dataele.DataElements(base_path)
+        self.data_elements = data_elements
 
         self.id = eroot.get('xid')
 
@@ -207,7 +291,12 @@ class map_if(x12_node):
                 self.pos_map[seg_node.pos].append(seg_node)
             except KeyError:
                 self.pos_map[seg_node.pos] = [seg_node]
+        self._index_children()
+        # Segment IDs defined by the map.  Walk plans are kept for these only
+        self.seg_ids = frozenset([node.id for node in self.loop_segment_iterator()
+                                  if node.is_segment()])
         self.icvn = self._get_icvn()
+        self.match_positions = {}
 
     def _get_icvn(self):
         """
@@ -225,9 +314,8 @@ class map_if(x12_node):
 
     def debug_print(self):
         sys.stdout.write(self.__repr__())
-        for ord1 in sorted(self.pos_map):
-            for node in self.pos_map[ord1]:
-                node.debug_print()
+        for node in self.child_nodes:
+            node.debug_print()
 
     def __eq__(self, other):
         return self.id == other.id
@@ -235,19 +323,22 @@ class map_if(x12_node):
     def __hash__(self):
         return (self.id).__hash__()
 
+    def __getstate__(self):
+        # The run-time parameters are not part of a cached map
+        state = x12_node.__getstate__(self)
+        state['param'] = None
+        state['match_positions'] = {}
+        return state
+
     def __len__(self):
-        i = 0
-        for ord1 in sorted(self.pos_map):
-            i += len(self.pos_map[ord1])
-        return i
+        return len(self.child_nodes)
 
     def get_child_count(self):
         return self.__len__()
 
     def get_first_node(self):
-        pos_keys = sorted(self.pos_map)
-        if len(pos_keys) > 0:
-            return self.pos_map[pos_keys[0]][0]
+        if self.child_nodes:
+            return self.child_nodes[0]
         else:
             return None
 
@@ -258,6 +349,28 @@ class map_if(x12_node):
         else:
             return None
 
+    def get_match_positions(self, seg_id):
+        """
+        Get the element positions used to tell apart the segments of the
+        map with this segment ID
+
+        @param seg_id: data segment ID
+        @type seg_id: string
+        @return: Sorted (ele_idx, subele_idx) tuples
+        @rtype: tuple
+        """
+        positions = self.match_positions.get(seg_id)
+        if positions is None:
+            pos_set = set()
+            for node in self.loop_segment_iterator():
+                if node.is_segment() and node.id == seg_id:
+                    if node._match_keys is None:
+                        node._compile_match_keys()
+                    pos_set.update([(ele_idx, subele_idx) for (ele_idx, subele_idx, codes) in node._match_keys])
+            positions = tuple(sorted(pos_set))
+            self.match_positions[seg_id] = positions
+        return positions
+
     def __repr__(self):
         """
         @rtype: string
@@ -291,13 +404,12 @@ class map_if(x12_node):
         if len(pathl) == 0:
             return None
         #logger.debug('%s %s %s' % (self.base_name, self.id, pathl[1]))
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.id.lower() == pathl[0].lower():
-                    if len(pathl) == 1:
-                        return child
-                    else:
-                        return child.getnodebypath(string.join(pathl[1:], '/'))
+        for child in self.child_nodes:
+            if child.id.lower() == pathl[0].lower():
+                if len(pathl) == 1:
+                    return child
+                else:
+                    return child.getnodebypath(string.join(pathl[1:], '/'))
         raise EngineError('getnodebypath failed. Path "%s" not found' % spath)
 
     def getnodebypath2(self, path_str):
@@ -308,14 +420,13 @@ class map_if(x12_node):
         x12path = path.X12Path(path_str)
         if x12path.empty():
             return None
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.id.upper() == x12path.loop_list[0]:
-                    if len(x12path.loop_list) > 1:
-                        return child
-                    else:
-                        del x12path.loop_list[0]
-                        return child.getnodebypath(x12path.format())
+        for child in self.child_nodes:
+            if child.id.upper() == x12path.loop_list[0]:
+                if len(x12path.loop_list) > 1:
+                    return child
+                else:
+                    del x12path.loop_list[0]
+                    return child.getnodebypath(x12path.format())
         raise EngineError(
             'getnodebypath failed. Path "%s" not found' % path_str)
 
@@ -330,9 +441,8 @@ class map_if(x12_node):
         Set cur_count of child nodes to zero
         """
         raise DeprecationWarning('Moved to nodeCounter')
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                child.reset_cur_count()
+        for child in self.child_nodes:
+            child.reset_cur_count()
 
     def reset_cur_count(self):
         """
@@ -346,11 +456,10 @@ class map_if(x12_node):
 
     def loop_segment_iterator(self):
         yield self
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop() or child.is_segment():
-                    for c in child.loop_segment_iterator():
-                        yield c
+        for child in self.child_nodes:
+            if child.is_loop() or child.is_segment():
+                for c in child.loop_segment_iterator():
+                    yield c
 
 
 ############################################################
@@ -401,6 +510,8 @@ class loop_if(x12_node):
                 self.pos_map[seg_node.pos].append(seg_node)
             except KeyError:
                 self.pos_map[seg_node.pos] = [seg_node]
+        self._index_children()
+        self._index_first_segs()
 
         # For the segments with duplicate ordinals, adjust the path to be unique
         for ord1 in sorted(self.pos_map):
@@ -412,15 +523,11 @@ class loop_if(x12_node):
 
     def debug_print(self):
         sys.stdout.write(self.__repr__())
-        for ord1 in sorted(self.pos_map):
-            for node in self.pos_map[ord1]:
-                node.debug_print()
+        for node in self.child_nodes:
+            node.debug_print()
 
     def __len__(self):
-        i = 0
-        for ord1 in sorted(self.pos_map):
-            i += len(self.pos_map[ord1])
-        return i
+        return len(self.child_nodes)
 
     def __repr__(self):
         """
@@ -450,10 +557,30 @@ class loop_if(x12_node):
     def get_parent(self):
         return self.parent
 
+    def _index_first_segs(self):
+        """
+        Find the segment IDs which can start this loop.  If the first child
+        is a loop, any child loop can start it.
+        """
+        first = self.get_first_node()
+        if first is None:
+            self.first_seg_ids = frozenset()
+            self.reports_missing = False
+        elif first.is_loop():
+            seg_ids = set()
+            self.reports_missing = False
+            for child in self.child_nodes:
+                if child.is_loop():
+                    seg_ids.update(child.first_seg_ids)
+                    self.reports_missing |= child.reports_missing
+            self.first_seg_ids = frozenset(seg_ids)
+        else:
+            self.first_seg_ids = frozenset([first.id])
+            self.reports_missing = self.usage == 'R'
+
     def get_first_node(self):
-        pos_keys = sorted(self.pos_map)
-        if len(pos_keys) > 0:
-            return self.pos_map[pos_keys[0]][0]
+        if self.child_nodes:
+            return self.child_nodes[0]
         else:
             return None
 
@@ -465,9 +592,8 @@ class loop_if(x12_node):
             return None
 
     def childIterator(self):
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                yield child
+        for child in self.child_nodes:
+            yield child
 
     def getnodebypath(self, spath):
         """
@@ -478,26 +604,25 @@ class loop_if(x12_node):
         pathl = spath.split('/')
         if len(pathl) == 0:
             return None
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop():
-                    if child.id.upper() == pathl[0].upper():
-                        if len(pathl) == 1:
-                            return child
-                        else:
-                            return child.getnodebypath(string.join(pathl[1:], '/'))
-                elif child.is_segment() and len(pathl) == 1:
-                    if pathl[0].find('[') == -1:  # No id to match
-                        if pathl[0] == child.id:
-                            return child
+        for child in self.child_nodes:
+            if child.is_loop():
+                if child.id.upper() == pathl[0].upper():
+                    if len(pathl) == 1:
+                        return child
                     else:
-                        seg_id = pathl[0][0:pathl[0].find('[')]
-                        id_val = pathl[0][pathl[0].find('[')
-                                          + 1:pathl[0].find(']')]
-                        if seg_id == child.id:
-                            possible = child.get_unique_key_id_element(id_val)
-                            if possible is not None:
-                                return child
+                        return child.getnodebypath(string.join(pathl[1:], '/'))
+            elif child.is_segment() and len(pathl) == 1:
+                if pathl[0].find('[') == -1:  # No id to match
+                    if pathl[0] == child.id:
+                        return child
+                else:
+                    seg_id = pathl[0][0:pathl[0].find('[')]
+                    id_val = pathl[0][pathl[0].find('[')
+                                      + 1:pathl[0].find(']')]
+                    if seg_id == child.id:
+                        possible = child.get_unique_key_id_element(id_val)
+                        if possible is not None:
+                            return child
         raise EngineError('getnodebypath failed. Path "%s" not found' % spath)
 
     def getnodebypath2(self, path_str):
@@ -511,25 +636,24 @@ class loop_if(x12_node):
         x12path = path.X12Path(path_str)
         if x12path.empty():
             return None
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop() and len(x12path.loop_list) > 0:
-                    if child.id.upper() == x12path.loop_list[0].upper():
-                        if len(x12path.loop_list) == 1 and x12path.seg_id is None:
-                            return child
-                        else:
-                            return child.getnodebypath(x12path.format())
-                elif child.is_segment() and len(x12path.loop_list) == 0 and x12path.seg_id is not None:
-                    if x12path.id_val is None:
-                        if x12path.seg_id == child.id:
-                            return child
+        for child in self.child_nodes:
+            if child.is_loop() and len(x12path.loop_list) > 0:
+                if child.id.upper() == x12path.loop_list[0].upper():
+                    if len(x12path.loop_list) == 1 and x12path.seg_id is None:
+                        return child
                     else:
-                        seg_id = x12path.seg_id
-                        id_val = x12path.id_val
-                        if seg_id == child.id:
-                            possible = child.get_unique_key_id_element(id_val)
-                            if possible is not None:
-                                return child
+                        return child.getnodebypath(x12path.format())
+            elif child.is_segment() and len(x12path.loop_list) == 0 and x12path.seg_id is not None:
+                if x12path.id_val is None:
+                    if x12path.seg_id == child.id:
+                        return child
+                else:
+                    seg_id = x12path.seg_id
+                    id_val = x12path.id_val
+                    if seg_id == child.id:
+                        possible = child.get_unique_key_id_element(id_val)
+                        if possible is not None:
+                            return child
         raise EngineError(
             'getnodebypath failed. Path "%s" not found' % path_str)
 
@@ -548,10 +672,9 @@ class loop_if(x12_node):
         @rtype: integer
         """
         i = 0
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_segment():
-                    i += 1
+        for child in self.child_nodes:
+            if child.is_segment():
+                i += 1
         return i
 
     def is_loop(self):
@@ -566,8 +689,7 @@ class loop_if(x12_node):
         @return: Is the segment a match to this loop?
         @rtype: boolean
         """
-        pos_keys = sorted(self.pos_map)
-        child = self.pos_map[pos_keys[0]][0]
+        child = self.child_nodes[0]
         if child.is_loop():
             return child.is_match(seg_data)
         elif child.is_segment():
@@ -613,9 +735,8 @@ class loop_if(x12_node):
         Set cur_count of child nodes to zero
         """
         raise DeprecationWarning('Moved to nodeCounter')
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                child.reset_cur_count()
+        for child in self.child_nodes:
+            child.reset_cur_count()
 
     def reset_cur_count(self):
         """
@@ -645,11 +766,10 @@ class loop_if(x12_node):
 
     def loop_segment_iterator(self):
         yield self
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop() or child.is_segment():
-                    for c in child.loop_segment_iterator():
-                        yield c
+        for child in self.child_nodes:
+            if child.is_loop() or child.is_segment():
+                for c in child.loop_segment_iterator():
+                    yield c
 
 
 class segment_if(x12_node):
@@ -687,11 +807,14 @@ class segment_if(x12_node):
 
         self.end_tag = elem.get('end_tag') if elem.get(
             'end_tag') else elem.findtext('end_tag')
+        self.first_seg_ids = frozenset([self.id])
+        self.reports_missing = self.usage == 'R'
 
         for s in elem.findall('syntax'):
             syn_list = self._split_syntax(s.text)
             if syn_list is not None:
                 self.syntax.append(syn_list)
+        self.syntax_rules = tuple([compile_syntax(syn) for syn in self.syntax])
 
         children_map = {}
         for e in elem.findall('element'):
@@ -711,6 +834,11 @@ class segment_if(x12_node):
             elif children_map[seq].tag == 'composite':
                 self.children.append(composite_if(
                     self.root, self, children_map[seq]))
+        try:
+            self._compile_match_keys()
+        except EngineError:
+            # Undefined data element.  Raise when the segment is first matched.
+            self._match_keys = None
 
     def debug_print(self):
         sys.stdout.write(self.__repr__())
@@ -773,6 +901,66 @@ class segment_if(x12_node):
         else:
             return False
 
+    def _compile_match_keys(self):
+        """
+        Find the ID elements used to tell apart segments with the same ID.
+        Done once, when the map is loaded.
+
+        self._match_keys - every (ele_idx, subele_idx, codes) the segment
+        data must match, for is_match
+        self._qual_key - the (ele_idx, subele_idx, codes) used by
+        is_match_qual, or None
+        self._unique_key_element - the node returned by
+        guess_unique_key_id_element, or None
+        """
+        children = self.children
+
+        def id_codes(node, data_type='ID'):
+            if node.get_data_type() == data_type and len(node.valid_codes) > 0:
+                return frozenset(node.valid_codes)
+            return None
+
+        first_ele = first_subele = ent_ele = hl_ele = ctx_subele = None
+        first_required = False
+        if len(children) > 0 and children[0].is_element():
+            first_ele = id_codes(children[0])
+            first_required = children[0].usage == 'R'
+        if len(children) > 0 and children[0].is_composite():
+            first_subele = id_codes(children[0].children[0])
+            if self.id == 'CTX':
+                # IG defines the dataelement 2100/CT01-1 as an AN, but acts like an ID
+                ctx_subele = id_codes(children[0].children[0], 'AN')
+        if self.id == 'ENT' and len(children) > 1 and children[1].is_element():
+            # Special Case for 820
+            ent_ele = id_codes(children[1])
+        if self.id == 'HL' and len(children) > 2 and children[2].is_element() \
+                and len(children[2].valid_codes) > 0:
+            hl_ele = frozenset(children[2].valid_codes)
+
+        keys = []
+        if first_ele is not None and first_required:
+            keys.append((0, None, first_ele))
+        if ent_ele is not None:
+            keys.append((1, None, ent_ele))
+        if first_subele is not None:
+            keys.append((0, 0, first_subele))
+        if hl_ele is not None:
+            keys.append((2, None, hl_ele))
+        self._qual_key = keys[0] if keys else None
+        if ctx_subele is not None:
+            keys.append((0, 0, ctx_subele))
+        self._match_keys = tuple(keys)
+
+        self._unique_key_element = None
+        if first_ele is not None:
+            self._unique_key_element = children[0]
+        elif ent_ele is not None:
+            self._unique_key_element = children[1]
+        elif first_subele is not None:
+            self._unique_key_element = children[0].children[0]
+        elif hl_ele is not None:
+            self._unique_key_element = children[2]
+
     def is_match(self, seg):
         """
         Is data segment given a match to this segment node?
@@ -780,43 +968,14 @@ class segment_if(x12_node):
         @return: boolean
         @rtype: boolean
         """
-        if seg.get_seg_id() == self.id:
-            if self.children[0].is_element() \
-                    and self.children[0].get_data_type() == 'ID' \
-                    and self.children[0].usage == 'R' \
-                    and len(self.children[0].valid_codes) > 0 \
-                    and seg.get_value('01') not in self.children[0].valid_codes:
-                #logger.debug('is_match: %s %s' % (seg.get_seg_id(), seg[1]), self.children[0].valid_codes)
-                return False
-            # Special Case for 820
-            elif seg.get_seg_id() == 'ENT' \
-                    and self.children[1].is_element() \
-                    and self.children[1].get_data_type() == 'ID' \
-                    and len(self.children[1].valid_codes) > 0 \
-                    and seg.get_value('02') not in self.children[1].valid_codes:
-                #logger.debug('is_match: %s %s' % (seg.get_seg_id(), seg[1]), self.children[0].valid_codes)
-                return False
-            # Special Case for 999 CTX
-            # IG defines the dataelement 2100/CT01-1 as an AN, but acts like an ID
-            elif seg.get_seg_id() == 'CTX' \
-                    and self.children[0].is_composite() \
-                    and self.children[0].children[0].get_data_type() == 'AN' \
-                    and len(self.children[0].children[0].valid_codes) > 0 \
-                    and seg.get_value('01-1') not in self.children[0].children[0].valid_codes:
-                return False
-            elif self.children[0].is_composite() \
-                    and self.children[0].children[0].get_data_type() == 'ID' \
-                    and len(self.children[0].children[0].valid_codes) > 0 \
-                    and seg.get_value('01-1') not in self.children[0].children[0].valid_codes:
-                return False
-            elif seg.get_seg_id() == 'HL' and self.children[2].is_element() \
-                    and len(self.children[2].valid_codes) > 0 \
-                    and seg.get_value('03') not in self.children[2].valid_codes:
-                return False
-            else:
-                return True
-        else:
+        if seg.get_seg_id() != self.id:
             return False
+        if self._match_keys is None:
+            self._compile_match_keys()
+        for (ele_idx, subele_idx, codes) in self._match_keys:
+            if seg.get_value_at(ele_idx, subele_idx) not in codes:
+                return False
+        return True
 
     def is_match_qual(self, seg_data, seg_id, qual_code):
         """
@@ -828,59 +987,23 @@ class segment_if(x12_node):
         @return: True if a match
         @rtype: boolean
         """
-        if seg_id == self.id:
-            if qual_code is None:
-                return True
-            elif self.children[0].is_element() \
-                    and self.children[0].get_data_type() == 'ID' \
-                    and self.children[0].usage == 'R' \
-                    and len(self.children[0].valid_codes) > 0:
-                if qual_code in self.children[0].valid_codes and seg_data.get_value('01') == qual_code:
-                    return True
-                else:
-                    return False
-            # Special Case for 820
-            elif seg_id == 'ENT' \
-                    and self.children[1].is_element() \
-                    and self.children[1].get_data_type() == 'ID' \
-                    and len(self.children[1].valid_codes) > 0:
-                if qual_code in self.children[1].valid_codes and seg_data.get_value('02') == qual_code:
-                    return True
-                else:
-                    return False
-            elif self.children[0].is_composite() \
-                    and self.children[0].children[0].get_data_type() == 'ID' \
-                    and len(self.children[0].children[0].valid_codes) > 0:
-                if qual_code in self.children[0].children[0].valid_codes and seg_data.get_value('01-1') == qual_code:
-                    return True
-                else:
-                    return False
-            elif seg_id == 'HL' and self.children[2].is_element() \
-                    and len(self.children[2].valid_codes) > 0:
-                if qual_code in self.children[2].valid_codes and seg_data.get_value('03') == qual_code:
-                    return True
-                else:
-                    return False
-            else:
-                return True
-        else:
+        if seg_id != self.id:
             return False
+        if self._match_keys is None:
+            self._compile_match_keys()
+        if qual_code is None or self._qual_key is None:
+            return True
+        (ele_idx, subele_idx, codes) = self._qual_key
+        return qual_code in codes and seg_data.get_value_at(ele_idx, subele_idx) == qual_code
 
     def guess_unique_key_id_element(self):
         """
         Some segments, like REF, DTP, and DTP are duplicated.  They are matched using the value of an ID element.
         Which element to use varies.  This function tries to find a good candidate.
         """
-        if self.children[0].is_element() and self.children[0].get_data_type() == 'ID' and len(self.children[0].valid_codes) > 0:
-            return self.children[0]
-        # Special Case for 820
-        elif self.id == 'ENT' and self.children[1].is_element() and self.children[1].get_data_type() == 'ID' and len(self.children[1].valid_codes) > 0:
-            return self.children[1]
-        elif self.children[0].is_composite() and self.children[0].children[0].get_data_type() == 'ID' and len(self.children[0].children[0].valid_codes) > 0:
-            return self.children[0].children[0]
-        elif self.id == 'HL' and self.children[2].is_element() and len(self.children[2].valid_codes) > 0:
-            return self.children[2]
-        return None
+        if self._match_keys is None:
+            self._compile_match_keys()
+        return self._unique_key_element
 
     def get_unique_key_id_element(self, id_val):
         """
@@ -908,11 +1031,14 @@ class segment_if(x12_node):
         """
         return True
 
-    def is_valid(self, seg_data, errh):
+    def is_valid(self, seg_data, errh, check_relations=True):
         """
         @param seg_data: data segment instance
         @type seg_data: L{segment<segment.Segment>}
         @param errh: instance of error_handler
+        @param check_relations: If False, skip the syntax rules and the
+            date formats given by other elements
+        @type check_relations: boolean
         @rtype: boolean
         """
         valid = True
@@ -923,7 +1049,7 @@ class segment_if(x12_node):
                 (self.name, seg_data.get_seg_id(), len(seg_data), child_count)
             #self.logger.error(err_str)
             ref_des = '%02i' % (child_count + 1)
-            err_value = seg_data.get_value(ref_des)
+            err_value = seg_data.get_value_at(child_count)
             errh.ele_error('3', err_str, err_value, ref_des)
             valid = False
 
@@ -935,25 +1061,26 @@ class segment_if(x12_node):
             child_node = self.get_child_node_by_idx(i)
             if child_node.is_composite():
                 # Validate composite
-                ref_des = '%02i' % (i + 1)
-                comp_data = seg_data.get(ref_des)
+                comp_data = seg_data.get_at(i)
                 subele_count = child_node.get_child_count()
-                if seg_data.ele_len(ref_des) > subele_count and child_node.usage != 'N':
+                if len(comp_data) > subele_count and child_node.usage != 'N':
                     subele_node = child_node.get_child_node_by_idx(
                         subele_count + 1)
                     err_str = 'Too many sub-elements in composite "%s" (%s)' % \
                         (subele_node.name, subele_node.refdes)
-                    err_value = seg_data.get_value(ref_des)
-                    errh.ele_error('3', err_str, err_value, ref_des)
+                    err_value = seg_data.get_value_at(i)
+                    errh.ele_error('3', err_str, err_value, '%02i' % (i + 1))
                 valid &= child_node.is_valid(comp_data, errh)
+            elif not check_relations:
+                valid &= child_node.is_valid(seg_data.get_at(i), errh)
             elif child_node.is_element():
                 # Validate Element
                 if i == 1 and seg_data.get_seg_id() == 'DTP' \
-                        and seg_data.get_value('02') in ('RD8', 'D8', 'D6', 'DT', 'TM'):
-                    dtype = [seg_data.get_value('02')]
+                        and seg_data.get_value_at(1) in ('RD8', 'D8', 'D6', 'DT', 'TM'):
+                    dtype = [seg_data.get_value_at(1)]
                 if child_node.data_ele == '1250':
                     type_list.extend(child_node.valid_codes)
-                ele_data = seg_data.get('%02i' % (i + 1))
+                ele_data = seg_data.get_at(i)
                 if i == 2 and seg_data.get_seg_id() == 'DTP':
                     valid &= child_node.is_valid(ele_data, errh, dtype)
                 elif child_node.data_ele == '1251' and len(type_list) > 0:
@@ -966,15 +1093,18 @@ class segment_if(x12_node):
             child_node = self.get_child_node_by_idx(i)
             valid &= child_node.is_valid(None, errh)
 
-        for syn in self.syntax:
-            (bResult, err_str) = is_syntax_valid(seg_data, syn)
-            if not bResult:
-                syn_type = syn[0]
-                if syn_type == 'E':
-                    errh.ele_error('10', err_str, None, syn[1])
-                else:
-                    errh.ele_error('2', err_str, None, syn[1])
-                valid &= False
+        if self.syntax_rules and check_relations:
+            presence = seg_data.get_element_presence()
+            seg_id = seg_data.get_seg_id()
+            for rule in self.syntax_rules:
+                err_str = check_syntax(rule, presence, seg_id)
+                if err_str is not None:
+                    syn = rule[2]
+                    if syn[0] == 'E':
+                        errh.ele_error('10', err_str, None, syn[1])
+                    else:
+                        errh.ele_error('2', err_str, None, syn[1])
+                    valid = False
 
         return valid
 
@@ -1051,6 +1181,7 @@ class element_if(x12_node):
         self.valid_codes = []
         self.external_codes = None
         self.rec = None
+        self._validator = None
 
         self.id = elem.get('xid')
         self.refdes = self.id
@@ -1178,71 +1309,9 @@ class element_if(x12_node):
             return False
 
         elem_val = elem.get_value()
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        data_type = data_ele['data_type']
-        min_len = data_ele['min_len']
-        max_len = data_ele['max_len']
-        valid = True
-# Validate based on data_elem_num
-# Then, validate on more specific criteria
-        if (not data_type is None) and (data_type == 'R' or data_type[0] == 'N'):
-            elem_strip = string.replace(
-                string.replace(elem_val, '-', ''), '.', '')
-            elem_len = len(elem_strip)
-            if len(elem_strip) < min_len:
-                err_str = 'Data element "%s" (%s) is too short: len("%s") = %i < %i (min_len)' % \
-                    (self.name, self.refdes, elem_val, elem_len, min_len)
-                self._error(errh, err_str, '4', elem_val)
-                valid = False
-            if len(elem_strip) > max_len:
-                err_str = 'Data element "%s" (%s) is too long: len("%s") = %i > %i (max_len)' % \
-                    (self.name, self.refdes, elem_val, elem_len, max_len)
-                self._error(errh, err_str, '5', elem_val)
-                valid = False
-        else:
-            elem_len = len(elem_val)
-            if len(elem_val) < min_len:
-                err_str = 'Data element "%s" (%s) is too short: len("%s") = %i < %i (min_len)' % \
-                    (self.name, self.refdes, elem_val, elem_len, min_len)
-                self._error(errh, err_str, '4', elem_val)
-                valid = False
-            if len(elem_val) > max_len:
-                err_str = 'Data element "%s" (%s) is too long: len("%s") = %i > %i (max_len)' % \
-                    (self.name, self.refdes, elem_val, elem_len, max_len)
-                self._error(errh, err_str, '5', elem_val)
-                valid = False
-
-        (res, bad_string) = validation.contains_control_character(elem_val)
-        if res:
-            err_str = 'Data element "%s" (%s), contains an invalid control character(%s)' % \
-                (self.name, self.refdes, bad_string)
-            self._error(errh, err_str, '6', bad_string)
-            valid = False
-        if data_type in ['AN', 'ID'] and elem_val[-1] == ' ':
-            if len(elem_val.rstrip()) >= min_len:
-                err_str = 'Data element "%s" (%s) has unnecessary trailing spaces. (%s)' % \
-                    (self.name, self.refdes, elem_val)
-                self._error(errh, err_str, '6', elem_val)
-                valid = False
-
-        if not self._is_valid_code(elem_val, errh):
-            valid = False
-        if not validation.IsValidDataType(elem_val, data_type, self.root.param.get('charset'), self.root.icvn):
-            if data_type in ('RD8', 'DT', 'D8', 'D6'):
-                err_str = 'Data element "%s" (%s) contains an invalid date (%s)' % \
-                    (self.name, self.refdes, elem_val)
-                self._error(errh, err_str, '8', elem_val)
-                valid = False
-            elif data_type == 'TM':
-                err_str = 'Data element "%s" (%s) contains an invalid time (%s)' % \
-                    (self.name, self.refdes, elem_val)
-                self._error(errh, err_str, '9', elem_val)
-                valid = False
-            else:
-                err_str = 'Data element "%s" (%s) is type %s, contains an invalid character(%s)' % \
-                    (self.name, self.refdes, data_type, elem_val)
-                self._error(errh, err_str, '6', elem_val)
-                valid = False
+        if self._validator is None:
+            self._validator = self._compile_validator()
+        valid = self._validator(elem_val, errh)
         if len(type_list) > 0:
             valid_type = False
             for dtype in type_list:
@@ -1268,24 +1337,90 @@ class element_if(x12_node):
                 valid = False
         return valid
 
-    def _is_valid_code(self, elem_val, errh):
+    def _compile_validator(self):
         """
-        @rtype: boolean
+        Bind the data element length and type, the valid codes and the
+        character set into one check of a non-empty value.  Needs the
+        run-time parameters, so it is built on first use.
+
+        @return: function of (elem_val, errh), returning True if valid
+        @rtype: function
         """
-        bValidCode = False
-        if len(self.valid_codes) == 0 and self.external_codes is None:
-            bValidCode = True
-        if elem_val in self.valid_codes:
-            bValidCode = True
-        if self.external_codes is not None and \
-                self.root.ext_codes.isValid(self.external_codes, elem_val):
-            bValidCode = True
-        if not bValidCode:
-            err_str = '(%s) is not a valid code for %s (%s)' % (
-                elem_val, self.name, self.refdes)
-            self._error(errh, err_str, '7', elem_val)
-            return False
-        return True
+        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
+        data_type = data_ele['data_type']
+        min_len = data_ele['min_len']
+        max_len = data_ele['max_len']
+        is_number = data_type is not None and (data_type == 'R' or data_type[0] == 'N')
+        check_trailing = data_type in ('AN', 'ID')
+        charset = self.root.param.get('charset')
+        check_type = validation.get_data_type_check(data_type, charset, self.root.icvn)
+        # AN and ID values get the control character and type checks in one pass
+        char_set = validation.get_character_set(charset, self.root.icvn) if check_trailing else None
+        if data_type in ('RD8', 'DT', 'D8', 'D6'):
+            (type_err_cde, type_err_fmt) = ('8', 'contains an invalid date (%s)')
+        elif data_type == 'TM':
+            (type_err_cde, type_err_fmt) = ('9', 'contains an invalid time (%s)')
+        else:
+            (type_err_cde, type_err_fmt) = ('6', 'is type %s, contains an invalid character(%%s)' % (data_type))
+        err_prefix = 'Data element "%s" (%s)' % (self.name, self.refdes)
+        valid_codes = frozenset(self.valid_codes)
+        external_codes = self.external_codes
+        check_codes = len(valid_codes) > 0 or external_codes is not None
+        ext_codes = self.root.ext_codes
+        error = self._error
+        (name, refdes) = (self.name, self.refdes)
+
+        def validate(elem_val, errh):
+            valid = True
+            if is_number:
+                elem_len = len(elem_val.replace('-', '').replace('.', ''))
+            else:
+                elem_len = len(elem_val)
+            if elem_len < min_len:
+                err_str = '%s is too short: len("%s") = %i < %i (min_len)' % \
+                    (err_prefix, elem_val, elem_len, min_len)
+                error(errh, err_str, '4', elem_val)
+                valid = False
+            if elem_len > max_len:
+                err_str = '%s is too long: len("%s") = %i > %i (max_len)' % \
+                    (err_prefix, elem_val, elem_len, max_len)
+                error(errh, err_str, '5', elem_val)
+                valid = False
+            if char_set is not None and isinstance(elem_val, str):
+                (bad_string, bad_char) = char_set.scan(elem_val)
+                type_ok = bad_char is None
+            else:
+                bad_string = validation.contains_control_character(elem_val)[1]
+                type_ok = None
+            if bad_string is not None:
+                err_str = '%s, contains an invalid control character(%s)' % \
+                    (err_prefix, bad_string)
+                error(errh, err_str, '6', bad_string)
+                valid = False
+            if check_trailing and elem_val[-1] == ' ':
+                if len(elem_val.rstrip()) >= min_len:
+                    err_str = '%s has unnecessary trailing spaces. (%s)' % \
+                        (err_prefix, elem_val)
+                    error(errh, err_str, '6', elem_val)
+                    valid = False
+            if check_codes and elem_val not in valid_codes and not \
+                    (external_codes is not None and ext_codes.isValid(external_codes, elem_val)):
+                err_str = '(%s) is not a valid code for %s (%s)' % (elem_val, name, refdes)
+                error(errh, err_str, '7', elem_val)
+                valid = False
+            if type_ok is None:
+                type_ok = check_type(elem_val)
+            if not type_ok:
+                error(errh, '%s %s' % (err_prefix, type_err_fmt % (elem_val)), type_err_cde, elem_val)
+                valid = False
+            return valid
+        return validate
+
+    def __getstate__(self):
+        # The validator is bound to the run-time parameters
+        state = x12_node.__getstate__(self)
+        state['_validator'] = None
+        return state
 
     def get_data_type(self):
         """
@@ -1428,7 +1563,7 @@ class composite_if(x12_node):
         return True
 
 
-def load_map_file(map_file, param, map_path=None):
+def load_map_file(map_file, param, map_path=None, ext_codes=None, data_elements=None):
     """
     Create the map object from a file
     @param map_file: absolute path for file
@@ -1437,6 +1572,10 @@ def load_map_file(map_file, param, map_path=None):
     @param map_path: Override directory containing map xml files.  If None,
         uses package resource folder
     @type map_path: string
+    @param ext_codes: Shared external codes.  If None, loads codes.xml
+    @type ext_codes: L{codes.ExternalCodes}
+    @param data_elements: Shared data elements.  If None, loads dataele.xml
+    @type data_elements: L{dataele.DataElements}
     """
     logger = logging.getLogger('pyx12')
     if map_path is not None:
@@ -1445,15 +1584,32 @@ def load_map_file(map_file, param, map_path=None):
             raise OSError(2, "Map path does not exist", map_path)
         if not os.path.isdir(map_path):
             raise OSError(2, "Pyx12 map file '{}' does not exist in map path".format(map_file), map_path)
-        map_fd = open(os.path.join(map_path, map_file))
     else:
         logger.debug("Looking for map file '{}' in pkg_resources".format(map_file))
-        map_fd = resource_stream(__name__, os.path.join('map', map_file))
+    map_source = map_cache.read_map_source(map_file, map_path)
+    cache = None
+    cache_path = param.get('map_cache_path') if param is not None else None
+    if cache_path:
+        cache = map_cache.MapCache(cache_path)
+        sources = [map_source]
+        for file_name in ('codes.xml', 'dataele.xml', 'maps.xml'):
+            sources.append(map_cache.read_map_source(file_name, map_path))
+        cache_key = cache.get_key(map_file, sources, (param.get('exclude_external_codes'),))
+        imap = cache.load(cache_key)
+        if imap is not None:
+            logger.debug('Loaded map %s from cache %s' % (map_file, cache_path))
+            imap.param = param
+            if ext_codes is not None:
+                imap.ext_codes = ext_codes
+            if data_elements is not None:
+                imap.data_elements = data_elements
+            return imap
     imap = None
     try:
         logger.debug('Create map from %s' % (map_file))
-        etree = et.parse(map_fd)
-        imap = map_if(etree.getroot(), param, map_path)
+        imap = map_if(et.fromstring(map_source), param, map_path, ext_codes, data_elements)
+        if cache is not None:
+            cache.save(cache_key, imap)
     except AssertionError:
         logger.error('Load of map file failed: %s' % (map_file))
         raise
@@ -0,0 +1,154 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Process-wide registry of loaded maps.
+
+Map trees are not changed while walking a document; the loop and segment
+counts are kept by the walker.  A loaded map can therefore be shared by
+every document, and every thread, using the same map file, map path and
+map related parameters.  All maps loaded from one map path share one
+ExternalCodes and one DataElements instance.
+"""
+
+import logging
+import threading
+
+# Intrapackage imports
+import codes
+import dataele
+import map_if
+
+logger = logging.getLogger('pyx12.map_registry')
+
+# Parameters which change the loaded map
+MAP_PARAMS = ('exclude_external_codes', 'charset')
+
+
+class MapRegistry(object):
+    """
+    Thread-safe cache of loaded maps
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._maps = {}
+        self._ext_codes = {}
+        self._data_elements = {}
+
+    def _get_map_key(self, map_file, param, map_path):
+        return (map_file, map_path) + tuple([param.get(name) for name in MAP_PARAMS])
+
+    def get_map(self, map_file, param, map_path=None):
+        """
+        Get the shared map, loading it if needed
+
+        The returned map keeps the parameters of the first caller which
+        loaded it.  Only the parameters in MAP_PARAMS are used by a map.
+
+        @param map_file: map file name
+        @type map_file: string
+        @param param: pyx12.param instance
+        @param map_path: Override directory containing map xml files.  If None,
+            uses package resource folder
+        @type map_path: string
+        @rtype: pyx12.map_if
+        """
+        key = self._get_map_key(map_file, param, map_path)
+        with self._lock:
+            imap = self._maps.get(key)
+            if imap is None:
+                logger.debug('Loading shared map %s' % (map_file))
+                imap = map_if.load_map_file(map_file, param, map_path,
+                    self.get_external_codes(map_path, param.get('exclude_external_codes')),
+                    self.get_data_elements(map_path))
+                self._maps[key] = imap
+            return imap
+
+    def get_external_codes(self, map_path=None, exclude=None):
+        """
+        @return: The shared external codes for the map path
+        @rtype: pyx12.codes.ExternalCodes
+        """
+        key = (map_path, exclude)
+        with self._lock:
+            ext_codes = self._ext_codes.get(key)
+            if ext_codes is None:
+                ext_codes = codes.ExternalCodes(map_path, exclude)
+                self._ext_codes[key] = ext_codes
+            return ext_codes
+
+    def get_data_elements(self, map_path=None):
+        """
+        @return: The shared data elements for the map path
+        @rtype: pyx12.dataele.DataElements
+        """
+        with self._lock:
+            data_elements = self._data_elements.get(map_path)
+            if data_elements is None:
+                data_elements = dataele.DataElements(map_path)
+                self._data_elements[map_path] = data_elements
+            return data_elements
+
+    def warm_up(self, map_files, param, map_path=None):
+        """
+        Load the given maps before they are first needed
+
+        @param map_files: map file names
+        @type map_files: list[string]
+        """
+        for map_file in map_files:
+            self.get_map(map_file, param, map_path)
+
+    def evict(self, map_file=None, map_path=None):
+        """
+        Drop loaded maps.  With no arguments, drop everything.
+
+        @param map_file: Only drop maps loaded from this file
+        @type map_file: string
+        @param map_path: Only drop maps loaded from this map path
+        @type map_path: string
+        """
+        with self._lock:
+            if map_file is None and map_path is None:
+                self._maps.clear()
+                self._ext_codes.clear()
+                self._data_elements.clear()
+                return
+            for key in list(self._maps.keys()):
+                if (map_file is None or key[0] == map_file) \
+                        and (map_path is None or key[1] == map_path):
+                    del self._maps[key]
+            if map_file is None:
+                for key in list(self._ext_codes.keys()):
+                    if key[0] == map_path:
+                        del self._ext_codes[key]
+                self._data_elements.pop(map_path, None)
+
+    def __len__(self):
+        return len(self._maps)
+
+
+_registry = MapRegistry()
+
+
+def get_registry():
+    """
+    @return: The process-wide map registry
+    @rtype: L{MapRegistry}
+    """
+    return _registry
+
+
+def load_map_file(map_file, param, map_path=None):
+    """
+    Get a shared map from the process-wide registry
+    @rtype: pyx12.map_if
+    """
+    return _registry.get_map(map_file, param, map_path)
@@ -16,6 +16,7 @@ If seg indicates a segment has been entered, returns the segment node.
 """
 
 import logging
+from bisect import bisect_left
 
 # Intrapackage imports
 from errors import EngineError
@@ -26,6 +27,12 @@ logger = logging.getLogger('pyx12.walk_tree')
 #logger.setLevel(logging.DEBUG)
 #logger.setLevel(logging.ERROR)
 
+# Walk trace operations, replayed by walk_tree for a memoized walk
+_MISSING = 0        # (_MISSING, skipped nodes)
+_LOOP_MISSING = 1   # (_LOOP_MISSING, loop node)
+_LOOP_MATCH = 2     # (_LOOP_MATCH, (loop node, first segment node))
+_SEG_MATCH = 3      # (_SEG_MATCH, segment node)
+
 
 def pop_to_parent_loop(node):
     """
@@ -65,6 +72,98 @@ def is_first_seg_match2(child, seg_data):
     return False
 
 
+def _get_missing_nodes(node, start_idx, end_idx):
+    """
+    @return: The children of node in [start_idx, end_idx) which can report a
+        missing mandatory segment or loop
+    @rtype: tuple(L{node<map_if.x12_node>})
+    """
+    missing_idx = node.missing_child_idx
+    lo = bisect_left(missing_idx, start_idx)
+    hi = bisect_left(missing_idx, end_idx)
+    return tuple([node.child_nodes[idx] for idx in missing_idx[lo:hi]])
+
+
+def compile_walk_plan(start_node, seg_id):
+    """
+    Compile the static part of a walk from a map node for a segment ID
+
+    The plan is a tuple of levels, one for each enclosing loop from the
+    loop of the starting node up to the map root.  Each level is
+    (loop node, steps, trailing missing nodes).  Each step is
+    (skipped missing nodes, candidate node), in walk order.  Whether a
+    candidate matches depends on the segment data, and the missing checks
+    on the counts, so both are still done by the walker.
+
+    @param start_node: Starting segment or loop node
+    @type start_node: L{node<map_if.x12_node>}
+    @param seg_id: data segment ID
+    @type seg_id: string
+    @rtype: tuple
+    """
+    levels = []
+    node = start_node
+    node_pos = node.pos  # Get original position ordinal of starting node
+    if not (node.is_loop() or node.is_map_root()):
+        node = pop_to_parent_loop(node)  # Get enclosing loop
+    while True:
+        start_idx = bisect_left(node.child_pos, node_pos)
+        steps = []
+        for idx in node.get_candidate_idx(seg_id):
+            if idx < start_idx:
+                continue
+            steps.append((_get_missing_nodes(node, start_idx, idx), node.child_nodes[idx]))
+            start_idx = idx + 1
+        levels.append((node, tuple(steps),
+                       _get_missing_nodes(node, start_idx, len(node.child_nodes))))
+        if node.is_map_root():
+            break
+        node_pos = node.pos  # Get position ordinal of current node in tree
+        node = pop_to_parent_loop(node)  # Get enclosing parent loop
+    return tuple(levels)
+
+
+def get_walk_plan(start_node, seg_id):
+    """
+    Get the walk plan from the node's transition table, compiling it if
+    needed.  A segment ID not defined by the map matches no node, so such
+    IDs share the node's plan kept under None, and the table does not grow
+    with the junk segment IDs seen.
+
+    @rtype: tuple
+    """
+    plan = start_node.walk_plans.get(seg_id)
+    if plan is None:
+        root = start_node if start_node.is_map_root() else start_node.root
+        if seg_id not in root.seg_ids:
+            seg_id = None
+            plan = start_node.walk_plans.get(None)
+            if plan is not None:
+                return plan
+        plan = compile_walk_plan(start_node, seg_id)
+        start_node.walk_plans[seg_id] = plan
+    return plan
+
+
+def compile_walk_table(map_root, seg_ids=None):
+    """
+    Compile the walk plans of every segment and loop node of a map ahead of
+    time.  Otherwise plans are compiled when first used.
+
+    @param map_root: Map
+    @type map_root: L{node<map_if.map_if>}
+    @param seg_ids: Segment IDs to compile for.  If None, every segment ID
+        in the map
+    @type seg_ids: list[string]
+    """
+    nodes = [n for n in map_root.loop_segment_iterator() if not n.is_map_root()]
+    if seg_ids is None:
+        seg_ids = set([n.id for n in nodes if n.is_segment()])
+    for node in nodes:
+        for seg_id in seg_ids:
+            get_walk_plan(node, seg_id)
+
+
 def get_id_list(node_list):
     # get_id_list(pop)
     ret = []
@@ -91,13 +190,34 @@ def traverse_path(start_node, pop_loops, push_loops):
 class walk_tree(object):
     """
     Walks a map_if tree.  Tracks loop/segment counting, missing loop/segment.
+
+    Optionally memoizes walks.  Which node a walk finds depends only on the
+    starting node, the segment ID and the segment values the map uses to
+    tell segments apart.  The memo keeps the trace of the counter updates
+    and missing checks of a walk, and replays it for a repeat of the walk,
+    so the counts and the missing, usage and repeat errors are the same as
+    for an unmemoized walk.
     """
-    def __init__(self, initialCounts=None):
+    def __init__(self, initialCounts=None, cache_size=0):
+        """
+        @param initialCounts: Starting loop and segment counts
+        @type initialCounts: dict
+        @param cache_size: Maximum number of memoized walks.  The least
+            recently used walk is dropped when full.  If 0, walks are not
+            memoized
+        @type cache_size: int
+        """
         # Store errors until we know we have an error
         self.mandatory_segs_missing = []
         if initialCounts is None:
             initialCounts = {}
         self.counter = NodeCounter(initialCounts)
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._walk_cache = {}   # (id(node), match signature) -> walk
+        self._walk_count = 0
+        self._trace = None
 
     def walk(self, node, seg_data, errh, seg_count, cur_line, ls_id):
         """
@@ -123,65 +243,137 @@ class walk_tree(object):
 
         @todo: check single segment loop repeat
         """
+        if self.cache_size > 0:
+            return self._walk_cached(node, seg_data, errh, seg_count, cur_line, ls_id)
+        return self._walk(node, seg_data, errh, seg_count, cur_line, ls_id)
+
+    def _walk_cached(self, node, seg_data, errh, seg_count, cur_line, ls_id):
+        """
+        Walk, replaying the memoized trace of a repeated walk
+        """
+        key = (id(node), self._get_match_signature(node, seg_data))
+        self._walk_count += 1
+        entry = self._walk_cache.get(key)
+        if entry is not None and entry[1] is node:
+            entry[0] = self._walk_count
+            self.cache_hits += 1
+            self._replay(entry[2], seg_data, errh, seg_count, cur_line, ls_id)
+            return (entry[3], list(entry[4]), list(entry[5]))
+        self.cache_misses += 1
+        self._trace = []
+        try:
+            (seg_node, pop_node_list, push_node_list) = self._walk(node,
+                seg_data, errh, seg_count, cur_line, ls_id)
+            trace = tuple(self._trace)
+        finally:
+            self._trace = None
+        if seg_node is not None:
+            if len(self._walk_cache) >= self.cache_size:
+                self._evict()
+            self._walk_cache[key] = [self._walk_count, node, trace, seg_node,
+                                     tuple(pop_node_list), tuple(push_node_list)]
+        return (seg_node, pop_node_list, push_node_list)
+
+    def _evict(self):
+        """
+        Drop the least recently used quarter of the memoized walks
+        """
+        by_use = sorted(self._walk_cache.items(), key=lambda item: item[1][0])
+        for (key, entry) in by_use[:max(1, len(by_use) // 4)]:
+            del self._walk_cache[key]
+
+    @staticmethod
+    def _get_match_signature(node, seg_data):
+        """
+        @return: The segment ID and the segment values used by the map to
+            match segments with this ID
+        @rtype: tuple
+        """
+        seg_id = seg_data.get_seg_id()
+        map_root = node if node.is_map_root() else node.root
+        positions = map_root.match_positions.get(seg_id)
+        if positions is None:
+            positions = map_root.get_match_positions(seg_id)
+        if not positions:
+            return (seg_id,)
+        return (seg_id,) + tuple([seg_data.get_value_at(ele_idx, subele_idx)
+                                  for (ele_idx, subele_idx) in positions])
+
+    def _replay(self, trace, seg_data, errh, seg_count, cur_line, ls_id):
+        """
+        Apply the counter updates and missing checks of a memoized walk
+        """
+        self.mandatory_segs_missing = []
+        for (op, arg) in trace:
+            if op == _MISSING:
+                self._add_missing(arg, seg_count, cur_line, ls_id)
+            elif op == _LOOP_MISSING:
+                self._add_loop_missing(arg, seg_count, cur_line, ls_id)
+            elif op == _LOOP_MATCH:
+                self._count_loop_match(arg[0], arg[1], seg_data, errh, seg_count, cur_line, ls_id)
+            elif op == _SEG_MATCH:
+                self._count_seg_match(arg, seg_data, errh, seg_count, cur_line, ls_id)
+
+    def get_cache_stats(self):
+        """
+        @return: Walk memo hits, misses, and size
+        @rtype: dict
+        """
+        return {'hits': self.cache_hits, 'misses': self.cache_misses,
+                'size': len(self._walk_cache), 'max_size': self.cache_size}
+
+    def clear_cache(self):
+        """
+        Drop the memoized walks
+        """
+        self._walk_cache.clear()
+
+    def _walk(self, node, seg_data, errh, seg_count, cur_line, ls_id):
         pop_node_list = []
         push_node_list = []
         orig_node = node
         #logger.info('%s seg_count=%i / cur_line=%i' % (node.id, seg_count, cur_line))
         self.mandatory_segs_missing = []
-        node_pos = node.pos  # Get original position ordinal of starting node
-        if not (node.is_loop() or node.is_map_root()):
-            node = pop_to_parent_loop(node)  # Get enclosing loop
-            #node_list.append(node)
-        while True:
-            # Iterate through nodes with position >= current position
-            for ord1 in [a for a in sorted(node.pos_map) if a >= node_pos]:
-                for child in node.pos_map[ord1]:
-                    if child.is_segment():
-                        if child.is_match(seg_data):
-                            # Is the matched segment the beginning of a loop?
-                            if node.is_loop() \
-                                    and self._is_loop_match(node, seg_data, errh, seg_count, cur_line, ls_id):
-                                (
-                                    node1, push_node_list) = self._goto_seg_match(node, seg_data,
-                                                                                  errh, seg_count, cur_line, ls_id)
-                                if orig_node.is_loop() or orig_node.is_map_root():
-                                    orig_loop = orig_node
-                                else:
-                                    orig_loop = pop_to_parent_loop(orig_node)  # Get enclosing loop
-                                if node == orig_loop:
-                                    pop_node_list = [node]
-                                    push_node_list = [node]
-                                return (node1, pop_node_list, push_node_list)  # segment node
-                            #child.incr_cur_count()
-                            self.counter.increment(child.x12path)
-                            #assert child.get_cur_count() == self.counter.get_count(child.x12path), \
-                            #    'child counts not equal: old is %s=%i : new is %s=%i' % (
-                            #    child.get_path(), child.get_cur_count(),
-                            #    child.x12path.format(), self.counter.get_count(child.x12path))
-                            self._check_seg_usage(child, seg_data, seg_count, cur_line, ls_id, errh)
-                            # Remove any previously missing errors for this segment
-                            self.mandatory_segs_missing = [x for x in self.mandatory_segs_missing if x[0] != child]
-                            self._flush_mandatory_segs(errh, child.pos)
-                            return (child, pop_node_list, push_node_list)  # segment node
-                        elif child.usage == 'R' and self.counter.get_count(child.x12path) < 1:
-                            fake_seg = pyx12.segment.Segment('%s' % (child.id), '~', '*', ':')
-                            err_str = 'Mandatory segment "%s" (%s) missing' % (child.name, child.id)
-                            self.mandatory_segs_missing.append((child, fake_seg, '3', err_str, seg_count, cur_line, ls_id))
-                        #else:
-                            #logger.debug('Segment %s is not a match for (%s*%s)' % \
-                            #   (child.id, seg_data.get_seg_id(), seg_data[0].get_value()))
-                    elif child.is_loop():
-                        if self._is_loop_match(child, seg_data, errh, seg_count, cur_line, ls_id):
-                            (node_seg, push_node_list) = self._goto_seg_match(child, seg_data, errh, seg_count, cur_line, ls_id)
-                            return (node_seg, pop_node_list, push_node_list)  # segment node
-            # End for ord1 in pos_keys
+        # Each level of the plan is an enclosing loop, from the starting
+        # node up to the map root
+        for (node, steps, trailing_missing) in get_walk_plan(orig_node, seg_data.get_seg_id()):
+            # Try the nodes with position >= current position which might
+            # match the segment ID.  Only check the skipped nodes for missing
+            # mandatory segments and loops.
+            for (skipped_missing, child) in steps:
+                self._add_missing(skipped_missing, seg_count, cur_line, ls_id)
+                if child.is_segment():
+                    if child.is_match(seg_data):
+                        # Is the matched segment the beginning of a loop?
+                        if node.is_loop() \
+                                and self._is_loop_match(node, seg_data, errh, seg_count, cur_line, ls_id):
+                            (
+                                node1, push_node_list) = self._goto_seg_match(node, seg_data,
+                                                                              errh, seg_count, cur_line, ls_id)
+                            if orig_node.is_loop() or orig_node.is_map_root():
+                                orig_loop = orig_node
+                            else:
+                                orig_loop = pop_to_parent_loop(orig_node)  # Get enclosing loop
+                            if node == orig_loop:
+                                pop_node_list = [node]
+                                push_node_list = [node]
+                            return (node1, pop_node_list, push_node_list)  # segment node
+                        self._count_seg_match(child, seg_data, errh, seg_count, cur_line, ls_id)
+                        return (child, pop_node_list, push_node_list)  # segment node
+                    elif child.usage == 'R':
+                        self._add_missing((child,), seg_count, cur_line, ls_id)
+                    #else:
+                        #logger.debug('Segment %s is not a match for (%s*%s)' % \
+                        #   (child.id, seg_data.get_seg_id(), seg_data[0].get_value()))
+                elif child.is_loop():
+                    if self._is_loop_match(child, seg_data, errh, seg_count, cur_line, ls_id):
+                        (node_seg, push_node_list) = self._goto_seg_match(child, seg_data, errh, seg_count, cur_line, ls_id)
+                        return (node_seg, pop_node_list, push_node_list)  # segment node
+            # End for child in candidates
+            self._add_missing(trailing_missing, seg_count, cur_line, ls_id)
             if node.is_map_root():  # If at root and we haven't found the segment yet.
-                walk_tree._seg_not_found_error(orig_node, seg_data,
-                                               errh, seg_count, cur_line, ls_id)
-                return (None, [], [])
-            node_pos = node.pos  # Get position ordinal of current node in tree
+                break
             pop_node_list.append(node)
-            node = pop_to_parent_loop(node)  # Get enclosing parent loop
 
         walk_tree._seg_not_found_error(orig_node, seg_data, errh, seg_count, cur_line, ls_id)
         return (None, [], [])
@@ -222,9 +414,9 @@ class walk_tree(object):
             errh.seg_error('2', err_str, None)
         elif seg_node.usage == 'R' or seg_node.usage == 'S':
             #assert seg_node.get_cur_count() == self.counter.get_count(seg_node.x12path), 'seg_node counts not equal'
-            if self.counter.get_count(seg_node.x12path) > seg_node.get_max_repeat():  # handle seg repeat count
+            if self.counter.get_count(seg_node.counter_id) > seg_node.get_max_repeat():  # handle seg repeat count
                 err_str = "Segment %s exceeded max count.  Found %i, should have %i" \
-                    % (seg_data.get_seg_id(), self.counter.get_count(seg_node.x12path), seg_node.get_max_repeat())
+                    % (seg_data.get_seg_id(), self.counter.get_count(seg_node.counter_id), seg_node.get_max_repeat())
                 errh.add_seg(seg_node, seg_data, seg_count, cur_line, ls_id)
                 errh.seg_error('5', err_str, None)
 
@@ -243,7 +435,7 @@ class walk_tree(object):
         if seg_data.get_seg_id() == 'HL':
             seg_str = seg_data.format('', '*', ':')
         else:
-            seg_str = '%s*%s' % (seg_data.get_seg_id(), seg_data.get_value('01'))
+            seg_str = '%s*%s' % (seg_data.get_seg_id(), seg_data.get_value_at(0))
         err_str = 'Segment %s not found.  Started at %s' % (seg_str, orig_node.get_path())
         errh.add_seg(orig_node, seg_data, seg_count, cur_line, ls_id)
         errh.seg_error('1', err_str, None)
@@ -262,6 +454,49 @@ class walk_tree(object):
                 errh.seg_error(err_cde, err_str, None)
         self.mandatory_segs_missing = [x for x in self.mandatory_segs_missing if x[0].pos == cur_pos]
 
+    def _add_missing(self, nodes, seg_count, cur_line, ls_id):
+        """
+        Record the missing mandatory segments and loops among the child
+        nodes skipped by a walk plan
+
+        @param nodes: Skipped nodes which can report a missing segment or loop
+        @type nodes: tuple(L{node<map_if.x12_node>})
+        """
+        if not nodes:
+            return
+        if self._trace is not None:
+            self._trace.append((_MISSING, nodes))
+        for child in nodes:
+            if child.is_segment():
+                if self.counter.get_count(child.counter_id) < 1:
+                    fake_seg = pyx12.segment.Segment('%s' % (child.id), '~', '*', ':')
+                    err_str = 'Mandatory segment "%s" (%s) missing' % (child.name, child.id)
+                    self.mandatory_segs_missing.append((child, fake_seg, '3', err_str, seg_count, cur_line, ls_id))
+            else:
+                self._add_loop_missing_nodes(child, seg_count, cur_line, ls_id)
+
+    def _add_loop_missing(self, loop_node, seg_count, cur_line, ls_id):
+        """
+        Record a missing mandatory loop, as _is_loop_match does for a loop
+        which does not match
+        """
+        if self._trace is not None:
+            self._trace.append((_LOOP_MISSING, loop_node))
+        self._add_loop_missing_nodes(loop_node, seg_count, cur_line, ls_id)
+
+    def _add_loop_missing_nodes(self, loop_node, seg_count, cur_line, ls_id):
+        first_child_node = loop_node.get_first_node()
+        if first_child_node.is_loop():
+            for child in loop_node.child_nodes:
+                if child.is_loop() and child.reports_missing:
+                    self._add_loop_missing_nodes(child, seg_count, cur_line, ls_id)
+        elif self.counter.get_count(loop_node.counter_id) < 1:
+            fake_seg = pyx12.segment.Segment('%s' % (first_child_node.id), '~', '*', ':')
+            err_str = 'Mandatory loop "%s" (%s) missing' % \
+                (loop_node.name, loop_node.id)
+            self.mandatory_segs_missing.append((first_child_node, fake_seg,
+                                                '3', err_str, seg_count, cur_line, ls_id))
+
     def _is_loop_match(self, loop_node, seg_data, errh, seg_count, cur_line, ls_id):
         """
         Try to match the current loop to the segment
@@ -287,6 +522,10 @@ class walk_tree(object):
         #        loop_node.x12path.format(), self.counter.get_count(loop_node.x12path))
         if len(loop_node) <= 0:  # Has no children
             return False
+        if seg_data.get_seg_id() not in loop_node.first_seg_ids:
+            if loop_node.reports_missing:
+                self._add_loop_missing(loop_node, seg_count, cur_line, ls_id)
+            return False
         first_child_node = loop_node.get_first_node()
         assert first_child_node is not None, 'get_first_node failed from loop %s' % (loop_node.id)
         if first_child_node.is_loop():
@@ -297,12 +536,8 @@ class walk_tree(object):
                     return True
         elif is_first_seg_match2(first_child_node, seg_data):
             return True
-        elif loop_node.usage == 'R' and self.counter.get_count(loop_node.x12path) < 1:
-            fake_seg = pyx12.segment.Segment('%s' % (first_child_node.id), '~', '*', ':')
-            err_str = 'Mandatory loop "%s" (%s) missing' % \
-                (loop_node.name, loop_node.id)
-            self.mandatory_segs_missing.append((first_child_node, fake_seg,
-                                                '3', err_str, seg_count, cur_line, ls_id))
+        elif loop_node.usage == 'R':
+            self._add_loop_missing(loop_node, seg_count, cur_line, ls_id)
         return False
 
     def _goto_seg_match(self, loop_node, seg_data, errh, seg_count, cur_line, ls_id):
@@ -329,16 +564,13 @@ class walk_tree(object):
             % (loop_node.id, seg_data.get_seg_id())
         first_child_node = loop_node.get_first_seg()
         if first_child_node is not None and is_first_seg_match2(first_child_node, seg_data):
-            self._check_loop_usage(loop_node, seg_data,
-                                   seg_count, cur_line, ls_id, errh)
-            #first_child_node.incr_cur_count()
-            self.counter.increment(first_child_node.x12path)
-            #assert first_child_node.get_cur_count() == self.counter.get_count(first_child_node.x12path), 'first_child_node counts not equal'
-            self._flush_mandatory_segs(errh)
+            self._count_loop_match(loop_node, first_child_node, seg_data,
+                                   errh, seg_count, cur_line, ls_id)
             return (first_child_node, [loop_node])
         else:
+            seg_id = seg_data.get_seg_id()
             for child in loop_node.childIterator():
-                if child.is_loop():
+                if child.is_loop() and seg_id in child.first_seg_ids:
                     (
                         node1, push1) = self._goto_seg_match(child, seg_data, errh,
                                                              seg_count, cur_line, ls_id)
@@ -348,6 +580,32 @@ class walk_tree(object):
                         return (node1, push_node_list)
         return (None, [])
 
+    def _count_seg_match(self, seg_node, seg_data, errh, seg_count, cur_line, ls_id):
+        """
+        Count a matched segment, and report the outstanding missing segments
+        """
+        if self._trace is not None:
+            self._trace.append((_SEG_MATCH, seg_node))
+        #seg_node.incr_cur_count()
+        self.counter.increment(seg_node.counter_id)
+        self._check_seg_usage(seg_node, seg_data, seg_count, cur_line, ls_id, errh)
+        # Remove any previously missing errors for this segment
+        self.mandatory_segs_missing = [x for x in self.mandatory_segs_missing if x[0] != seg_node]
+        self._flush_mandatory_segs(errh, seg_node.pos)
+
+    def _count_loop_match(self, loop_node, first_child_node, seg_data, errh, seg_count, cur_line, ls_id):
+        """
+        Count a matched loop and its first segment, and report the
+        outstanding missing segments
+        """
+        if self._trace is not None:
+            self._trace.append((_LOOP_MATCH, (loop_node, first_child_node)))
+        self._check_loop_usage(loop_node, seg_data,
+                               seg_count, cur_line, ls_id, errh)
+        #first_child_node.incr_cur_count()
+        self.counter.increment(first_child_node.counter_id)
+        self._flush_mandatory_segs(errh)
+
     def _check_loop_usage(self, loop_node, seg_data, seg_count, cur_line, ls_id, errh):
         """
         Check loop usage requirement and count
@@ -376,18 +634,18 @@ class walk_tree(object):
             #if loop_node.id == '2110':
             #    import ipdb; ipdb.set_trace()
             #loop_node.reset_child_count()
-            self.counter.reset_to_node(loop_node.x12path)
+            self.counter.reset_to_node(loop_node.counter_id)
             #loop_node.incr_cur_count()
-            self.counter.increment(loop_node.x12path)
+            self.counter.increment(loop_node.counter_id)
             #assert loop_node.get_cur_count() == self.counter.get_count(loop_node.x12path), \
             #    'loop_node counts not equal: old is %s=%i : new is %s=%i' % (
             #    loop_node.get_path(), loop_node.get_cur_count(),
             #    loop_node.x12path.format(), self.counter.get_count(loop_node.x12path))
             #logger.debug('incr loop_node %s %i' % (loop_node.id, loop_node.cur_count))
             #logger.debug('incr first_child_node %s %i' % (first_child_node.id, first_child_node.cur_count))
-            if self.counter.get_count(loop_node.x12path) > loop_node.get_max_repeat():
+            if self.counter.get_count(loop_node.counter_id) > loop_node.get_max_repeat():
                 err_str = "Loop %s exceeded max count.  Found %i, should have %i" \
-                    % (loop_node.id, self.counter.get_count(loop_node.x12path), loop_node.get_max_repeat())
+                    % (loop_node.id, self.counter.get_count(loop_node.counter_id), loop_node.get_max_repeat())
                 errh.add_seg(loop_node, seg_data, seg_count, cur_line, ls_id)
                 errh.seg_error('4', err_str, None)
             #logger.debug('MATCH Loop %s / Segment %s (%s*%s)' \
@@ -10,23 +10,102 @@
 
 """
 Loop and segment counter
+
+Paths are interned to integer ids, shared by every map in the process, so
+counts carry over when the walker moves from the control map to a
+transaction map.  The counts are kept in a trie of path ids, so resetting
+a loop only visits the counted nodes below it.
 """
-from collections import OrderedDict
+import threading
+
 import pyx12.path
 from decorators import dump_args
 
+_path_ids = {}       # formatted path -> id
+_raw_path_ids = {}   # path string as given -> id
+_path_strs = []      # id -> formatted path
+_path_parents = []   # id -> parent id, or None
+_path_lock = threading.Lock()
+
+
+def _intern_path(path_str):
+    """
+    @param path_str: Formatted path
+    @return: The path id, adding the path and its parents if new
+    @rtype: int
+    """
+    with _path_lock:
+        return _intern_path_locked(path_str)
+
+
+def _intern_path_locked(path_str):
+    path_id = _path_ids.get(path_str)
+    if path_id is not None:
+        return path_id
+    if '/' in path_str:
+        parent_id = _intern_path_locked(path_str.rsplit('/', 1)[0])
+    else:
+        parent_id = None
+    path_id = len(_path_strs)
+    _path_strs.append(path_str)
+    _path_parents.append(parent_id)
+    _path_ids[path_str] = path_id
+    return path_id
+
+
+def get_path_id(xpath):
+    """
+    Get the integer id of a path
+
+    @param xpath: path id, path, or path string
+    @type xpath: int, L{X12Path<path.X12Path>} or string
+    @rtype: int
+    """
+    if isinstance(xpath, int):
+        return xpath
+    if isinstance(xpath, pyx12.path.X12Path):
+        path_str = xpath.format()
+        path_id = _path_ids.get(path_str)
+        if path_id is None:
+            path_id = _intern_path(path_str)
+        return path_id
+    path_id = _raw_path_ids.get(xpath)
+    if path_id is None:
+        path_id = _intern_path(pyx12.path.X12Path(xpath).format())
+        _raw_path_ids[xpath] = path_id
+    return path_id
+
 
 class NodeCounter(object):
     """
     X12 Loop and Segment Node Counter
+
+    The path arguments may be a path id from L{get_path_id}, an X12Path, or
+    a path string.
     """
     def __init__(self, initialCounts=None):
         if initialCounts is None:
             initialCounts = {}
-        self._dict = OrderedDict()
+        self._counts = {}   # path id -> count
+        self._kids = {}     # path id -> set of child path ids in the trie
         # copy constructor
         for k, v in initialCounts.items():
-            self._dict[NodeCounter.makeX12Path(k)] = v
+            self.setCount(k, v)
+
+    def _add_node(self, path_id):
+        """
+        Link the path and its parents into the trie
+        """
+        kids = self._kids
+        child_id = None
+        while path_id is not None:
+            if path_id in kids:
+                if child_id is not None:
+                    kids[path_id].add(child_id)
+                return
+            kids[path_id] = set() if child_id is None else set([child_id])
+            child_id = path_id
+            path_id = _path_parents[path_id]
 
     #@dump_args
     def reset_to_node(self, xpath):
@@ -34,41 +113,49 @@ class NodeCounter(object):
         Pop to node, deleting all child counts
         Keep count of xpath node
         """
-        parent = NodeCounter.makeX12Path(xpath)
-        child_keys = list([x for x in self._dict.keys() if parent.is_child_path(x.format())])
-        for k in child_keys:
-            del self._dict[k]
+        child_ids = self._kids.get(get_path_id(xpath))
+        if not child_ids:
+            return
+        stack = list(child_ids)
+        child_ids.clear()
+        while stack:
+            path_id = stack.pop()
+            self._counts.pop(path_id, None)
+            stack.extend(self._kids.pop(path_id, ()))
 
     #@dump_args
     def increment(self, xpath):
         """
         Increment path count
         """
-        k = NodeCounter.makeX12Path(xpath)
-        if k in self._dict:
-            self._dict[k] += 1
+        path_id = get_path_id(xpath)
+        if path_id in self._counts:
+            self._counts[path_id] += 1
         else:
-            self._dict[k] = 1
+            self._counts[path_id] = 1
+            self._add_node(path_id)
 
     #@dump_args
     def setCount(self, xpath, ct):
         """
         Set path count
         """
-        k = NodeCounter.makeX12Path(xpath)
-        self._dict[k] = ct
+        path_id = get_path_id(xpath)
+        self._counts[path_id] = ct
+        self._add_node(path_id)
 
     def get_count(self, xpath):
         """
         Get path count
         """
-        k = NodeCounter.makeX12Path(xpath)
-        if k not in self._dict:
-            return 0
-        return self._dict[k]
+        return self._counts.get(get_path_id(xpath), 0)
 
     def getState(self):
-        return self._dict
+        """
+        @return: Snapshot of the counts, usable as initialCounts
+        @rtype: dict{L{X12Path<path.X12Path>}: int}
+        """
+        return dict([(pyx12.path.X12Path(_path_strs[k]), v) for (k, v) in self._counts.items()])
 
     @staticmethod
     def makeX12Path(xpath):
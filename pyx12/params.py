@@ -23,6 +23,29 @@ import logging
 
 from pyx12.errors import EngineError
 
+# Validation levels.  Each level does the work of the levels before it:
+#  - envelope: the ISA, GS and ST envelopes, control numbers and trailer counts
+#  - structure: the map walk, segment order, repeat counts and missing segments
+#  - elements: the elements of each segment, their values and codes
+#  - full: also the relations between elements, syntax rules and date formats
+VALIDATION_LEVELS = ('envelope', 'structure', 'elements', 'full')
+(LEVEL_ENVELOPE, LEVEL_STRUCTURE, LEVEL_ELEMENTS, LEVEL_FULL) = range(len(VALIDATION_LEVELS))
+
+
+def get_validation_level(param, default='full'):
+    """
+    @param param: pyx12.param instance
+    @param default: Level used if the validation_level parameter is not set
+    @type default: string
+    @return: Index of the validation level in VALIDATION_LEVELS
+    @rtype: int
+    @raise EngineError: If the level is unknown
+    """
+    level = param.get('validation_level') or default
+    if level not in VALIDATION_LEVELS:
+        raise EngineError('Unknown validation level "%s"' % (level))
+    return VALIDATION_LEVELS.index(level)
+
 
 class ParamsBase(object):
     """
@@ -42,6 +65,11 @@ class ParamsBase(object):
         self.params['charset'] = 'E'
         self.params['simple_dtd'] = ''
         self.params['xmlout'] = 'simple'
+        self.params['map_cache_path'] = None
+        self.params['walk_cache_size'] = 0
+        self.params['workers'] = 1
+        self.params['control_store'] = None
+        self.params['validation_level'] = None
 
     def get(self, option):
         """
@@ -49,10 +77,7 @@ class ParamsBase(object):
         @param option: Option name
         @type option: string
         """
-        if option in list(self.params.keys()):
-            return self.params[option]
-        else:
-            return None
+        return self.params.get(option)
 
     def set(self, option, value):
         """
@@ -17,7 +17,7 @@ Used by X12Reader.
 import pyx12.errors
 import pyx12.segment
 
-DEFAULT_BUFSIZE = 8 * 1024
+DEFAULT_BUFSIZE = 64 * 1024
 ISA_LEN = 106
 
 
@@ -26,16 +26,31 @@ class RawX12File(object):
     Interface to an X12 data file
     """
 
-    def __init__(self, fin):
+    def __init__(self, fin, bufsize=DEFAULT_BUFSIZE):
         """
         Initialize the file X12 file reader
 
         @param fin: an open, readable file object
         @type fin: open file object
+        @param bufsize: number of characters to read from fin at a time
+        @type bufsize: int
         """
         self.fd = fin
+        self.bufsize = bufsize
         self.buffer = None
+        self.pos = 0
+        self.remaining = None  # bytes left before the read limit
         line = self.fd.read(ISA_LEN)
+        self.set_isa(line)
+        self.buffer = line + self.fd.read(self.bufsize)
+
+    def set_isa(self, line):
+        """
+        Set the version and terminators from an ISA segment
+
+        @param line: ISA segment, including the segment terminator
+        @type line: string
+        """
         if line[:3] != 'ISA':
             err_str = "First line does not begin with 'ISA': %s" % line[:3]
             raise pyx12.errors.X12Error(err_str)
@@ -50,28 +65,108 @@ class RawX12File(object):
         self.ele_term = line[3]
         self.subele_term = line[-2]
         self.repetition_term = line[82] if self.icvn == '00501' else None
-        self.buffer = line
-        self.buffer += self.fd.read(DEFAULT_BUFSIZE)
+
+    def seek(self, offset, end=None):
+        """
+        Continue reading at a segment boundary.  The file object must be
+        seekable.
+
+        @param offset: Byte offset of the next segment
+        @type offset: int
+        @param end: If not None, stop reading at this byte offset
+        @type end: int
+        """
+        self.fd.seek(offset)
+        self.buffer = ''
+        self.pos = 0
+        self.remaining = None if end is None else end - offset
+
+    def _read(self, size):
+        """
+        Read from the file, up to the read limit
+        """
+        if self.remaining is None:
+            return self.fd.read(size)
+        data = self.fd.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
 
     def __iter__(self):
         """
         Iterate over input lines
         Often, X12 files have a CR-LF after the segment delimiter.
         Split the input stream on the delimiter and remove any leading CR-LF
+
+        The buffer is scanned with a moving cursor.  Consumed data is only
+        discarded when more data is read, so each segment costs a single
+        find and a single slice.
         """
+        seg_term = self.seg_term
+        buf = self.buffer
+        pos = self.pos
         while True:
-            if self.buffer.find(self.seg_term) == -1:
+            end = buf.find(seg_term, pos)
+            while end == -1:
                 # Need more data
-                self.buffer += self.fd.read(DEFAULT_BUFSIZE)
-            if self.buffer.find(self.seg_term) == -1:
+                data = self._read(self.bufsize)
+                if not data:
+                    break
+                searched = len(buf) - pos
+                buf = buf[pos:] + data
+                pos = 0
+                end = buf.find(seg_term, searched)
+            if end == -1:
                 # Still have no segment terminator
                 break
-            # Get first segment in buffer
-            (line, self.buffer) = self.buffer.split(self.seg_term, 1)
-            line = line.lstrip('\n\r')
-            if line == '':
+            # Skip any leading CR-LF
+            while pos < end and buf[pos] in '\n\r':
+                pos += 1
+            if pos == end:
                 break
+            line = buf[pos:end]
+            pos = end + 1
+            self.buffer = buf
+            self.pos = pos
             yield(line)
+        self.buffer = buf[pos:]
+        self.pos = 0
+
+    def iter_chunks(self, bufsize=None):
+        """
+        Iterate over lists of input lines
+        Each read of the input is split on the delimiter in one call, and
+        the complete segments found are returned together.  Leading CR-LF
+        is removed as in the line iterator.
+
+        @param bufsize: number of characters to read at a time.  If None,
+            uses the size given to the constructor
+        @type bufsize: int
+        @rtype: list[string]
+        """
+        if bufsize is None:
+            bufsize = self.bufsize
+        seg_term = self.seg_term
+        buf = self.buffer[self.pos:]
+        self.pos = 0
+        while True:
+            data = self._read(bufsize)
+            if data:
+                buf += data
+            lines = buf.split(seg_term)
+            # The last piece is an incomplete segment
+            buf = lines.pop()
+            lines = [line.lstrip('\n\r') for line in lines]
+            if '' in lines:
+                # An empty segment ends the input
+                lines = lines[:lines.index('')]
+                buf = ''
+                data = None
+            if lines:
+                self.buffer = buf
+                yield lines
+            if not data:
+                break
+        self.buffer = buf
 
     def get_term(self):
         """
@@ -20,17 +20,22 @@ import os.path
 from os.path import abspath, join, dirname, isdir, isfile
 import sys
 import logging
-import tempfile
+import time
 import codecs
+import tempfile
 import argparse
+import multiprocessing
 
 # Intrapackage imports
 libpath = abspath(join(dirname(__file__), '../..'))
 if isdir(libpath):
     sys.path.insert(0, libpath)
 import pyx12
+import pyx12.map_index
+import pyx12.map_registry
 import pyx12.x12n_document
 import pyx12.params
+import pyx12.error_sink
 
 __author__ = pyx12.__author__
 __status__ = pyx12.__status__
@@ -48,6 +53,170 @@ def check_map_path_arg(map_path):
     return map_path
 
 
+def get_target(src_filename, ext):
+    """
+    Name of an output file written next to the source file
+    """
+    if os.path.splitext(src_filename)[1] == '.txt':
+        return os.path.splitext(src_filename)[0] + ext
+    return src_filename + ext
+
+
+def _open_target(target):
+    """
+    Open a temporary file in the directory of a target
+
+    @return: The file object and the name of the temporary file
+    @rtype: tuple(file, string)
+    """
+    (fd, tmp_filename) = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(target) + '.',
+                                          dir=os.path.dirname(target) or '.')
+    return (os.fdopen(fd, 'w'), tmp_filename)
+
+
+def _close_target(fd_tmp, tmp_filename, target, keep=True):
+    """
+    Close a temporary file from L{_open_target}.  If keep is True and it
+    is not empty, it is renamed over the target, else it is removed.
+    """
+    empty = fd_tmp.tell() == 0
+    fd_tmp.close()
+    if keep and not empty:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_filename, 0o666 & ~umask)
+        os.rename(tmp_filename, target)
+    else:
+        os.remove(tmp_filename)
+
+
+def validate_file(param, src_filename, flag_997=True, flag_html=False, map_path=None,
+                  flag_errors=False):
+    """
+    Validate a file.  The 997/999, HTML and JSON Lines error log are
+    written next to the source file.  The 997/999 and error log are
+    written to temporary files, which replace their targets only if they
+    are not empty, so an existing target is left alone when nothing is
+    produced.
+
+    @return: True if the file is valid
+    @rtype: boolean
+    """
+    fd_997 = None
+    fd_html = None
+    error_sinks = []
+    targets = []
+    done = False
+    try:
+        if flag_997:
+            target_997 = get_target(src_filename, '.997')
+            (fd_tmp, tmp_filename) = _open_target(target_997)
+            targets.append((fd_tmp, tmp_filename, target_997))
+            fd_997 = codecs.getwriter('ascii')(fd_tmp)
+        if flag_html:
+            fd_html = open(get_target(src_filename, '.html'), 'w')
+        if flag_errors:
+            target_errors = get_target(src_filename, '.errors.jsonl')
+            (fd_tmp, tmp_filename) = _open_target(target_errors)
+            targets.append((fd_tmp, tmp_filename, target_errors))
+            error_sinks.append(pyx12.error_sink.JsonLinesWriter(fd_tmp))
+        valid = pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
+                fd_997=fd_997, fd_html=fd_html, fd_xmldoc=None, map_path=map_path,
+                error_sinks=error_sinks)
+        done = True
+        return valid
+    finally:
+        for (fd_tmp, tmp_filename, target) in targets:
+            _close_target(fd_tmp, tmp_filename, target, done)
+        if fd_html:
+            fd_html.close()
+
+
+def warm_up_maps(param, map_path=None):
+    """
+    Load every map in the map index into the shared registry
+    """
+    logger = logging.getLogger('pyx12')
+    map_files = set([m['map_file'] for m in pyx12.map_index.map_index(map_path).maps])
+    map_files.update(['x12.control.00401.xml', 'x12.control.00501.xml'])
+    registry = pyx12.map_registry.get_registry()
+    for map_file in sorted(map_files):
+        try:
+            registry.get_map(map_file, param, map_path)
+        except Exception:
+            logger.debug('Could not load map file %s' % (map_file))
+
+
+_job_param = None
+_job_map_path = None
+
+
+def _init_job(param, map_path):
+    global _job_param, _job_map_path
+    _job_param = param
+    _job_map_path = map_path
+
+
+def _run_job(task):
+    """
+    Validate a file in a worker process
+
+    @return: (source file, status, file size, seconds)
+    """
+    (src_filename, flag_997, flag_html, flag_errors) = task
+    start = time.time()
+    try:
+        if validate_file(_job_param, src_filename, flag_997, flag_html, _job_map_path, flag_errors):
+            status = 'OK'
+        else:
+            status = 'Failure'
+    except Exception:
+        logging.getLogger('pyx12').exception('Could not validate file "%s"' % (src_filename))
+        status = 'Error'
+    return (src_filename, status, os.path.getsize(src_filename), time.time() - start)
+
+
+def run_jobs(param, src_filenames, jobs, flag_997=True, flag_html=False, map_path=None,
+             flag_errors=False):
+    """
+    Validate files in a pool of worker processes.  The maps are loaded
+    before the workers are forked, so they are shared.  A line is written
+    for each file as it is done, and the totals at the end.
+
+    @return: True if the run was not interrupted
+    @rtype: boolean
+    """
+    warm_up_maps(param, map_path)
+    start = time.time()
+    totals = {'OK': 0, 'Failure': 0, 'Error': 0}
+    total_size = 0
+    pool = multiprocessing.Pool(jobs, _init_job, (param, map_path))
+    try:
+        tasks = [(src_filename, flag_997, flag_html, flag_errors) for src_filename in src_filenames]
+        for (src_filename, status, size, elapsed) in pool.imap(_run_job, tasks):
+            sys.stderr.write('%s: %s (%.2fs)\n' % (src_filename, status, elapsed))
+            totals[status] += 1
+            total_size += size
+        pool.close()
+    except KeyboardInterrupt:
+        print("\n[interrupt]")
+        pool.terminate()
+        return False
+    except Exception:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    elapsed = time.time() - start
+    count = sum(totals.values())
+    sys.stderr.write('%i files: %i OK, %i Failure, %i Error\n' %
+                     (count, totals['OK'], totals['Failure'], totals['Error']))
+    sys.stderr.write('%.1f MB in %.1fs: %.1f files/s, %.2f MB/s\n' %
+                     (total_size / 1048576.0, elapsed, count / max(elapsed, 0.001),
+                      total_size / 1048576.0 / max(elapsed, 0.001)))
+    return True
+
+
 def main():
     """
     Set up environment for processing
@@ -58,14 +227,29 @@ def main():
     parser.add_argument(
         '--log-file', '-l', action='store', dest="logfile", default=None)
     parser.add_argument('--map-path', '-m', action='store', dest="map_path", default=None, type=check_map_path_arg)
+    parser.add_argument('--map-cache', action='store', dest="map_cache_path", default=None,
+                        help='Directory for cached compiled maps')
+    parser.add_argument('--walk-cache', action='store', dest="walk_cache_size", default=None, type=int,
+                        help='Number of repeated map walks to memoize')
+    parser.add_argument('--workers', action='store', dest="workers", default=None, type=int,
+                        help='Number of processes validating transaction sets')
+    parser.add_argument('--control-store', action='store', dest="control_store", default=None,
+                        help='SQLite file of the ISA/GS control numbers already received')
+    parser.add_argument('--jobs', '-j', action='store', dest="jobs", default=None, type=int,
+                        help='Number of processes validating files')
     parser.add_argument('--verbose', '-v', action='count')
     parser.add_argument('--debug', '-d', action='store_true')
     parser.add_argument('--quiet', '-q', action='store_true')
     parser.add_argument('--html', '-H', action='store_true')
+    parser.add_argument('--error-log', action='store_true', dest="error_log",
+                        help='Write the errors to a JSON Lines file next to each source file')
     parser.add_argument('--exclude-external-codes', '-x', action='append', dest="exclude_external",
                         default=[], help='External Code Names to ignore')
     parser.add_argument('--charset', '-s', choices=(
         'b', 'e'), help='Specify X12 character set: b=basic, e=extended')
+    parser.add_argument('--level', action='store', dest="validation_level", default=None,
+                        choices=pyx12.params.VALIDATION_LEVELS,
+                        help='Validation level, from the fewest checks to all (default full)')
     #parser.add_argument('--background', '-b', action='store_true')
     #parser.add_argument('--test', '-t', action='store_true')
     parser.add_argument('--profile', action='store_true', help='Profile the code with plop')
@@ -90,12 +274,20 @@ def main():
         logger.setLevel(logging.DEBUG)
     if args.quiet:
         logger.setLevel(logging.ERROR)
-    fd_997 = None
-    fd_html = None
     flag_997 = True
     param.set('exclude_external_codes', ','.join(args.exclude_external))
     if args.map_path:
         param.set('map_path', args.map_path)
+    if args.validation_level:
+        param.set('validation_level', args.validation_level)
+    if args.map_cache_path:
+        param.set('map_cache_path', args.map_cache_path)
+    if args.walk_cache_size:
+        param.set('walk_cache_size', args.walk_cache_size)
+    if args.workers:
+        param.set('workers', args.workers)
+    if args.control_store:
+        param.set('control_store', args.control_store)
 
     if args.logfile:
         try:
@@ -105,27 +297,29 @@ def main():
         except IOError:
             logger.exception('Could not open log file: %s' % (args.logfile))
 
+    if args.jobs:
+        if args.workers:
+            logger.warning('--workers is not used with --jobs')
+            param.set('workers', 1)
+        src_filenames = []
+        for src_filename in args.input_files:
+            if not os.path.isfile(src_filename):
+                logger.error('Could not open file "%s"' % (src_filename))
+                continue
+            src_filenames.append(src_filename)
+        return run_jobs(param, src_filenames, args.jobs, flag_997, args.html, args.map_path,
+                        args.error_log)
+
     for src_filename in args.input_files:
         try:
             if not os.path.isfile(src_filename):
                 logger.error('Could not open file "%s"' % (src_filename))
                 continue
-            #fd_src = open(src_filename, 'U')
-            if flag_997:
-                fd_997 = tempfile.TemporaryFile()
-            if args.html:
-                if os.path.splitext(src_filename)[1] == '.txt':
-                    target_html = os.path.splitext(src_filename)[0] + '.html'
-                else:
-                    target_html = src_filename + '.html'
-                fd_html = open(target_html, 'w')
-
             if args.profile:
                 from plop.collector import Collector
                 p = Collector()
                 p.start()
-                if pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
-                        fd_997=fd_997, fd_html=fd_html, fd_xmldoc=None, map_path=args.map_path):
+                if validate_file(param, src_filename, flag_997, args.html, args.map_path, args.error_log):
                     sys.stderr.write('%s: OK\n' % (src_filename))
                 else:
                     sys.stderr.write('%s: Failure\n' % (src_filename))
@@ -148,24 +342,10 @@ def main():
                     logger.exception('Failed to write profile data')
                     sys.stderr.write('%s: bad profile save\n' % (src_filename))
             else:
-                if pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
-                        fd_997=fd_997, fd_html=fd_html, fd_xmldoc=None, map_path=args.map_path):
+                if validate_file(param, src_filename, flag_997, args.html, args.map_path, args.error_log):
                     sys.stderr.write('%s: OK\n' % (src_filename))
                 else:
                     sys.stderr.write('%s: Failure\n' % (src_filename))
-            if flag_997 and fd_997.tell() != 0:
-                fd_997.seek(0)
-                if os.path.splitext(src_filename)[1] == '.txt':
-                    target_997 = os.path.splitext(src_filename)[0] + '.997'
-                else:
-                    target_997 = src_filename + '.997'
-                codecs.open(target_997, mode='w',
-                            encoding='ascii').write(fd_997.read())
-
-            if fd_997:
-                fd_997.close()
-            if fd_html:
-                fd_html.close()
         except IOError:
             logger.exception('Could not open files')
             return False
@@ -64,6 +64,9 @@ def main():
                         default=[], help='External Code Names to ignore')
     parser.add_argument('--charset', '-s', choices=(
         'b', 'e'), help='Specify X12 character set: b=basic, e=extended')
+    parser.add_argument('--level', action='store', dest="validation_level", default=None,
+                        choices=pyx12.params.VALIDATION_LEVELS[1:],
+                        help='Validation level, from the fewest checks to all (default full)')
     #parser.add_argument('--background', '-b', action='store_true')
     #parser.add_argument('--test', '-t', action='store_true')
     parser.add_argument('--version', action='version', version='{prog} {version}'.format(prog=parser.prog, version=__version__))
@@ -90,6 +93,8 @@ def main():
     param.set('exclude_external_codes', ','.join(args.exclude_external))
     if args.map_path:
         param.set('map_path', args.map_path)
+    if args.validation_level:
+        param.set('validation_level', args.validation_level)
 
     if args.logfile:
         try:
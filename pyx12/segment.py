@@ -24,10 +24,64 @@ from pyx12.errors import EngineError
 
 rec_seg_id = re.compile('^[A-Z][A-Z0-9]{1,2}$', re.S)
 
+REFDES_CACHE_SIZE = 1024
+# ref_des string -> (seg_id, ele_idx, subele_idx)
+_refdes_cache = {}
+
+_dialects = {}
+
+
+class Dialect(object):
+    """
+    Holds a set of X12 terminators.  Instances are shared by every segment
+    using the same terminators, and must not be altered.
+    """
+    __slots__ = ('seg_term', 'ele_term', 'subele_term', 'repetition_term')
+
+    def __init__(self, seg_term, ele_term, subele_term, repetition_term):
+        self.seg_term = seg_term
+        self.ele_term = ele_term
+        self.subele_term = subele_term
+        self.repetition_term = repetition_term
+
+    def __repr__(self):
+        """
+        @rtype: string
+        """
+        return 'Dialect(%r, %r, %r, %r)' % (self.seg_term, self.ele_term,
+                                            self.subele_term, self.repetition_term)
+
+    def replace(self, **kwargs):
+        """
+        @return: The shared dialect with the given terminators changed
+        @rtype: L{segment.Dialect}
+        """
+        terms = dict(seg_term=self.seg_term, ele_term=self.ele_term,
+                     subele_term=self.subele_term, repetition_term=self.repetition_term)
+        terms.update(kwargs)
+        return get_dialect(**terms)
+
+
+def get_dialect(seg_term, ele_term, subele_term, repetition_term='^'):
+    """
+    Get the shared dialect for a set of terminators
+
+    @rtype: L{segment.Dialect}
+    """
+    key = (seg_term, ele_term, subele_term, repetition_term)
+    try:
+        return _dialects[key]
+    except KeyError:
+        dialect = Dialect(seg_term, ele_term, subele_term, repetition_term)
+        _dialects[key] = dialect
+        return dialect
+
+
 class Element(object):
     """
     Holds a simple element, which is just a simple string.
     """
+    __slots__ = ('value',)
 
     def __init__(self, ele_str):
         """
@@ -117,7 +171,7 @@ class Composite(object):
     Can be a simple element or a composite.
     A simple element is treated as a composite element with one sub-element.
     """
-    # Attributes:
+    __slots__ = ('subele_term', 'subele_term_orig', 'elements')
 
     # Operations
     def __init__(self, ele_str, subele_term=None):
@@ -250,20 +304,16 @@ class Composite(object):
 class Segment(object):
     """
     Encapsulates a X12 segment.  Contains composites.
+
+    The terminators are held in a shared L{segment.Dialect}.
     """
-    # Attributes:
+    __slots__ = ('seg_id', 'elements', '_dialect', '_dialect_orig')
 
     # Operations
     def __init__(self, seg_str, seg_term, ele_term, subele_term, repetition_term='^'):
         """
         """
-        self.seg_term = seg_term
-        self.seg_term_orig = seg_term
-        self.ele_term = ele_term
-        self.ele_term_orig = ele_term
-        self.subele_term = subele_term
-        self.subele_term_orig = subele_term
-        self.repetition_term = repetition_term
+        self._dialect = self._dialect_orig = get_dialect(seg_term, ele_term, subele_term, repetition_term)
         self.seg_id = None
         self.elements = []
         if seg_str is None or seg_str == '':
@@ -350,13 +400,20 @@ class Segment(object):
         @raise EngineError: If the given ref_des does not match the segment ID
             or if the indexes are not valid integers
         """
-        xp = pyx12.path.X12Path(ref_des)
-        if xp.seg_id is not None and xp.seg_id != self.seg_id:
+        try:
+            (seg_id, ele_idx, comp_idx) = _refdes_cache[ref_des]
+        except KeyError:
+            xp = pyx12.path.X12Path(ref_des)
+            seg_id = xp.seg_id
+            ele_idx = xp.ele_idx - 1 if xp.ele_idx is not None else None
+            comp_idx = xp.subele_idx - 1 if xp.subele_idx is not None else None
+            if len(_refdes_cache) >= REFDES_CACHE_SIZE:
+                _refdes_cache.clear()
+            _refdes_cache[ref_des] = (seg_id, ele_idx, comp_idx)
+        if seg_id is not None and seg_id != self.seg_id:
             err_str = 'Invalid Reference Designator: %s, seg_id: %s' \
                 % (ref_des, self.seg_id)
             raise EngineError(err_str)
-        ele_idx = xp.ele_idx - 1 if xp.ele_idx is not None else None
-        comp_idx = xp.subele_idx - 1 if xp.subele_idx is not None else None
         return (ele_idx, comp_idx)
 
     def get(self, ref_des):
@@ -367,21 +424,43 @@ class Segment(object):
         @rtype: L{segment.Composite}
         """
         (ele_idx, comp_idx) = self._parse_refdes(ref_des)
+        return self.get_at(ele_idx, comp_idx)
+
+    def get_at(self, ele_idx, subele_idx=None):
+        """
+        @param ele_idx: zero based element index
+        @type ele_idx: int
+        @param subele_idx: zero based sub-element index
+        @type subele_idx: int
+        @return: Element or Composite
+        @rtype: L{segment.Composite}
+        """
         if ele_idx >= self.__len__():
             return None
-        if comp_idx is None:
+        if subele_idx is None:
             return self.elements[ele_idx]
         else:
-            if comp_idx >= self.elements[ele_idx].__len__():
+            if subele_idx >= self.elements[ele_idx].__len__():
                 return None
-            return self.elements[ele_idx][comp_idx]
+            return self.elements[ele_idx][subele_idx]
 
     def get_value(self, ref_des):
         """
         @param ref_des: X12 Reference Designator
         @type ref_des: string
         """
-        comp1 = self.get(ref_des)
+        (ele_idx, comp_idx) = self._parse_refdes(ref_des)
+        return self.get_value_at(ele_idx, comp_idx)
+
+    def get_value_at(self, ele_idx, subele_idx=None):
+        """
+        @param ele_idx: zero based element index
+        @type ele_idx: int
+        @param subele_idx: zero based sub-element index
+        @type subele_idx: int
+        @rtype: string
+        """
+        comp1 = self.get_at(ele_idx, subele_idx)
         if comp1 is None:
             return None
         else:
@@ -453,21 +532,36 @@ class Segment(object):
         @param seg_term: Segment terminator
         @type seg_term: string
         """
-        self.seg_term = seg_term
+        self._dialect = self._dialect.replace(seg_term=seg_term)
 
     def set_ele_term(self, ele_term):
         """
         @param ele_term: Element terminator
         @type ele_term: string
         """
-        self.ele_term = ele_term
+        self._dialect = self._dialect.replace(ele_term=ele_term)
 
     def set_subele_term(self, subele_term):
         """
         @param subele_term: Sub-element terminator
         @type subele_term: string
         """
-        self.subele_term = subele_term
+        self._dialect = self._dialect.replace(subele_term=subele_term)
+
+    def set_repetition_term(self, repetition_term):
+        """
+        @param repetition_term: Repetition terminator
+        @type repetition_term: string
+        """
+        self._dialect = self._dialect.replace(repetition_term=repetition_term)
+
+    seg_term = property(lambda self: self._dialect.seg_term, set_seg_term)
+    ele_term = property(lambda self: self._dialect.ele_term, set_ele_term)
+    subele_term = property(lambda self: self._dialect.subele_term, set_subele_term)
+    repetition_term = property(lambda self: self._dialect.repetition_term, set_repetition_term)
+    seg_term_orig = property(lambda self: self._dialect_orig.seg_term)
+    ele_term_orig = property(lambda self: self._dialect_orig.ele_term)
+    subele_term_orig = property(lambda self: self._dialect_orig.subele_term)
 
     def format(self, seg_term=None, ele_term=None, subele_term=None):
         """
@@ -521,6 +615,13 @@ class Segment(object):
                 return False
         return True
 
+    def get_element_presence(self):
+        """
+        @return: For each element, True if it has a value
+        @rtype: list[boolean]
+        """
+        return [not ele.is_empty() for ele in self.elements]
+
     def is_seg_id_valid(self):
         """
         Is the Segment identifier valid?
@@ -541,3 +642,150 @@ class Segment(object):
 
     def __copy__(self):
         return Segment(self.format(), self.seg_term, self.ele_term, self.subele_term)
+
+
+class LazySegment(Segment):
+    """
+    Encapsulates a X12 segment.  Keeps the raw element strings and only
+    creates the Composite and Element instances when they are first needed.
+
+    Reading the segment ID, the length, or element values does not build
+    the element objects.
+    """
+    __slots__ = ('_elements', '_ele_strs')
+
+    def __init__(self, seg_str, seg_term, ele_term, subele_term, repetition_term='^'):
+        """
+        """
+        self._dialect = self._dialect_orig = get_dialect(seg_term, ele_term, subele_term, repetition_term)
+        self.seg_id = None
+        self._elements = []
+        self._ele_strs = None
+        if seg_str is None or seg_str == '':
+            return
+        if seg_str[-1] == seg_term:
+            elems = seg_str[:-1].split(ele_term)
+        else:
+            elems = seg_str.split(ele_term)
+        self.seg_id = elems[0]
+        self._elements = None
+        self._ele_strs = elems[1:]
+
+    def __getstate__(self):
+        # Pickle the raw state; the elements property must not be touched
+        return (None, {'seg_id': self.seg_id, '_dialect': self._dialect,
+                       '_dialect_orig': self._dialect_orig,
+                       '_elements': self._elements, '_ele_strs': self._ele_strs})
+
+    def _get_elements(self):
+        """
+        @return: list of composites, created on first use
+        @rtype: list[L{segment.Composite}]
+        """
+        if self._elements is None:
+            if self.seg_id == 'ISA':
+                #Special handling for ISA segment
+                #guarantee subele_term will not be matched
+                subele_term = self.ele_term_orig
+            else:
+                subele_term = self.subele_term_orig
+            self._elements = [Composite(ele, subele_term) for ele in self._ele_strs]
+            self._ele_strs = None
+        return self._elements
+
+    def _set_elements(self, elements):
+        self._elements = elements
+        self._ele_strs = None
+
+    elements = property(_get_elements, _set_elements)
+
+    def _raw_subele_term(self):
+        """
+        @return: the sub-element terminator used to split the raw element strings
+        @rtype: string
+        """
+        if self.seg_id == 'ISA':
+            return self.ele_term_orig
+        return self.subele_term_orig
+
+    def __len__(self):
+        """
+        @rtype: int
+        """
+        if self._ele_strs is not None:
+            return len(self._ele_strs)
+        return len(self._elements)
+
+    def get_value_at(self, ele_idx, subele_idx=None):
+        """
+        @param ele_idx: zero based element index
+        @type ele_idx: int
+        @param subele_idx: zero based sub-element index
+        @type subele_idx: int
+        @rtype: string
+        """
+        if self._ele_strs is None or ele_idx is None:
+            return Segment.get_value_at(self, ele_idx, subele_idx)
+        if ele_idx >= len(self._ele_strs):
+            return None
+        ele_str = self._ele_strs[ele_idx]
+        subele_term = self._raw_subele_term()
+        if subele_idx is None:
+            return ele_str.rstrip(subele_term)
+        members = ele_str.split(subele_term)
+        if subele_idx >= len(members):
+            return None
+        return members[subele_idx]
+
+    def is_empty(self):
+        """
+        @rtype: boolean
+        """
+        if self._ele_strs is None:
+            return Segment.is_empty(self)
+        subele_term = self._raw_subele_term()
+        for ele_str in self._ele_strs:
+            if ele_str.strip(subele_term) != '':
+                return False
+        return True
+
+    def get_element_presence(self):
+        """
+        @return: For each element, True if it has a value
+        @rtype: list[boolean]
+        """
+        if self._ele_strs is None:
+            return Segment.get_element_presence(self)
+        subele_term = self._raw_subele_term()
+        return [ele_str.strip(subele_term) != '' for ele_str in self._ele_strs]
+
+    def format(self, seg_term=None, ele_term=None, subele_term=None):
+        """
+        @rtype: string
+        @raise EngineError: If a terminator is None and no default
+        """
+        if self._ele_strs is None:
+            return Segment.format(self, seg_term, ele_term, subele_term)
+        if seg_term is None:
+            seg_term = self.seg_term
+        if ele_term is None:
+            ele_term = self.ele_term
+        if subele_term is None:
+            subele_term = self.subele_term
+        if seg_term is None:
+            raise EngineError('seg_term is None')
+        if ele_term is None:
+            raise EngineError('ele_term is None')
+        if subele_term is None:
+            raise EngineError('subele_term is None')
+        raw_term = self._raw_subele_term()
+        str_elems = [ele_str.rstrip(raw_term) for ele_str in self._ele_strs]
+        # get index of last non-empty element
+        i = 0
+        for i in range(len(str_elems) - 1, -1, -1):
+            if str_elems[i] != '':
+                break
+        str_elems = str_elems[:i + 1]
+        if self.seg_id != 'ISA' and subele_term != raw_term:
+            str_elems = [ele_str.replace(raw_term, subele_term) for ele_str in str_elems]
+        return '%s%s%s%s' % (self.seg_id, ele_term, ele_term.join(str_elems), seg_term)
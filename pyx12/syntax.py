@@ -24,86 +24,87 @@ def is_syntax_valid(seg_data, syn):
     @type syn: list[string]
     @rtype: tuple(boolean, error string)
     """
-    # handle intra-segment dependancies
-    if len(syn) < 3:
-        err_str = 'Syntax string must have at least two comparators (%s)' \
-            % (syntax_str(syn))
-        return (False, err_str)
+    err_str = check_syntax(compile_syntax(syn), seg_data.get_element_presence(),
+                           seg_data.get_seg_id())
+    return (err_str is None, err_str)
+
+
+def compile_syntax(syn):
+    """
+    @param syn: list containing the syntax type, and the indices of elements
+    @type syn: list[string]
+    @return: The syntax type, the zero based element indices, and the syntax
+    @rtype: tuple(string, tuple(int), list)
+    """
+    return (syn[0], tuple([int(s) - 1 for s in syn[1:]]), syn)
 
-    syn_code = syn[0]
-    syn_idx = [int(s) for s in syn[1:]]
 
+def check_syntax(rule, presence, seg_id):
+    """
+    Verifies a segment against a compiled syntax rule.  The error string is
+    only built for a failed rule.
+
+    @param rule: Compiled syntax, from L{compile_syntax}
+    @type rule: tuple
+    @param presence: For each element of the segment, True if it has a value
+    @type presence: list[boolean]
+    @param seg_id: Segment ID
+    @type seg_id: string
+    @return: The error string, or None if valid
+    @rtype: string
+    """
+    (syn_code, syn_idx, syn) = rule
+    # handle intra-segment dependancies
+    if len(syn_idx) < 2:
+        return 'Syntax string must have at least two comparators (%s)' \
+            % (syntax_str(syn))
+    ele_count = len(presence)
     if syn_code == 'P':
-        count = 0
-        for s in syn_idx:
-            if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
-                count += 1
+        count = len([i for i in syn_idx if i < ele_count and presence[i]])
         if count != 0 and count != len(syn_idx):
-            err_str = 'Syntax Error (%s): If any of %s is present, then all are required'\
-                % (syntax_str(syn), syntax_ele_id_str(seg_data.get_seg_id(), syn_idx))
-            return (False, err_str)
-        else:
-            return (True, None)
+            return 'Syntax Error (%s): If any of %s is present, then all are required'\
+                % (syntax_str(syn), syntax_ele_id_str(seg_id, [i + 1 for i in syn_idx]))
+        return None
     elif syn_code == 'R':
-        count = 0
-        for s in syn_idx:
-            if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
-                count += 1
-        if count == 0:
-            err_str = 'Syntax Error (%s): At least one element is required' % \
-                (syntax_str(syn))
-            return (False, err_str)
-        else:
-            return (True, None)
+        for i in syn_idx:
+            if i < ele_count and presence[i]:
+                return None
+        return 'Syntax Error (%s): At least one element is required' % \
+            (syntax_str(syn))
     elif syn_code == 'E':
-        count = 0
-        for s in syn_idx:
-            if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
-                count += 1
+        count = len([i for i in syn_idx if i < ele_count and presence[i]])
         if count > 1:
-            err_str = 'Syntax Error (%s): At most one of %s may be present'\
-                % (syntax_str(syn), syntax_ele_id_str(seg_data.get_seg_id(), syn_idx))
-            return (False, err_str)
-        else:
-            return (True, None)
+            return 'Syntax Error (%s): At most one of %s may be present'\
+                % (syntax_str(syn), syntax_ele_id_str(seg_id, [i + 1 for i in syn_idx]))
+        return None
     elif syn_code == 'C':
         # If the first is present, then all others are required
-        if len(seg_data) >= syn_idx[0] and seg_data.get_value('%02i' % (syn_idx[0])) != '':
-            count = 0
-            for s in syn_idx[1:]:
-                if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
-                    count += 1
-            if count != len(syn_idx) - 1:
-                if len(syn_idx[1:]) > 1: verb = 'are'
-                else:
-                    verb = 'is'
-                err_str = 'Syntax Error (%s): If %s%02i is present, then %s %s required'\
-                    % (syntax_str(syn), seg_data.get_seg_id(), syn_idx[0],
-                       syntax_ele_id_str(seg_data.get_seg_id(), syn_idx[1:]), verb)
-                return (False, err_str)
-            else:
-                return (True, None)
-        else:
-            return (True, None)
+        first = syn_idx[0]
+        if first < ele_count and presence[first]:
+            for i in syn_idx[1:]:
+                if i >= ele_count or not presence[i]:
+                    if len(syn_idx) > 2:
+                        verb = 'are'
+                    else:
+                        verb = 'is'
+                    return 'Syntax Error (%s): If %s%02i is present, then %s %s required'\
+                        % (syntax_str(syn), seg_id, first + 1,
+                           syntax_ele_id_str(seg_id, [j + 1 for j in syn_idx[1:]]), verb)
+        return None
     elif syn_code == 'L':
-        if len(seg_data) > syn_idx[0] - 1 and seg_data.get_value('%02i' % (syn_idx[0])) != '':
-            count = 0
-            for s in syn_idx[1:]:
-                if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
-                    count += 1
-            if count == 0:
-                err_str = 'Syntax Error (%s): If %s%02i is present, then at least one of '\
-                    % (syntax_str(syn), seg_data.get_seg_id(), syn_idx[0])
-                err_str += syntax_ele_id_str(
-                    seg_data.get_seg_id(), syn_idx[1:])
-                err_str += ' is required'
-                return (False, err_str)
-            else:
-                return (True, None)
-        else:
-            return (True, None)
+        first = syn_idx[0]
+        if first < ele_count and presence[first]:
+            for i in syn_idx[1:]:
+                if i < ele_count and presence[i]:
+                    return None
+            err_str = 'Syntax Error (%s): If %s%02i is present, then at least one of '\
+                % (syntax_str(syn), seg_id, first + 1)
+            err_str += syntax_ele_id_str(seg_id, [i + 1 for i in syn_idx[1:]])
+            err_str += ' is required'
+            return err_str
+        return None
     #raise EngineError
-    return (False, 'Syntax Type %s Not Found' % (syntax_str(syn)))
+    return 'Syntax Type %s Not Found' % (syntax_str(syn))
 
 
 def syntax_str(syntax):
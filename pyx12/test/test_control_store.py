@@ -0,0 +1,133 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+try:
+    from StringIO import StringIO
+except:
+    from io import StringIO
+
+import pyx12.control_store
+import pyx12.errors
+import pyx12.params
+import pyx12.x12envelope
+import pyx12.x12file
+import pyx12.x12n_document
+from pyx12.test.x12testdata import datafiles
+
+
+class ControlStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.store = pyx12.control_store.ControlNumberStore(os.path.join(self.tmp_path, 'ids.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_path)
+
+    def _read(self, source):
+        src = pyx12.x12file.X12Reader(StringIO(source), self.store)
+        errors = []
+        for seg in src:
+            errors.extend(src.pop_errors())
+        src.cleanup()
+        errors.extend(src.pop_errors())
+        return errors
+
+
+class Store(ControlStoreTestCase):
+
+    def test_find_add(self):
+        key = ('ISA', 'ZZ000', 'ZZ001', '000010121')
+        self.assertEqual(self.store.find(key), None)
+        self.store.add([key, key], 'a.txt')
+        self.assertEqual(self.store.find(key)[0], 'a.txt')
+        self.store.add([key], 'b.txt')
+        self.assertEqual(self.store.find(key)[0], 'a.txt')
+        self.assertEqual(self.store.find(('ISA', 'ZZ000', 'ZZ002', '000010121')), None)
+
+    def test_persistent(self):
+        key = ('GS', 'ZZ000', 'ZZ001', '17')
+        self.store.add([key], 'a.txt')
+        self.store.close()
+        self.store = pyx12.control_store.ControlNumberStore(os.path.join(self.tmp_path, 'ids.db'))
+        self.assertEqual(self.store.find(key)[0], 'a.txt')
+
+    def test_claim(self):
+        key = ('ISA', 'ZZ000', 'ZZ001', '000010121')
+        self.assertEqual(self.store.claim(key, 'a.txt'), None)
+        self.assertEqual(self.store.claim(key, 'b.txt')[0], 'a.txt')
+        self.assertEqual(self.store.find(key)[0], 'a.txt')
+
+    def test_claim_two_stores(self):
+        key = ('GS', 'ZZ000', 'ZZ001', '17')
+        other = pyx12.control_store.ControlNumberStore(os.path.join(self.tmp_path, 'ids.db'))
+        try:
+            self.assertEqual(other.claim(key, 'a.txt'), None)
+            self.assertEqual(self.store.claim(key, 'b.txt')[0], 'a.txt')
+            self.assertEqual(self.store.claim_all([key, key], 'c.txt')[key][0], 'a.txt')
+        finally:
+            other.close()
+
+    def test_check_envelopes(self):
+        isas = pyx12.x12envelope.scan_envelopes(StringIO(datafiles['multiple_trn']['source']))
+        self.assertEqual(self.store.check_envelopes(isas, 'a.txt'), {})
+        found = self.store.check_envelopes(isas, 'b.txt')
+        self.assertEqual(len(found), 4)
+        self.assertEqual(found[('ISA', 'ZZ000', 'ZZ001', '000010121')][0], 'a.txt')
+
+
+class Reader(ControlStoreTestCase):
+
+    def test_repeated_file(self):
+        source = datafiles['simple_837p']['source']
+        self.assertEqual(self._read(source), [])
+        errors = self._read(source)
+        self.assertEqual([(x[0], x[1]) for x in errors], [('isa', '025'), ('gs', '6')])
+
+    def test_within_file(self):
+        source = datafiles['mult_isa']['source']
+        errors = self._read(source)
+        self.assertEqual([x[1] for x in errors if x[0] == 'isa'], [])
+        self.assertEqual(len(self.store.find_all(pyx12.control_store.get_envelope_keys(
+            pyx12.x12envelope.scan_envelopes(StringIO(source))))), 7)
+
+
+class Document(ControlStoreTestCase):
+    def setUp(self):
+        ControlStoreTestCase.setUp(self)
+        self.param = pyx12.params.params()
+        self.param.set('control_store', os.path.join(self.tmp_path, 'ids.db'))
+        self.closed = []
+        self.close = pyx12.control_store.ControlNumberStore.close
+
+        def close(store):
+            self.closed.append(store.filename)
+            self.close(store)
+        pyx12.control_store.ControlNumberStore.close = close
+
+    def tearDown(self):
+        pyx12.control_store.ControlNumberStore.close = self.close
+        ControlStoreTestCase.tearDown(self)
+
+    def test_closed(self):
+        self.assertTrue(pyx12.x12n_document.x12n_document(
+            self.param, StringIO(datafiles['simple_837p']['source']), None, None, None))
+        self.assertEqual(len(self.closed), 1)
+
+    def test_closed_not_x12(self):
+        self.assertFalse(pyx12.x12n_document.x12n_document(
+            self.param, StringIO('not an X12 file'), None, None, None))
+        self.assertEqual(len(self.closed), 1)
+
+    def test_closed_on_error(self):
+        source = datafiles['simple_837p']['source'].replace('*HC*', '*XX*')
+        self.assertRaises(pyx12.errors.EngineError, pyx12.x12n_document.x12n_document,
+                          self.param, StringIO(source), None, None, None)
+        self.assertEqual(len(self.closed), 1)
+
+    def test_closed_parallel(self):
+        self.param.set('workers', 2)
+        self.assertFalse(pyx12.x12n_document.x12n_document(
+            self.param, StringIO('not an X12 file'), None, None, None))
+        self.assertEqual(len(self.closed), 1)
@@ -0,0 +1,166 @@
+import json
+import logging
+import unittest
+try:
+    from StringIO import StringIO
+except:
+    from io import StringIO
+
+import pyx12.error_handler
+import pyx12.error_sink
+import pyx12.params
+import pyx12.x12context
+import pyx12.x12file
+import pyx12.x12n_document
+from pyx12.errors import EngineError
+from pyx12.test.x12testdata import datafiles
+
+
+class ErrorSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.param = pyx12.params.params()
+        logger = logging.getLogger('pyx12')
+        self.hdlr = logging.NullHandler()
+        logger.addHandler(self.hdlr)
+
+    def tearDown(self):
+        logging.getLogger('pyx12').removeHandler(self.hdlr)
+
+    def _validate(self, datakey, error_sinks, fd_997=None):
+        fd_source = StringIO(datafiles[datakey]['source'])
+        return pyx12.x12n_document.x12n_document(self.param, fd_source, fd_997, None,
+                                                 None, error_sinks=error_sinks)
+
+
+class Events(ErrorSinkTestCase):
+
+    def test_element_events(self):
+        events = []
+        self.assertFalse(self._validate('elements', [events.append]))
+        self.assertEqual([x['err_type'] for x in events], ['ele'] * 8 + ['st'])
+        event = events[3]
+        self.assertEqual((event['err_cde'], event['err_val'], event['line']), ('5', 'MIM', 17))
+        self.assertEqual((event['seg_id'], event['seg_count'], event['ele_pos'], event['refdes']),
+                         ('NM1', 15, 8, '66'))
+        self.assertEqual((event['isa_id'], event['gs_id'], event['st_id']),
+                         ('000000288', '56', '000000001'))
+        self.assertEqual(events[7]['subele_pos'], 1)
+
+    def test_same_with_997(self):
+        events = []
+        self._validate('trailer_errors', [events.append])
+        events_997 = []
+        self._validate('trailer_errors', [events_997.append], StringIO())
+        self.assertEqual(events, events_997)
+
+    def test_type_filter(self):
+        counter = pyx12.error_sink.ErrorCounter()
+        self._validate('trailer_errors', [pyx12.error_sink.TypeFilter(counter, ['isa', 'gs'])])
+        self.assertEqual(counter.total, 3)
+        self.assertEqual(counter.get_count('isa'), 2)
+        self.assertEqual(counter.get_count('isa', '021'), 1)
+        self.assertEqual(counter.get_count(err_cde='4'), 1)
+
+    def test_json_lines(self):
+        fd = StringIO()
+        self._validate('bad_header_looping', [pyx12.error_sink.JsonLinesWriter(fd)])
+        lines = fd.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        event = json.loads(lines[0])
+        self.assertIn('err_cde', event)
+        self.assertIn('seg_count', event)
+
+
+class DropClosedST(ErrorSinkTestCase):
+
+    def _read(self, keep_tree):
+        errh = pyx12.error_handler.err_handler(keep_tree)
+        src = pyx12.x12file.X12Reader(StringIO(datafiles['multiple_trn']['source']))
+        for seg in src:
+            seg_id = seg.get_seg_id()
+            if seg_id == 'ISA':
+                errh.add_isa_loop(seg, src)
+            elif seg_id == 'GS':
+                errh.add_gs_loop(seg, src)
+            elif seg_id == 'ST':
+                errh.add_st_loop(seg, src)
+                if src.get_st_id() != '0001':
+                    errh.st_error('5', 'Test error')
+            elif seg_id == 'SE':
+                errh.close_st_loop(None, seg, src)
+            elif seg_id == 'GE':
+                errh.close_gs_loop(None, seg, src)
+            elif seg_id == 'IEA':
+                errh.close_isa_loop(None, seg, src)
+        return errh
+
+    def test_counts_kept(self):
+        errh = self._read(True)
+        errh_dropped = self._read(False)
+        gs = errh.children[0].children[0]
+        gs_dropped = errh_dropped.children[0].children[0]
+        self.assertEqual(len(gs.children), 3)
+        self.assertEqual(gs_dropped.children, [])
+        self.assertEqual(errh_dropped.get_error_count(), errh.get_error_count())
+        self.assertEqual(gs_dropped.count_failed_st(), 3)
+        self.assertEqual(gs_dropped.ack_code, 'R')
+        self.assertEqual(errh_dropped.cur_gs_node.ack_code, 'A')
+
+    def test_result_without_997(self):
+        self.assertFalse(self._validate('elements', []))
+        self.assertTrue(self._validate('simple_837p', []))
+
+    def test_closed_groups_released(self):
+        errh = pyx12.error_handler.err_handler()
+        groups = []
+        errh.add_group_callback(groups.append)
+        src = pyx12.x12file.X12Reader(StringIO(datafiles['multiple_trn']['source']))
+        for seg in src:
+            seg_id = seg.get_seg_id()
+            if seg_id == 'ISA':
+                errh.add_isa_loop(seg, src)
+            elif seg_id == 'GS':
+                errh.add_gs_loop(seg, src)
+            elif seg_id == 'ST':
+                errh.add_st_loop(seg, src)
+                errh.st_error('5', 'Test error')
+            elif seg_id == 'GE':
+                errh.close_gs_loop(None, seg, src)
+        # The last group can still get errors
+        self.assertEqual([x.gs_control_num for x in groups], ['17', '18'])
+        self.assertEqual(len(errh.cur_isa_node.children), 1)
+        self.assertEqual(errh.get_error_count(), 5)
+
+
+class ContextReaderCallback(ErrorSinkTestCase):
+
+    def test_callback(self):
+        events = []
+        src = pyx12.x12context.X12ContextReader(self.param, None,
+                                                StringIO(datafiles['bad_header_looping']['source']))
+        src.register_error_callback(events.append, 'seg')
+        for datatree in src.iter_segments():
+            pass
+        self.assertEqual([(x['seg_id'], x['line']) for x in events],
+                         [('N1', 41), ('N3', 42), ('N4', 43), ('N1', 44)])
+        self.assertEqual(events[0]['err_cde'], '1')
+
+    def test_bad_type(self):
+        src = pyx12.x12context.X12ContextReader(self.param, None,
+                                                StringIO(datafiles['elements']['source']))
+        self.assertRaises(EngineError, src.register_error_callback, len, 'loop')
+
+    def test_validation_level(self):
+        events = []
+        self.param.set('validation_level', 'elements')
+        src = pyx12.x12context.X12ContextReader(self.param, None,
+                                                StringIO(datafiles['elements']['source']))
+        src.register_error_callback(events.append, 'ele')
+        for datatree in src.iter_segments():
+            pass
+        self.assertEqual(sorted([x['err_cde'] for x in events]), ['5'] + ['7'] * 6)
+
+    def test_envelope_level(self):
+        self.param.set('validation_level', 'envelope')
+        self.assertRaises(EngineError, pyx12.x12context.X12ContextReader, self.param, None,
+                          StringIO(datafiles['elements']['source']))
@@ -332,6 +332,44 @@ class ElementIsValid(unittest.TestCase):
         self.assertEqual(self.errh.err_cde, '1')
 
 
+class ElementValidator(unittest.TestCase):
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837.4010.X098.A1.xml', param)
+        self.node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/CLM')
+        self.errh = pyx12.error_handler.errh_null()
+
+    def test_compiled_once(self):
+        node = self.node.get_child_node_by_idx(4).get_child_node_by_idx(0)
+        self.assertEqual(node._validator, None)
+        self.assertTrue(node.is_valid(pyx12.segment.Element('11'), self.errh))
+        validator = node._validator
+        self.assertFalse(node.is_valid(pyx12.segment.Element('1'), self.errh))
+        self.assertTrue(node._validator is validator)
+
+    def test_error_strings(self):
+        node = self.node.get_child_node_by_idx(1)
+        self.assertFalse(node.is_valid(pyx12.segment.Element('5.a'), self.errh))
+        self.assertEqual(self.errh.err_cde, '6')
+        self.assertEqual(self.errh.err_str,
+                         'Data element "Total Claim Charge Amount" (CLM02) is type R, contains an invalid character(5.a)')
+        node = self.node.get_child_node_by_idx(4).get_child_node_by_idx(0)
+        self.assertFalse(node.is_valid(pyx12.segment.Element('XX'), self.errh))
+        self.assertEqual(self.errh.err_cde, '7')
+        self.assertEqual(self.errh.err_str,
+                         '(XX) is not a valid code for Facility Type Code (CLM05-01)')
+
+    def test_not_pickled(self):
+        import pickle
+        node = self.node.get_child_node_by_idx(1)
+        node.is_valid(pyx12.segment.Element('1'), self.errh)
+        map2 = pickle.loads(pickle.dumps(self.map, 2))
+        node2 = map2.getnodebypath(self.node.get_path()).get_child_node_by_idx(1)
+        self.assertEqual(node2.id, 'CLM02')
+        self.assertEqual(node2._validator, None)
+
+
 class GetNodeByPath(unittest.TestCase):
     def setUp(self):
         self.param = pyx12.params.params()
@@ -688,6 +726,25 @@ class MatchSegmentQual(unittest.TestCase):
         seg_data = pyx12.segment.Segment('REF*EI*5555~', '~', '*', ':')
         self.assertTrue(node.is_match_qual(seg_data, 'REF', 'EI'))
 
+    def test_match_qual_bad(self):
+        node = self.node.getnodebypath('DTP[435]')
+        seg_data = pyx12.segment.Segment('DTP*096*TM*1200~', '~', '*', ':')
+        self.assertFalse(node.is_match_qual(seg_data, 'DTP', '096'))
+        self.assertFalse(node.is_match_qual(seg_data, 'DTP', '435'))
+        self.assertFalse(node.is_match_qual(seg_data, 'REF', None))
+
+    def test_match_hl(self):
+        node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/HL')
+        self.assertTrue(node.is_match(pyx12.segment.Segment('HL*2*1*22*0~', '~', '*', ':')))
+        self.assertFalse(node.is_match(pyx12.segment.Segment('HL*1**20*1~', '~', '*', ':')))
+        self.assertTrue(node.is_match_qual(pyx12.segment.Segment('HL*2*1*22*0~', '~', '*', ':'), 'HL', '22'))
+        self.assertEqual(node.guess_unique_key_id_element(), node.children[2])
+
+    def test_unique_key_composite(self):
+        node = self.node.getnodebypath('HI')
+        self.assertEqual(node.guess_unique_key_id_element(), node.children[0].children[0])
+
 
 class X12Path(unittest.TestCase):
     def setUp(self):
@@ -766,3 +823,73 @@ class SegmentChildrenOrdinalMapPath(unittest.TestCase):
         for c in self.node.children:
             self.assertEqual(i, c.seq)
             i += 1
+
+
+class MapCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.cache_path = tempfile.mkdtemp()
+        self.param = pyx12.params.params()
+        self.param.set('map_cache_path', self.cache_path)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.cache_path)
+
+    def test_cache_hit(self):
+        import os
+        map1 = pyx12.map_if.load_map_file('999.5010.xml', self.param)
+        self.assertEqual(len(os.listdir(self.cache_path)), 1)
+        map2 = pyx12.map_if.load_map_file('999.5010.xml', self.param)
+        self.assertFalse(map1 is map2)
+        self.assertTrue(map2.param is self.param)
+        mypath = '/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/2000/2100/IK3'
+        node1 = map1.getnodebypath(mypath)
+        node2 = map2.getnodebypath(mypath)
+        self.assertEqual(node1.get_path(), node2.get_path())
+        self.assertEqual([c.id for c in node1.children],
+                         [c.id for c in node2.children])
+        self.assertTrue(node2.get_parent().get_parent() is
+                        map2.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/2000'))
+
+    def test_changed_source(self):
+        import os
+        import shutil
+        import tempfile
+        src_path = os.path.join(os.path.dirname(pyx12.codes.__file__), 'map')
+        map_path = tempfile.mkdtemp()
+        try:
+            for name in ('999.5010.xml', 'codes.xml', 'dataele.xml', 'maps.xml'):
+                shutil.copy(os.path.join(src_path, name), map_path)
+            pyx12.map_if.load_map_file('999.5010.xml', self.param, map_path)
+            with open(os.path.join(map_path, 'codes.xml'), 'a') as fd:
+                fd.write('\n')
+            pyx12.map_if.load_map_file('999.5010.xml', self.param, map_path)
+            self.assertEqual(len(os.listdir(self.cache_path)), 2)
+        finally:
+            shutil.rmtree(map_path)
+
+
+class SegmentIdIndex(unittest.TestCase):
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837.4010.X098.A1.xml', param)
+
+    def test_candidate_loops(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300')
+        ids = [node.child_nodes[i].id for i in node.get_candidate_idx('NM1')]
+        self.assertEqual(ids, ['2310A', '2310B', '2310C', '2310D', '2310E'])
+        self.assertEqual(node.get_candidate_idx('ZZZ'), ())
+
+    def test_candidate_segments(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300')
+        for i in node.get_candidate_idx('DTP'):
+            self.assertTrue(node.child_nodes[i].is_segment())
+            self.assertEqual(node.child_nodes[i].id, 'DTP')
+
+    def test_first_seg_ids(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL')
+        self.assertEqual(node.first_seg_ids, frozenset(['HL']))
+        self.assertTrue(node.reports_missing)
+        ids = [node.child_nodes[i].id for i in node.missing_child_idx]
+        self.assertEqual(ids, ['2000A'])
@@ -0,0 +1,58 @@
+import threading
+import unittest
+
+import pyx12.map_registry
+import pyx12.params
+
+
+class SharedMaps(unittest.TestCase):
+    """
+    """
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.registry = pyx12.map_registry.MapRegistry()
+
+    def test_same_map(self):
+        map1 = self.registry.get_map('999.5010.xml', self.param)
+        map2 = self.registry.get_map('999.5010.xml', pyx12.params.params())
+        self.assertTrue(map1 is map2)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_map_params(self):
+        map1 = self.registry.get_map('999.5010.xml', self.param)
+        param = pyx12.params.params()
+        param.set('charset', 'B')
+        map2 = self.registry.get_map('999.5010.xml', param)
+        self.assertFalse(map1 is map2)
+        self.assertEqual(map2.param.get('charset'), 'B')
+
+    def test_shared_codes(self):
+        map1 = self.registry.get_map('999.5010.xml', self.param)
+        map2 = self.registry.get_map('997.4010.xml', self.param)
+        self.assertTrue(map1.ext_codes is map2.ext_codes)
+        self.assertTrue(map1.data_elements is map2.data_elements)
+
+    def test_warm_up_evict(self):
+        self.registry.warm_up(['999.5010.xml', '997.4010.xml'], self.param)
+        self.assertEqual(len(self.registry), 2)
+        map1 = self.registry.get_map('999.5010.xml', self.param)
+        self.registry.evict('997.4010.xml')
+        self.assertEqual(len(self.registry), 1)
+        self.assertTrue(self.registry.get_map('999.5010.xml', self.param) is map1)
+        self.registry.evict()
+        self.assertEqual(len(self.registry), 0)
+        self.assertFalse(self.registry.get_map('999.5010.xml', self.param) is map1)
+
+    def test_threads(self):
+        maps = []
+
+        def load():
+            maps.append(self.registry.get_map('999.5010.xml', self.param))
+        threads = [threading.Thread(target=load) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(maps), 4)
+        for imap in maps:
+            self.assertTrue(imap is maps[0])
@@ -844,3 +844,124 @@ class Bug837i(unittest.TestCase):
         del self.errh
         del self.map
         del self.walker
+
+
+class WalkPlan(unittest.TestCase):
+
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837.4010.X098.A1.xml', param)
+
+    def test_plan_levels(self):
+        from pyx12.map_walker import get_walk_plan
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/CLM')
+        plan = get_walk_plan(node, 'HL')
+        self.assertEqual([level[0].id for level in plan],
+                         ['2300', '2000B', '2000A', 'DETAIL', 'ST_LOOP', 'GS_LOOP', 'ISA_LOOP', '837'])
+        self.assertTrue(plan[-1][0].is_map_root())
+        self.assertTrue(get_walk_plan(node, 'HL') is plan)
+        (loop_node, steps, trailing) = plan[0]
+        for (skipped, child) in steps:
+            self.assertTrue('HL' in child.first_seg_ids)
+
+    def test_unknown_seg_ids(self):
+        from pyx12.map_walker import get_walk_plan, compile_walk_plan
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/CLM')
+        self.assertTrue('HL' in self.map.seg_ids)
+        self.assertFalse('ZZZ' in self.map.seg_ids)
+        plan = get_walk_plan(node, 'ZZZ')
+        self.assertEqual(plan, compile_walk_plan(node, 'ZZZ'))
+        for seg_id in ('YYY', 'XX1', ''):
+            self.assertTrue(get_walk_plan(node, seg_id) is plan)
+        get_walk_plan(node, 'HL')
+        self.assertEqual(sorted(node.walk_plans.keys()), [None, 'HL'])
+
+    def test_compile_table(self):
+        from pyx12.map_walker import compile_walk_table
+        param = pyx12.params.params()
+        map1 = pyx12.map_if.load_map_file('999.5010.xml', param)
+        compile_walk_table(map1)
+        node = map1.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/2000/AK2')
+        self.assertTrue('IK3' in node.walk_plans)
+        walker = walk_tree()
+        walker.setCountState({node.parent.x12path: 1, node.x12path: 1})
+        errh = pyx12.error_handler.errh_null()
+        seg_data = pyx12.segment.Segment('IK5*A', '~', '*', ':')
+        (node, pop, push) = walker.walk(node, seg_data, errh, 5, 4, None)
+        self.assertEqual(node.id, 'IK5')
+        self.assertEqual(errh.err_cde, None, errh.err_str)
+
+
+class WalkCache(unittest.TestCase):
+
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837.4010.X098.A1.xml', param)
+        self.errh = pyx12.error_handler.errh_null()
+
+    def test_repeat_count(self):
+        walker = walk_tree(cache_size=10)
+        node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/2400')
+        walker.setCountState({
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/2400': 49,
+        })
+        seg_data = pyx12.segment.Segment('LX*50~', '~', '*', ':')
+        (seg_node, pop, push) = walker.walk(node, seg_data, self.errh, 5, 4, None)
+        self.assertEqual(self.errh.err_cde, None, self.errh.err_str)
+        seg_data = pyx12.segment.Segment('LX*51~', '~', '*', ':')
+        (seg_node2, pop2, push2) = walker.walk(node, seg_data, self.errh, 6, 5, None)
+        self.assertEqual(self.errh.err_cde, '4', self.errh.err_str)
+        self.assertTrue(seg_node2 is seg_node)
+        self.assertEqual(get_id_list(pop2), ['2400'])
+        self.assertEqual(get_id_list(push2), ['2400'])
+        self.assertEqual(walker.getCountState()[pyx12.path.X12Path(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/2400')], 51)
+        stats = walker.get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+    def test_missing_replayed(self):
+        walker = walk_tree(cache_size=10)
+        node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/HL')
+        seg_data = pyx12.segment.Segment('NM1*IL*1*Smith*John', '~', '*', ':')
+        walker.setCountState({
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B': 1,
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/HL': 1,
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/SBR': 1,
+        })
+        (seg_node, pop, push) = walker.walk(node, seg_data, self.errh, 5, 4, None)
+        self.assertEqual(self.errh.err_cde, None, self.errh.err_str)
+        walker.setCountState({
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B': 1,
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/HL': 1,
+        })
+        (seg_node2, pop2, push2) = walker.walk(node, seg_data, self.errh, 5, 4, None)
+        self.assertEqual(self.errh.err_cde, '3', self.errh.err_str)
+        self.assertTrue(seg_node2 is seg_node)
+        self.assertEqual(walker.get_cache_stats()['hits'], 1)
+
+    def test_qualifier_signature(self):
+        walker = walk_tree(cache_size=10)
+        node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/CLM')
+        seg_data = pyx12.segment.Segment('DTP*431*D8*20030101', '~', '*', ':')
+        (seg_node1, pop, push) = walker.walk(node, seg_data, self.errh, 5, 4, None)
+        seg_data = pyx12.segment.Segment('DTP*454*D8*20030101', '~', '*', ':')
+        (seg_node2, pop, push) = walker.walk(node, seg_data, self.errh, 6, 5, None)
+        self.assertFalse(seg_node1 is seg_node2)
+        self.assertEqual(walker.get_cache_stats()['misses'], 2)
+
+    def test_bounded_size(self):
+        walker = walk_tree(cache_size=4)
+        node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/2400')
+        for i in range(20):
+            walker.setCountState({})
+            seg_data = pyx12.segment.Segment('LX*%i~' % (i), '~', '*', ':')
+            walker.walk(node, seg_data, self.errh, 5, 4, None)
+            seg_data = pyx12.segment.Segment('REF*%s*1' % (['6R', 'G1', 'EW', 'X4'][i % 4]), '~', '*', ':')
+            walker.walk(node, seg_data, self.errh, 5, 4, None)
+        self.assertTrue(walker.get_cache_stats()['size'] <= 4)
+        walker.clear_cache()
+        self.assertEqual(walker.get_cache_stats()['size'], 0)
@@ -0,0 +1,45 @@
+import unittest
+
+from pyx12.nodeCounter import NodeCounter, get_path_id
+from pyx12.path import X12Path
+
+
+class PathIds(unittest.TestCase):
+    def test_same_id(self):
+        path_id = get_path_id('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]')
+        self.assertEqual(path_id, get_path_id(X12Path('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]')))
+        self.assertEqual(path_id, get_path_id(path_id))
+        counter = NodeCounter()
+        counter.increment(path_id)
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]')
+        self.assertEqual(2, counter.get_count(X12Path('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]')))
+
+
+class ResetSubtree(unittest.TestCase):
+    def test_reset_keeps_siblings(self):
+        counter = NodeCounter()
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/CLP')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/2110/SVC')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/LX')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/LX')
+        counter.reset_to_node('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100')
+        self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100'))
+        self.assertEqual(0, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/CLP'))
+        self.assertEqual(0, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/2110/SVC'))
+        self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/LX'))
+        counter.reset_to_node('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000')
+        self.assertEqual(0, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100'))
+        self.assertEqual(0, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/LX'))
+        self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/LX'))
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/CLP')
+        self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/CLP'))
+
+    def test_state_snapshot(self):
+        counter = NodeCounter({'/ISA_LOOP': 1, '/ISA_LOOP/GS_LOOP': 2})
+        state = counter.getState()
+        counter.increment('/ISA_LOOP/GS_LOOP')
+        counter2 = NodeCounter(state)
+        self.assertEqual(2, counter2.get_count('/ISA_LOOP/GS_LOOP'))
+        self.assertEqual(1, counter2.get_count('/ISA_LOOP'))
+        self.assertEqual(3, counter.get_count('/ISA_LOOP/GS_LOOP'))
@@ -151,6 +151,62 @@ class RawISA_header(X12fileTestCase):
             pyx12.errors.X12Error, pyx12.rawx12file.RawX12File, fd)
 
 
+class RawScanner(X12fileTestCase):
+
+    def setUp(self):
+        self.str1 = 'ISA&00&          &00&          &ZZ&ZZ000          &ZZ&ZZ001          &030828&1128&U&00401&000010121&0&T&!+\r\n'
+        self.str1 += 'GS&HC&ZZ000&ZZ001&20030828&1128&17&X&004010X098+\r\n'
+        self.str1 += 'ST&837&11280001+\n'
+        self.str1 += 'TST&AA!1!1&BB!5+'
+        self.str1 += 'SE&3&11280001+\r'
+        self.str1 += 'GE&1&17+\n\n'
+        self.str1 += 'IEA&1&000010121+\n'
+        self.expected = [
+            'ISA&00&          &00&          &ZZ&ZZ000          &ZZ&ZZ001          &030828&1128&U&00401&000010121&0&T&!',
+            'GS&HC&ZZ000&ZZ001&20030828&1128&17&X&004010X098',
+            'ST&837&11280001',
+            'TST&AA!1!1&BB!5',
+            'SE&3&11280001',
+            'GE&1&17',
+            'IEA&1&000010121',
+        ]
+
+    def test_strip_leading_eol(self):
+        src = pyx12.rawx12file.RawX12File(self._makeFd(self.str1))
+        self.assertEqual(list(src), self.expected)
+
+    def test_small_reads(self):
+        for bufsize in (1, 2, 3, 7, 16):
+            src = pyx12.rawx12file.RawX12File(self._makeFd(self.str1), bufsize)
+            self.assertEqual(list(src), self.expected, 'bufsize=%i' % (bufsize))
+
+    def test_trailing_data_ignored(self):
+        src = pyx12.rawx12file.RawX12File(self._makeFd(self.str1 + 'ISA&00'), 5)
+        self.assertEqual(list(src), self.expected)
+
+    def test_empty_segment_stops(self):
+        str1 = self.str1.replace('ST&837&11280001+', 'ST&837&11280001++')
+        src = pyx12.rawx12file.RawX12File(self._makeFd(str1))
+        self.assertEqual(list(src), self.expected[:3])
+
+    def test_chunks(self):
+        for bufsize in (None, 1, 7, 16):
+            src = pyx12.rawx12file.RawX12File(self._makeFd(self.str1))
+            lines = []
+            for chunk in src.iter_chunks(bufsize):
+                self.assertTrue(len(chunk) > 0)
+                lines.extend(chunk)
+            self.assertEqual(lines, self.expected, 'bufsize=%s' % (bufsize))
+
+    def test_chunks_empty_segment_stops(self):
+        str1 = self.str1.replace('ST&837&11280001+', 'ST&837&11280001++')
+        src = pyx12.rawx12file.RawX12File(self._makeFd(str1))
+        lines = []
+        for chunk in src.iter_chunks(5):
+            lines.extend(chunk)
+        self.assertEqual(lines, self.expected[:3])
+
+
 #class Formatting(unittest.TestCase):
 #    def test_identity(self):
 #        str1 = 'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:~\n'
@@ -378,3 +378,117 @@ class IsaTerminators(unittest.TestCase):
         seg_isa = pyx12.segment.Segment(initial, '~', '*', ':')
         seg_isa.set('ISA16', '\\')
         self.assertMultiLineEqual(seg_isa.format(subele_term='\\'), result)
+
+
+class Lazy(unittest.TestCase):
+
+    def setUp(self):
+        self.seg_strs = [
+            'TST*AA:1:1*BB:5*ZZ',
+            'TST*AA:1:1*BB:5*ZZ~',
+            'TST*AA::*:5*ZZ**:*',
+            'TST',
+            'TST***',
+            'TST*:::*',
+            'ISA*03*SENDER    *01*          *ZZ*SENDER         *ZZ*RECEIVER       *040608*1333*U*00401*000000288*0*P*:~',
+        ]
+        self.ref_des = ['01', '02', '03', '04', '10', '01-1', '01-2', '01-3', '01-4', '02-2', '16']
+
+    def test_same_as_segment(self):
+        for seg_str in self.seg_strs:
+            seg = pyx12.segment.Segment(seg_str, '~', '*', ':')
+            for ref_des in self.ref_des:
+                lazy = pyx12.segment.LazySegment(seg_str, '~', '*', ':')
+                self.assertEqual(lazy.get_value(ref_des), seg.get_value(ref_des), '%s %s' % (seg_str, ref_des))
+            lazy = pyx12.segment.LazySegment(seg_str, '~', '*', ':')
+            self.assertEqual(lazy.get_seg_id(), seg.get_seg_id())
+            self.assertEqual(len(lazy), len(seg))
+            self.assertEqual(lazy.is_empty(), seg.is_empty())
+            self.assertEqual(lazy.format(), seg.format())
+            self.assertEqual(lazy.format('+', '&', '!'), seg.format('+', '&', '!'))
+            self.assertTrue(lazy._elements is None or len(lazy) == 0)
+            self.assertEqual(lazy, seg)
+
+    def test_not_materialized(self):
+        seg = pyx12.segment.LazySegment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        self.assertEqual(seg.get_value('TST02-2'), '5')
+        self.assertEqual(len(seg), 3)
+        self.assertTrue(seg._elements is None)
+        self.assertEqual(seg.get('02').format(), 'BB:5')
+        self.assertFalse(seg._elements is None)
+
+    def test_set(self):
+        seg = pyx12.segment.LazySegment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        seg.set('TST02-2', '6')
+        seg.set('TST05', 'AR')
+        self.assertEqual(seg.format(), 'TST*AA:1:1*BB:6*ZZ**AR~')
+        self.assertEqual(seg.get_value('TST02'), 'BB:6')
+        self.assertEqual(len(seg), 5)
+
+    def test_isa_subele(self):
+        initial = 'ISA*03*SENDER    *01*          *ZZ*SENDER         *ZZ*RECEIVER       *040611*1333*^*00501*000000125*0*P*:~'
+        result = 'ISA*03*SENDER    *01*          *ZZ*SENDER         *ZZ*RECEIVER       *040611*1333*^*00501*000000125*0*P*\~'
+        seg_isa = pyx12.segment.LazySegment(initial, '~', '*', ':')
+        self.assertEqual(seg_isa.get_value('ISA16'), ':')
+        seg_isa.set('ISA16', '\\')
+        self.assertMultiLineEqual(seg_isa.format(subele_term='\\'), result)
+
+
+class SharedDialect(unittest.TestCase):
+
+    def test_shared(self):
+        seg1 = pyx12.segment.Segment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        seg2 = pyx12.segment.LazySegment('TST*AA', '~', '*', ':')
+        self.assertTrue(seg1._dialect is seg2._dialect)
+
+    def test_change_term(self):
+        seg1 = pyx12.segment.Segment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        seg2 = pyx12.segment.Segment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        seg1.set_seg_term('+')
+        seg1.ele_term = '&'
+        self.assertEqual(seg1.format(), 'TST&AA:1:1&BB:5&ZZ+')
+        self.assertEqual(seg1.seg_term_orig, '~')
+        self.assertEqual(seg1.ele_term_orig, '*')
+        self.assertEqual(seg2.format(), 'TST*AA:1:1*BB:5*ZZ~')
+
+    def test_no_instance_dict(self):
+        seg = pyx12.segment.LazySegment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        self.assertFalse(hasattr(seg, '__dict__'))
+        self.assertFalse(hasattr(seg.get('01'), '__dict__'))
+        self.assertFalse(hasattr(seg.get('01-1'), '__dict__'))
+
+    def test_pickle(self):
+        import pickle
+        seg = pyx12.segment.LazySegment('TST*AA:1:1*BB:5*ZZ', '~', '*', ':')
+        seg2 = pickle.loads(pickle.dumps(seg, 2))
+        self.assertEqual(seg2.format(), seg.format())
+        self.assertTrue(seg2._elements is None)
+
+
+class IndexAccessors(unittest.TestCase):
+
+    def setUp(self):
+        self.seg_str = 'TST*AA:1:1*BB:5*ZZ'
+
+    def test_value_at(self):
+        for cls in (pyx12.segment.Segment, pyx12.segment.LazySegment):
+            seg = cls(self.seg_str, '~', '*', ':')
+            self.assertEqual(seg.get_value_at(0), 'AA:1:1')
+            self.assertEqual(seg.get_value_at(1, 1), '5')
+            self.assertEqual(seg.get_value_at(1, 2), None)
+            self.assertEqual(seg.get_value_at(3), None)
+            self.assertEqual(seg.get_value_at(2), seg.get_value('TST03'))
+
+    def test_get_at(self):
+        seg = pyx12.segment.Segment(self.seg_str, '~', '*', ':')
+        self.assertEqual(seg.get_at(1).format(), 'BB:5')
+        self.assertEqual(seg.get_at(0, 2).get_value(), '1')
+        self.assertEqual(seg.get_at(5), None)
+
+    def test_refdes_cached(self):
+        seg = pyx12.segment.Segment(self.seg_str, '~', '*', ':')
+        self.assertEqual(seg.get_value('TST02-1'), 'BB')
+        self.assertEqual(pyx12.segment._refdes_cache['TST02-1'], ('TST', 1, 0))
+        self.assertEqual(seg.get_value('TST02-1'), 'BB')
+        seg2 = pyx12.segment.Segment('NM1*AA', '~', '*', ':')
+        self.assertRaises(EngineError, seg2.get_value, 'TST02-1')
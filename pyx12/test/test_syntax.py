@@ -286,3 +286,37 @@ class IsValidSyntaxE(unittest.TestCase):
         syntax = ['E', 8, 9, 10]
         (result, err_str) = pyx12.map_if.is_syntax_valid(seg, syntax)
         self.assertTrue(result, err_str)
+
+
+class CompiledSyntax(unittest.TestCase):
+
+    def test_lazy_segment(self):
+        seg_str = 'NM1*41*1*Smith*Sam****:*AAAA'
+        for syntax in (['P', 8, 9], ['R', 8, 9], ['E', 8, 9], ['C', 9, 8], ['L', 9, 8, 10]):
+            self.assertEqual(
+                pyx12.syntax.is_syntax_valid(pyx12.segment.LazySegment(seg_str, '~', '*', ':'), syntax),
+                pyx12.syntax.is_syntax_valid(pyx12.segment.Segment(seg_str, '~', '*', ':'), syntax))
+
+    def test_error_strings(self):
+        presence = [True, True, False, True]
+        rule = pyx12.syntax.compile_syntax(['C', 1, 3, 5])
+        self.assertEqual(pyx12.syntax.check_syntax(rule, presence, 'REF'),
+                         'Syntax Error (C010305): If REF01 is present, then REF03 or REF05 are required')
+        rule = pyx12.syntax.compile_syntax(['E', 1, 2])
+        self.assertEqual(pyx12.syntax.check_syntax(rule, presence, 'REF'),
+                         'Syntax Error (E0102): At most one of REF01 or REF02 may be present')
+        rule = pyx12.syntax.compile_syntax(['R', 3, 5])
+        self.assertEqual(pyx12.syntax.check_syntax(rule, presence, 'REF'),
+                         'Syntax Error (R0305): At least one element is required')
+        rule = pyx12.syntax.compile_syntax(['L', 2, 3, 5])
+        self.assertEqual(pyx12.syntax.check_syntax(rule, presence, 'REF'),
+                         'Syntax Error (L020305): If REF02 is present, then at least one of REF03 or REF05 is required')
+        self.assertEqual(pyx12.syntax.check_syntax(pyx12.syntax.compile_syntax(['P', 1, 4]), presence, 'REF'),
+                         None)
+
+    def test_compiled_at_load(self):
+        import pyx12.params
+        imap = pyx12.map_if.load_map_file('837.4010.X098.A1.xml', pyx12.params.params())
+        node = imap.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2010AA/NM1')
+        self.assertEqual([rule[2] for rule in node.syntax_rules], node.syntax)
+        self.assertEqual(node.syntax_rules[0][1], tuple([i - 1 for i in node.syntax[0][1:]]))
@@ -1,6 +1,8 @@
 import unittest
 
-from pyx12.validation import IsValidDataType
+from pyx12.errors import EngineError
+import pyx12.validation
+from pyx12.validation import IsValidDataType, get_data_type_check, get_character_set
 
 
 class BasicNumeric(unittest.TestCase):
@@ -253,3 +255,95 @@ class Extended5010String(unittest.TestCase):
     def testInvalid(self):
         self.assertFalse(
             IsValidDataType('%s' % (chr(0x1D)), 'AN', 'E', '00501'))
+
+
+class DataTypeCheck(unittest.TestCase):
+    values = ['1', '-10', '1.325', '.024', '333.', '+10', 'abc', '  XYZ', 'LKJS\\',
+              '_good ^`', '20030228', '20040229', '20030229', '030228', '1230',
+              '2460', '123059', '20030101-20031231', '20030101-2003123', '']
+
+    def test_same_as_data_type(self):
+        for data_type in ('N', 'N2', 'R', 'ID', 'AN', 'DT', 'D8', 'D6', 'TM',
+                          'RD8', 'B', 'XX', None):
+            for (charset, icvn) in (('B', '00401'), ('E', '00401'), ('E', '00501')):
+                check = get_data_type_check(data_type, charset, icvn)
+                for val in self.values:
+                    self.assertEqual(check(val), IsValidDataType(val, data_type, charset, icvn),
+                                     '%s %s %s' % (data_type, charset, val))
+
+    def test_unknown_charset(self):
+        self.assertRaises(EngineError, get_data_type_check, 'AN', 'X')
+
+
+class CharacterSetTable(unittest.TestCase):
+    values = ['LKJS', 'abd1P', 'bad ^`', 'wharf\\', 'AB\nC', 'AB\rC', 'a\r\nB',
+              '%s' % (chr(0x1D)), 'X\xe9Y', '']
+
+    def test_same_as_regex(self):
+        for (charset, icvn, rec) in (('B', '00401', pyx12.validation.rec_ID_B),
+                                     ('E', '00401', pyx12.validation.rec_ID_E),
+                                     ('E', '00501', pyx12.validation.rec_ID_E5)):
+            char_set = get_character_set(charset, icvn)
+            for val in self.values + [chr(i) for i in range(256)]:
+                m = rec.search(val)
+                self.assertEqual(char_set.is_valid(val), m is None)
+                self.assertEqual(char_set.scan(val)[1],
+                                 None if m is None else m.group(0), repr(val))
+
+    def test_control_characters(self):
+        char_set = get_character_set('B')
+        self.assertEqual(char_set.scan('AB\rC'), ('<CR>', None))
+        self.assertEqual(char_set.scan('a\r\nB'), ('<LF>', 'a'))
+        self.assertEqual(char_set.scan('AB C'), (None, None))
+
+    def test_batch(self):
+        char_set = get_character_set('E', '00501')
+        self.assertEqual(char_set.scan_values(self.values),
+                         [char_set.scan(val) for val in self.values])
+        self.assertEqual(char_set.scan_values(['A', 'b']), [(None, None)] * 2)
+
+    def test_unicode(self):
+        char_set = get_character_set('B')
+        for val in self.values:
+            uval = val.decode('latin-1')
+            self.assertEqual(char_set.is_valid(uval), char_set.is_valid(val))
+            (ctl_char, bad_char) = char_set.scan(val)
+            self.assertEqual(char_set.scan(uval),
+                             (ctl_char, bad_char and bad_char.decode('latin-1')))
+        self.assertEqual(char_set.scan_values([u'AB', u'X\u20acY']), [(None, None), (None, u'\u20ac')])
+        self.assertTrue(pyx12.validation.not_match_re('AN', u'X\u20acY'))
+        self.assertFalse(pyx12.validation.not_match_re('ID', u'ABC'))
+        self.assertFalse(IsValidDataType(u'X\u20acY', 'AN', 'B'))
+
+
+class DateCache(unittest.TestCase):
+    def setUp(self):
+        pyx12.validation.clear_date_caches()
+
+    def tearDown(self):
+        pyx12.validation.set_date_cache_size(pyx12.validation.DATE_CACHE_SIZE)
+        pyx12.validation.clear_date_caches()
+
+    def test_hits(self):
+        for i in range(3):
+            self.assertTrue(IsValidDataType('20030228', 'D8'))
+            self.assertFalse(IsValidDataType('20030229', 'D8'))
+            self.assertTrue(IsValidDataType('1230', 'TM'))
+        stats = pyx12.validation.get_date_cache_stats()
+        self.assertEqual((stats['D8']['hits'], stats['D8']['misses'], stats['D8']['size']), (4, 2, 2))
+        self.assertEqual((stats['TM']['hits'], stats['TM']['misses']), (2, 1))
+
+    def test_range_halves(self):
+        self.assertTrue(IsValidDataType('20030101-20031231', 'RD8'))
+        self.assertTrue(IsValidDataType('20031231-20030101', 'RD8'))
+        stats = pyx12.validation.get_date_cache_stats()['D8']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+    def test_bounded(self):
+        pyx12.validation.set_date_cache_size(4)
+        for day in range(1, 29):
+            self.assertTrue(IsValidDataType('200302%02i' % (day), 'D8'))
+        self.assertTrue(pyx12.validation.get_date_cache_stats()['D8']['size'] <= 4)
+        pyx12.validation.set_date_cache_size(0)
+        self.assertFalse(IsValidDataType('20030230', 'D8'))
+        self.assertEqual(pyx12.validation.get_date_cache_stats()['D8']['size'], 0)
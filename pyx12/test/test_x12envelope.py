@@ -0,0 +1,77 @@
+import unittest
+try:
+    from StringIO import StringIO
+except:
+    from io import StringIO
+
+import pyx12.x12envelope
+import pyx12.x12file
+from pyx12.test.x12testdata import datafiles
+
+
+class Records(unittest.TestCase):
+
+    def test_mult_isa(self):
+        isas = pyx12.x12envelope.scan_envelopes(StringIO(datafiles['mult_isa']['source']))
+        self.assertEqual(len(isas), 2)
+        isa = isas[0]
+        self.assertEqual((isa['sender_qualifier'], isa['sender'], isa['receiver'], isa['version'],
+                          isa['usage'], isa['control_number'], isa['group_count']),
+                         ('ZZ', 'ZZ000          ', 'ZZ001          ', '00401', 'T', '000010125', 5))
+        self.assertEqual(len(isa['isa']), 106)
+        gs = isa['groups'][0]
+        self.assertEqual((gs['fic'], gs['sender'], gs['receiver'], gs['vriic'], gs['control_number'],
+                          gs['transaction_count'], len(gs['transactions'])),
+                         ('HI', 'ZZ000', 'ZZ001', '004010X094A1', '17', 3, 3))
+        st = gs['transactions'][1]
+        self.assertEqual((st['id'], st['control_number'], st['line'], st['seg_count'], st['se_count']),
+                         ('278', '11280002', 5, 3, 3))
+
+    def test_byte_ranges(self):
+        source = datafiles['multiple_trn']['source']
+        for isa in pyx12.x12envelope.scan_envelopes(StringIO(source)):
+            self.assertTrue(source[isa['offset']:isa['end']].startswith('ISA*'))
+            self.assertTrue(source[isa['offset']:isa['end']].endswith('IEA*3*000010121~'))
+            for gs in isa['groups']:
+                self.assertTrue(source[gs['offset']:gs['end']].startswith('GS*'))
+                for st in gs['transactions']:
+                    self.assertTrue(source[st['offset']:st['end']].startswith('ST*'))
+
+    def test_missing_trailers(self):
+        source = datafiles['mult_isa']['source']
+        source = source[:source.index('SE*3*11280001~')]
+        isa = pyx12.x12envelope.scan_envelopes(StringIO(source))[0]
+        self.assertEqual(isa['group_count'], None)
+        gs = isa['groups'][0]
+        self.assertEqual(gs['transaction_count'], None)
+        st = gs['transactions'][0]
+        self.assertEqual((st['seg_count'], st['se_count'], st['end']), (2, None, len(source.rstrip())))
+
+
+class SameAsReader(unittest.TestCase):
+    """
+    The segments are split as in X12Reader
+    """
+    def _test_source(self, source):
+        envelope = []
+        segs = list(pyx12.x12envelope.iter_envelope_segments(StringIO(source)))
+        for bufsize in (1, 7, 50):
+            self.assertEqual(list(pyx12.x12envelope.iter_envelope_segments(StringIO(source), bufsize)), segs)
+        src = pyx12.x12file.X12Reader(StringIO(source))
+        for (line, seg) in enumerate(src):
+            if seg.get_seg_id() in pyx12.x12envelope.ENVELOPE_IDS:
+                envelope.append((line, seg.get_seg_id(), seg.format()))
+        self.assertEqual([(x[0], x[3], x[4]) for x in segs[:-1]], envelope)
+        self.assertEqual(segs[-1][0], src.get_cur_line())
+
+    def test_datafiles(self):
+        for datakey in ('mult_isa', 'multiple_trn', 'simple_837p', 'trailer_errors', '834_lui_id_5010'):
+            source = datafiles[datakey]['source']
+            self._test_source(source)
+            self._test_source(source.replace('\n', '\r\n'))
+            self._test_source(source.replace('~\n', '~'))
+
+    def test_empty_segment(self):
+        source = datafiles['mult_isa']['source'].replace('SE*3*11280002~', 'SE*3*11280002~\n~')
+        self._test_source(source)
+        self.assertEqual(len(pyx12.x12envelope.scan_envelopes(StringIO(source))[0]['groups'][0]['transactions']), 2)
@@ -233,6 +233,48 @@ class SE_Checks(X12fileTestCase):
         self.assertEqual(err_cde, '3', err_str)
 
 
+class EnvelopeIds(X12fileTestCase):
+
+    def test_current_ids(self):
+        str1 = 'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:~\n'
+        str1 += 'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*004010X098~\n'
+        str1 += 'ST*837*11280001~\n'
+        str1 += 'SE*2*11280001~\n'
+        str1 += 'GE*1*17~\n'
+        str1 += 'IEA*1*000010121~\n'
+        src = pyx12.x12file.X12Reader(self._makeFd(str1))
+        ids = [(src.get_isa_id(), src.get_gs_id(), src.get_st_id(), src.get_ls_id()) for seg in src]
+        self.assertEqual(ids, [
+            ('000010121', None, None, None),
+            ('000010121', '17', None, None),
+            ('000010121', '17', '11280001', None),
+            ('000010121', '17', None, None),
+            ('000010121', None, None, None),
+            (None, None, None, None)])
+
+    def test_unterminated_loops(self):
+        str1 = 'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:~\n'
+        str1 += 'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*004010X098~\n'
+        str1 += 'GS*HC*ZZ000*ZZ001*20030828*1128*18*X*004010X098~\n'
+        str1 += 'GE*0*18~\n'
+        src = pyx12.x12file.X12Reader(self._makeFd(str1))
+        ids = [src.get_gs_id() for seg in src]
+        # The outermost open loop of a type is the current one
+        self.assertEqual(ids, [None, '17', '17', '17'])
+        self.assertEqual(src.loops, [('ISA', '000010121'), ('GS', '17')])
+
+    def test_many_st_loops(self):
+        str1 = 'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:~\n'
+        str1 += 'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*004010X098~\n'
+        for i in range(20000):
+            str1 += 'ST*837*%i~\nSE*2*%i~\n' % (i, i)
+        str1 += 'ST*837*19999~\nSE*2*19999~\n'
+        str1 += 'GE*20001*17~\n'
+        str1 += 'IEA*1*000010121~\n'
+        (err_cde, err_str) = self._get_first_error(str1)
+        self.assertEqual(err_cde, '23', err_str)
+
+
 class HL_Checks(X12fileTestCase):
     """
     We can do minimal HL parent checks here
@@ -414,6 +456,41 @@ class FileString(X12fileTestCase):
         self.assertEqual(src.seg_term, '+')
 
 
+class Batches(X12fileTestCase):
+
+    def setUp(self):
+        self.str1 = 'ISA*03*SENDER    *01*          *ZZ*SENDER         *ZZ*RECEIVER       *040608*1333*U*00401*000000288*0*P*:~\n'
+        self.str1 += 'GS*HC*SENDER*RECEIVER*20040608*1333*17*X*004010X098~\n'
+        self.str1 += 'ST*837*11280001~\n'
+        self.str1 += 'HL*1**20*1~\n'
+        self.str1 += 'HL*2*1*22*0~\n'
+        self.str1 += 'HL*4*1*22*0*~\n'
+        self.str1 += 'SE*5*11280001~\n'
+        self.str1 += 'ST*837*11280002~\n'
+        self.str1 += 'HL*1**20*1~\n'
+        self.str1 += 'SE*2*11280002~\n'
+        self.str1 += 'GE*3*17~\n'
+        self.str1 += 'IEA*1*000000288~\n'
+
+    def test_same_as_iter(self):
+        src = pyx12.x12file.X12Reader(self._makeFd(self.str1))
+        segs = [seg.format() for seg in src]
+        errors = src.pop_errors()
+        for n in (1, 2, 5, 100):
+            src = pyx12.x12file.X12Reader(self._makeFd(self.str1))
+            batches = list(src.iter_batches(n))
+            self.assertTrue(max([len(b) for b in batches]) <= n)
+            self.assertEqual([seg.format() for b in batches for seg in b], segs)
+            self.assertEqual(src.pop_errors(), errors)
+            self.assertEqual(src.gs_count, 1)
+            self.assertEqual(src.st_count, 2)
+
+    def test_counters_per_batch(self):
+        src = pyx12.x12file.X12Reader(self._makeFd(self.str1))
+        lines = [src.get_cur_line() for batch in src.iter_batches(3)]
+        self.assertEqual(lines, [3, 6, 9, 12])
+
+
 class X12WriterTest(X12fileTestCase):
 
     def test_identity(self):
@@ -0,0 +1,118 @@
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import pyx12.x12file
+import pyx12.x12index
+from pyx12.test.x12testdata import datafiles
+
+
+class X12IndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_path, 'mult_isa.txt')
+        with open(self.filename, 'wb') as fd:
+            fd.write(datafiles['mult_isa']['source'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def _read_all(self, src):
+        segs = []
+        for seg in src:
+            segs.append((seg.format(), src.get_cur_line(), src.get_seg_count(),
+                         src.get_isa_id(), src.get_gs_id(), src.get_st_id(), src.pop_errors()))
+        return segs
+
+
+class Scan(X12IndexTestCase):
+
+    def test_envelopes(self):
+        index = pyx12.x12index.X12Index(self.filename)
+        self.assertEqual([x['control_number'] for x in index.interchanges], ['000010125', '000010121'])
+        self.assertEqual([len(x['groups']) for x in index.interchanges], [5, 3])
+        self.assertEqual(len(index), 12)
+        gs = index.interchanges[0]['groups'][1]
+        self.assertEqual((gs['control_number'], gs['fic'], gs['vriic']), ('18', 'HC', '004010X098A1'))
+        (isa, gs, st) = index.transactions[3]
+        self.assertEqual((st['id'], st['control_number'], st['line'], st['seg_count']),
+                         ('837', '11280001', 13, 3))
+
+    def test_offsets(self):
+        index = pyx12.x12index.X12Index(self.filename)
+        source = datafiles['mult_isa']['source']
+        for (isa, gs, st) in index.transactions:
+            self.assertTrue(source[st['offset']:st['end']].startswith('ST*'))
+            self.assertTrue(source[st['offset']:st['end']].endswith('~'))
+            self.assertTrue(source[gs['offset']:gs['end']].endswith('~'))
+        isa = index.interchanges[1]
+        self.assertEqual(source[isa['offset']:isa['offset'] + 106], isa['isa'])
+        self.assertEqual(isa['end'], len(source.rstrip()))
+
+    def test_find_transaction(self):
+        index = pyx12.x12index.X12Index(self.filename)
+        self.assertEqual(index.find_transaction('11280002'), 1)
+        self.assertEqual(index.find_transaction('11280002', isa_control_number='000010121'), 8)
+        self.assertEqual(index.find_transaction('0001', '2'), 5)
+        self.assertEqual(index.find_transaction('0001', '5'), None)
+
+
+class SeekReader(X12IndexTestCase):
+
+    def test_same_as_full_read(self):
+        index = pyx12.x12index.X12Index(self.filename)
+        full = self._read_all(pyx12.x12file.X12Reader(self.filename))
+        for n in range(len(index)):
+            st = index.transactions[n][2]
+            src = index.get_reader(n)
+            self.assertEqual(self._read_all(src), full[st['line']:st['line'] + st['seg_count']])
+
+    def test_all_datafiles(self):
+        for (key, datafile) in sorted(datafiles.items()):
+            filename = os.path.join(self.tmp_path, '%s.txt' % (key))
+            with open(filename, 'wb') as fd:
+                fd.write(datafile['source'])
+            index = pyx12.x12index.X12Index(filename)
+            full = self._read_all(pyx12.x12file.X12Reader(filename))
+            for n in range(len(index)):
+                st = index.transactions[n][2]
+                self.assertEqual(self._read_all(index.get_reader(n)),
+                                 full[st['line']:st['line'] + st['seg_count']], '%s %i' % (key, n))
+
+    def test_duplicate_st_id(self):
+        index = pyx12.x12index.X12Index(self.filename)
+        with open(self.filename, 'rb') as fd:
+            src = index.get_reader(1, fd)
+            list(src)
+            self.assertEqual(src.pop_errors(), [])
+        with open(self.filename, 'wb') as fd:
+            fd.write(datafiles['mult_isa']['source'].replace('ST*278*11280002', 'ST*278*11280001'))
+        src = index.get_reader(1)
+        list(src)
+        self.assertEqual([x[1] for x in src.pop_errors()], ['23', '3'])
+
+
+class Sidecar(X12IndexTestCase):
+
+    def test_save_load(self):
+        index = pyx12.x12index.get_index(self.filename)
+        self.assertTrue(os.path.isfile(self.filename + pyx12.x12index.INDEX_SUFFIX))
+        index2 = pyx12.x12index.X12Index.load(self.filename)
+        self.assertEqual(index2.interchanges, index.interchanges)
+        self.assertTrue(isinstance(index2.interchanges[0]['isa'], str))
+        self.assertEqual(self._read_all(index2.get_reader(7)),
+                         self._read_all(index.get_reader(7)))
+
+    def test_stale(self):
+        pyx12.x12index.get_index(self.filename)
+        with open(self.filename, 'ab') as fd:
+            fd.write('\n')
+        self.assertEqual(pyx12.x12index.X12Index.load(self.filename), None)
+        index = pyx12.x12index.get_index(self.filename)
+        self.assertEqual(len(index), 12)
+        self.assertFalse(pyx12.x12index.X12Index.load(self.filename) is None)
+
+    def test_missing(self):
+        self.assertEqual(pyx12.x12index.X12Index.load(self.filename), None)
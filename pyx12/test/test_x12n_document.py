@@ -1,11 +1,22 @@
+import gc
+import logging
+import random
+import time
 import unittest
+import weakref
 try:
     from StringIO import StringIO
 except:
     from io import StringIO
 
+import pyx12.error_997
+import pyx12.error_999
+import pyx12.error_ack
 import pyx12.error_handler
+import pyx12.error_sink
+import pyx12.errors
 import pyx12.x12n_document
+import pyx12.x12n_parallel
 import pyx12.params
 from pyx12.test.x12testdata import datafiles
 
@@ -155,3 +166,220 @@ class Test5010(X12DocumentTestCase):
 
     def test_834_eol_in_element(self):
         self._test_999('834_eol_in_element')
+
+
+class ParallelWorkers(X12DocumentTestCase):
+    """
+    Validation with a worker pool gives the serial results
+    """
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.batch_size = pyx12.x12n_parallel.BATCH_SIZE
+        # Small batches, so the predicted starting states are checked
+        pyx12.x12n_parallel.BATCH_SIZE = 2
+
+    def tearDown(self):
+        pyx12.x12n_parallel.BATCH_SIZE = self.batch_size
+
+    def _run(self, datakey, workers):
+        self.param.set('workers', workers)
+        fd_source = self._makeFd(datafiles[datakey]['source'])
+        fd_997 = StringIO()
+        fd_html = StringIO()
+        fd_xml = StringIO()
+        res = pyx12.x12n_document.x12n_document(self.param, fd_source, fd_997, fd_html, fd_xml)
+        fd_997.seek(0)
+        html = [line for line in fd_html.getvalue().splitlines() if 'Analysis Date' not in line]
+        return (res, [x.format() for x in pyx12.x12file.X12Reader(fd_997)
+                      if x.get_seg_id() not in ('ISA', 'GS', 'ST', 'SE', 'GE', 'IEA')],
+                html, fd_xml.getvalue())
+
+    def _test_same(self, datakey):
+        serial = self._run(datakey, 1)
+        parallel = self._run(datakey, 2)
+        self.assertEqual(serial[0], parallel[0])
+        self.assertListEqual(serial[1], parallel[1])
+        self.assertListEqual(serial[2], parallel[2])
+        self.assertEqual(serial[3], parallel[3])
+
+    def test_multiple_trn(self):
+        self._test_same('multiple_trn')
+
+    def test_loop_counting(self):
+        self._test_same('loop_counting')
+
+    def test_simple_837p(self):
+        self._test_same('simple_837p')
+
+    def test_834_lui_id_5010(self):
+        self._test_same('834_lui_id_5010')
+
+    def test_validation_level(self):
+        self.param.set('validation_level', 'elements')
+        self._test_same('elements')
+
+
+class DroppedTree(X12DocumentTestCase):
+    """
+    Without a 997/999 or HTML output, the closed ST loops are dropped from
+    the error tree.  The result is the same as with the whole tree.
+    """
+    def _run(self, source, fd_997, workers=1):
+        self.param.set('workers', workers)
+        return pyx12.x12n_document.x12n_document(self.param, self._makeFd(source),
+                                                 fd_997, None, None)
+
+    def _test_same(self, source):
+        for workers in (1, 2):
+            self.assertEqual(self._run(source, None, workers),
+                             self._run(source, StringIO(), workers))
+
+    def _insert_before_ge(self, seg_str):
+        source = datafiles['834_lui_id']['source']
+        pos = source.index('GE*')
+        return source[:pos] + seg_str + '\n' + source[pos:]
+
+    def test_valid(self):
+        source = datafiles['834_lui_id']['source']
+        self.assertTrue(self._run(source, None))
+        self._test_same(source)
+
+    def test_unknown_segment_after_se(self):
+        source = self._insert_before_ge('ZZZ*1~')
+        self.assertFalse(self._run(source, None))
+        self._test_same(source)
+
+    def test_bad_segment_after_se(self):
+        source = self._insert_before_ge('DTP*348*D8*2001X~')
+        self.assertFalse(self._run(source, None))
+        self._test_same(source)
+
+
+class ValidationLevel(X12DocumentTestCase):
+    """
+    Each level adds checks to the level before it
+    """
+    def _run(self, datakey, level, fd_xml=None):
+        self.param.set('validation_level', level)
+        counter = pyx12.error_sink.ErrorCounter()
+        res = pyx12.x12n_document.x12n_document(self.param, self._makeFd(datafiles[datakey]['source']),
+                                                StringIO(), None, fd_xml, error_sinks=[counter])
+        return (res, counter)
+
+    def test_levels(self):
+        counts = [self._run('elements', level)[1] for level in pyx12.params.VALIDATION_LEVELS]
+        self.assertEqual([x.total for x in counts], [1, 1, 8, 9])
+        self.assertEqual([x.get_count('ele', '8') for x in counts], [0, 0, 0, 1])
+        self.assertEqual([x.get_count('st') for x in counts], [1, 1, 1, 1])
+
+    def test_structure(self):
+        self.assertEqual(self._run('bad_header_looping', 'envelope')[1].get_count('seg'), 0)
+        self.assertEqual(self._run('bad_header_looping', 'structure')[1].get_count('seg'), 4)
+        self.assertTrue(self._run('multiple_trn', 'envelope')[0])
+        self.assertFalse(self._run('multiple_trn', 'structure')[0])
+
+    def test_envelope_errors(self):
+        (res, counter) = self._run('trailer_errors', 'envelope')
+        self.assertFalse(res)
+        self.assertEqual(counter.get_count('isa') + counter.get_count('gs'), 3)
+
+    def test_bad_level(self):
+        self.assertRaises(pyx12.errors.EngineError, self._run, 'elements', 'segments')
+
+    def test_envelope_xml(self):
+        self.assertRaises(pyx12.errors.EngineError, self._run, 'elements', 'envelope', StringIO())
+
+
+class _FixedTime(object):
+    """
+    Stands in for the time module, so two responses have the same dates
+    """
+    def __init__(self):
+        self.now = time.localtime()
+
+    def strftime(self, fmt):
+        return time.strftime(fmt, self.now)
+
+
+class IncrementalAck(X12DocumentTestCase):
+    """
+    The response written a group at a time is the same as the one
+    generated from the whole error tree
+    """
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.fixed_time = _FixedTime()
+        pyx12.error_997.time = self.fixed_time
+        pyx12.error_999.time = self.fixed_time
+        self.hdlr = logging.NullHandler()
+        logging.getLogger('pyx12').addHandler(self.hdlr)
+
+    def tearDown(self):
+        pyx12.error_997.time = time
+        pyx12.error_999.time = time
+        logging.getLogger('pyx12').removeHandler(self.hdlr)
+
+    def _run(self, source, fd_html):
+        random.seed(0)
+        fd_source = self._makeFd(source)
+        fd_997 = StringIO()
+        res = pyx12.x12n_document.x12n_document(self.param, fd_source, fd_997, fd_html, None)
+        return (res, fd_997.getvalue())
+
+    def _test_same(self, datakey):
+        # The HTML output needs the whole tree, so the response is
+        # generated at the end
+        source = datafiles[datakey]['source']
+        self.assertEqual(self._run(source, None), self._run(source, StringIO()))
+
+    def test_mult_isa(self):
+        self._test_same('mult_isa')
+
+    def test_multiple_trn(self):
+        self._test_same('multiple_trn')
+
+    def test_trailer_errors(self):
+        self._test_same('trailer_errors')
+
+    def test_fail_no_IEA(self):
+        self._test_same('fail_no_IEA')
+
+    def test_834_lui_id_5010(self):
+        self._test_same('834_lui_id_5010')
+
+    def test_mixed_versions(self):
+        # The groups are spooled as a 999, then generated again as a 997
+        source = datafiles['834_lui_id_5010']['source'].strip() + '\n' + \
+            datafiles['simple_837p']['source']
+        (res, ack) = self._run(source, None)
+        self.assertTrue(ack.startswith('ISA') and 'ST*997*0002~' in ack)
+        self.assertEqual((res, ack), self._run(source, StringIO()))
+
+    def test_groups_dropped(self):
+        # A closed group is not kept once its responses are spooled
+        released = []
+        alive = []
+        ack_writer = pyx12.error_ack.ack_writer
+
+        class _Writer(ack_writer):
+            def visit_gs(self, err_gs):
+                ack_writer.visit_gs(self, err_gs)
+                released.append(weakref.ref(err_gs))
+
+            def finish(self, fic, vriic):
+                gc.collect()
+                alive.extend([ref for ref in released if ref() is not None])
+                ack_writer.finish(self, fic, vriic)
+        pyx12.error_ack.ack_writer = _Writer
+        try:
+            (res, ack) = self._run(datafiles['mult_isa']['source'], None)
+        finally:
+            pyx12.error_ack.ack_writer = ack_writer
+        self.assertEqual(len(released), 7)
+        self.assertEqual(alive, [])
+        self.assertEqual(ack.count('ST*997*'), 8)
+
+    def test_no_ack_type(self):
+        self.assertEqual(pyx12.error_ack.get_ack_type('FA', '004010'), None)
+        self.assertEqual(pyx12.error_ack.get_ack_type('HC', '005010X222A1'), '999')
+        self.assertEqual(pyx12.error_ack.get_ack_type('HC', None), None)
@@ -0,0 +1,105 @@
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import pyx12.errors
+import pyx12.params
+from pyx12.scripts import x12valid
+from pyx12.test.x12testdata import datafiles
+
+
+class X12ValidTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.param = pyx12.params.params()
+        # A 997 has no map, so validating it raises
+        self.ack = self._write('ack.txt', datafiles['simple_837p']['source'])
+        x12valid.validate_file(self.param, self.ack)
+        shutil.move(self._path('ack.997'), self.ack)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def _path(self, name):
+        return os.path.join(self.tmp_path, name)
+
+    def _write(self, name, source):
+        with open(self._path(name), 'wb') as fd:
+            fd.write(source)
+        return self._path(name)
+
+
+class ValidateFile(X12ValidTestCase):
+
+    def test_valid(self):
+        src_filename = self._write('good.txt', datafiles['simple_837p']['source'])
+        self.assertTrue(x12valid.validate_file(self.param, src_filename, flag_errors=True))
+        with open(self._path('good.997')) as fd:
+            self.assertTrue('AK5*A~' in fd.read())
+        self.assertFalse(os.path.exists(self._path('good.errors.jsonl')))
+
+    def test_invalid(self):
+        src_filename = self._write('bad.txt', datafiles['837miss']['source'])
+        self.assertFalse(x12valid.validate_file(self.param, src_filename, flag_errors=True))
+        self.assertTrue(os.path.getsize(self._path('bad.997')) > 0)
+        self.assertTrue(os.path.getsize(self._path('bad.errors.jsonl')) > 0)
+
+    def test_target_mode(self):
+        src_filename = self._write('good.txt', datafiles['simple_837p']['source'])
+        umask = os.umask(0o22)
+        try:
+            x12valid.validate_file(self.param, src_filename)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(self._path('good.997')).st_mode & 0o777, 0o644)
+
+    def test_keep_target_on_error(self):
+        with open(self._path('ack.997'), 'w') as fd:
+            fd.write('previous')
+        with open(self._path('ack.errors.jsonl'), 'w') as fd:
+            fd.write('previous')
+        self.assertRaises(pyx12.errors.EngineError, x12valid.validate_file,
+                          self.param, self.ack, flag_errors=True)
+        with open(self._path('ack.997')) as fd:
+            self.assertEqual(fd.read(), 'previous')
+        with open(self._path('ack.errors.jsonl')) as fd:
+            self.assertEqual(fd.read(), 'previous')
+
+    def test_no_empty_target(self):
+        self.assertRaises(pyx12.errors.EngineError, x12valid.validate_file,
+                          self.param, self.ack, flag_errors=True)
+        self.assertEqual(sorted(os.listdir(self.tmp_path)), ['ack.txt'])
+
+
+class RunJobs(X12ValidTestCase):
+
+    def test_status(self):
+        good = self._write('good.txt', datafiles['simple_837p']['source'])
+        bad = self._write('bad.txt', datafiles['837miss']['source'])
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertTrue(x12valid.run_jobs(self.param, [good, bad, self.ack], 2))
+            lines = sys.stderr.getvalue().splitlines()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue(lines[0].startswith('%s: OK ' % (good)))
+        self.assertTrue(lines[1].startswith('%s: Failure ' % (bad)))
+        self.assertTrue(lines[2].startswith('%s: Error ' % (self.ack)))
+        self.assertEqual(lines[3], '3 files: 1 OK, 1 Failure, 1 Error')
+        self.assertEqual(sorted(os.listdir(self.tmp_path)),
+                         ['ack.txt', 'bad.997', 'bad.txt', 'good.997', 'good.txt'])
+
+    def test_error(self):
+        # The error is raised, not hidden by joining a running pool
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(OSError, x12valid.run_jobs, self.param,
+                              [self._path('missing.txt')], 1)
+        finally:
+            sys.stderr = stderr
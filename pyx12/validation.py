@@ -65,6 +65,47 @@ def IsValidDataType(str_val, data_type, charset='B', icvn='00401'):
         return False
     return True
 
+def get_data_type_check(data_type, charset='B', icvn='00401'):
+    """
+    Get a check of values of one data type.  The data type dispatch and
+    the character set are resolved once.
+
+    @param data_type: X12 data element identifier
+    @type data_type: string
+    @param charset: [optional] - 'B' for Basic X12 character set, 'E' for extended
+    @type charset: string
+    @return: A function of a data value, with the result of IsValidDataType
+    @rtype: function
+    """
+    if not data_type:
+        return lambda str_val: True
+    if data_type[0] == 'N' or data_type == 'R':
+        rec = rec_N if data_type[0] == 'N' else rec_R
+
+        def check_number(str_val):
+            if not isinstance(str_val, str):
+                return False
+            m = rec.search(str_val)
+            return m is not None and m.group(0) == str_val
+        return check_number
+    if data_type in ('ID', 'AN'):
+        char_set = get_character_set(charset, icvn)
+        return lambda str_val: isinstance(str_val, str) and char_set.is_valid(str_val)
+    if data_type == 'RD8':
+        def check_range(str_val):
+            if not isinstance(str_val, str) or '-' not in str_val:
+                return False
+            (start, end) = str_val.split('-')
+            return is_valid_date('D8', start) and is_valid_date('D8', end)
+        return check_range
+    if data_type in ('DT', 'D8', 'D6'):
+        return lambda str_val: isinstance(str_val, str) and is_valid_date(data_type, str_val)
+    if data_type == 'TM':
+        return lambda str_val: isinstance(str_val, str) and is_valid_time(str_val)
+    if data_type == 'B':
+        return lambda str_val: isinstance(str_val, str)
+    return lambda str_val: False
+
 rec_N = re.compile("^-?[0-9]+", re.S)
 rec_R = re.compile("^-?[0-9]*(\.[0-9]+)?", re.S)
 rec_ID_E = re.compile(
@@ -76,6 +117,104 @@ rec_DT = re.compile("[^0-9]+", re.S)
 rec_TM = re.compile("[^0-9]+", re.S)
 
 
+class CharacterSet(object):
+    """
+    An X12 character set as a table of its characters.  A value is checked
+    by deleting the valid characters, in one pass, and looking at what is
+    left.  Carriage return and line feed are part of the character sets,
+    but are still reported as control characters.  A value which is not a
+    str, such as unicode, is checked with the regex.
+    """
+    def __init__(self, rec):
+        """
+        @param rec: Compiled regex matching one character not in the set
+        @type rec: re.RegexObject
+        """
+        self.rec = rec
+        self.valid_chars = ''.join([chr(i) for i in range(256) if rec.search(chr(i)) is None])
+        self.plain_chars = self.valid_chars.replace('\n', '').replace('\r', '')
+
+    def is_valid(self, str_val):
+        """
+        @param str_val: data value
+        @type str_val: string
+        @return: True if all characters of str_val are in the set
+        @rtype: boolean
+        """
+        if not isinstance(str_val, str):
+            return self.rec.search(str_val) is None
+        return not str_val.translate(None, self.valid_chars)
+
+    def scan(self, str_val):
+        """
+        Find the control characters and the invalid characters in one pass
+
+        @param str_val: data value
+        @type str_val: string
+        @return: (<LF>, <CR> or None, first character not in the set or None)
+        @rtype: tuple(string, string)
+        """
+        if not isinstance(str_val, str):
+            if '\n' in str_val:
+                ctl_char = '<LF>'
+            elif '\r' in str_val:
+                ctl_char = '<CR>'
+            else:
+                ctl_char = None
+            m = self.rec.search(str_val)
+            return (ctl_char, m.group(0) if m else None)
+        left = str_val.translate(None, self.plain_chars)
+        if not left:
+            return (None, None)
+        if '\n' in left:
+            ctl_char = '<LF>'
+        elif '\r' in left:
+            ctl_char = '<CR>'
+        else:
+            return (None, left[0])
+        left = left.translate(None, '\n\r')
+        return (ctl_char, left[0] if left else None)
+
+    def scan_values(self, values):
+        """
+        Scan a batch of values.  Only the values of a batch which is not
+        clean are scanned one by one.
+
+        @param values: data values
+        @type values: list[string]
+        @return: The result of L{scan} for each value
+        @rtype: list[tuple(string, string)]
+        """
+        batch = ''.join(values)
+        if isinstance(batch, str) and not batch.translate(None, self.plain_chars):
+            return [(None, None)] * len(values)
+        return [self.scan(str_val) for str_val in values]
+
+
+_character_sets = {}
+
+
+def get_character_set(charset='B', icvn='00401'):
+    """
+    @param charset: 'B' for Basic X12 character set, 'E' for extended
+    @type charset: string
+    @param icvn: Interchange version, E5 is used for 00501
+    @type icvn: string
+    @rtype: L{CharacterSet}
+    """
+    if charset == 'E':
+        rec = rec_ID_E5 if icvn == '00501' else rec_ID_E
+    elif charset == 'B':
+        rec = rec_ID_B
+    else:
+        raise EngineError('Unknown character set %s' % (charset))
+    try:
+        return _character_sets[rec.pattern]
+    except KeyError:
+        char_set = _character_sets[rec.pattern] = CharacterSet(rec)
+        return char_set
+
+
 def match_re(short_data_type, val):
     """
     @param short_data_type: simplified data type
@@ -111,13 +250,7 @@ def not_match_re(short_data_type, val, charset='B', icvn='00401'):
     @rtype: boolean
     """
     if short_data_type in ('ID', 'AN'):
-        if charset == 'E':  # extended charset
-            if icvn == '00501':
-                rec = rec_ID_E5
-            else:
-                rec = rec_ID_E
-        elif charset == 'B':  # basic charset:
-            rec = rec_ID_B
+        return not get_character_set(charset, icvn).is_valid(val)
     elif short_data_type == 'DT':
         rec = rec_DT
     elif short_data_type == 'TM':
@@ -130,7 +263,7 @@ def not_match_re(short_data_type, val, charset='B', icvn='00401'):
     return False
 
 
-def is_valid_date(data_type, val):
+def _is_valid_date(data_type, val):
     """
     @param data_type: Date type
     @type data_type: string
@@ -173,7 +306,7 @@ def is_valid_date(data_type, val):
                     elif day < 1 or day > 28:
                         raise IsValidError
                 if len(val) == 12:
-                    if not is_valid_time(val[8:12]):
+                    if not _is_valid_time(val[8:12]):
                         raise IsValidError
             except TypeError:
                 raise IsValidError
@@ -184,7 +317,7 @@ def is_valid_date(data_type, val):
     return True
 
 
-def is_valid_time(val):
+def _is_valid_time(val):
     """
     @param val: time value to be verified
     @type val: string
@@ -207,6 +340,116 @@ def is_valid_time(val):
     return True
 
 
+# Default maximum number of memoized values for each date and time format
+DATE_CACHE_SIZE = 10000
+
+
+class ValueCache(object):
+    """
+    Bounded memo of the results of a check of data values.  The memo is
+    emptied when full.
+    """
+    def __init__(self, check, max_size=DATE_CACHE_SIZE):
+        """
+        @param check: Function of a data value, returning a boolean
+        @type check: function
+        @param max_size: Maximum number of memoized values.  If 0, values
+            are not memoized
+        @type max_size: int
+        """
+        self.check = check
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.results = {}
+
+    def __call__(self, val):
+        result = self.results.get(val)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self.check(val)
+        if self.max_size > 0:
+            if len(self.results) >= self.max_size:
+                self.results.clear()
+            self.results[val] = result
+        return result
+
+    def get_stats(self):
+        """
+        @return: Memo hits, misses, and size
+        @rtype: dict
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.results), 'max_size': self.max_size}
+
+    def clear(self):
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_date_caches = {
+    'DT': ValueCache(lambda val: _is_valid_date('DT', val)),
+    'D8': ValueCache(lambda val: _is_valid_date('D8', val)),
+    'D6': ValueCache(lambda val: _is_valid_date('D6', val)),
+    'TM': ValueCache(_is_valid_time),
+}
+
+
+def is_valid_date(data_type, val):
+    """
+    @param data_type: Date type
+    @type data_type: string
+    @param val: data value to be verified
+    @type val: string
+    @return: True if valid, False if not
+    @rtype: boolean
+    """
+    cache = _date_caches.get(data_type)
+    if cache is None:
+        return _is_valid_date(data_type, val)
+    return cache(val)
+
+
+def is_valid_time(val):
+    """
+    @param val: time value to be verified
+    @type val: string
+    """
+    return _date_caches['TM'](val)
+
+
+def get_date_cache_stats():
+    """
+    @return: Memo hits, misses, and size for each date and time format
+    @rtype: dict
+    """
+    return dict([(data_type, cache.get_stats()) for (data_type, cache) in _date_caches.items()])
+
+
+def set_date_cache_size(max_size):
+    """
+    Set the maximum size of the memo of each date and time format
+
+    @param max_size: Maximum number of memoized values.  If 0, values
+        are not memoized
+    @type max_size: int
+    """
+    for cache in _date_caches.values():
+        cache.max_size = max_size
+        cache.results.clear()
+
+
+def clear_date_caches():
+    """
+    Drop the memoized dates and times, and reset the counts
+    """
+    for cache in _date_caches.values():
+        cache.clear()
+
+
 def contains_control_character(str_val, charset='B', icvn='00401'):
     if '\n' in str_val:
         return (True, '<LF>')
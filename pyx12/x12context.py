@@ -25,9 +25,11 @@ Interface to read and alter segments
 # Intrapackage imports
 import pyx12
 import error_handler
+import error_sink
 import errors
 import map_index
-import map_if
+import map_registry
+import params
 import x12file
 import path
 from map_walker import walk_tree, pop_to_parent_loop  # get_pop_loops, get_push_loops
@@ -738,10 +740,21 @@ class X12ContextReader(object):
         @param src_file_obj: Source document
         @type src_file_obj: string
         @rtype: boolean
+
+        The parameter validation_level defaults to structure.  The segments
+        are always walked, so the envelope level is not supported.  At the
+        elements and full levels, the segments are also validated, and the
+        errors go to the registered error callbacks.
         """
+        level = params.get_validation_level(param, 'structure')
+        if level < params.LEVEL_STRUCTURE:
+            raise errors.EngineError('X12ContextReader needs the structure validation level')
+        self.check_elements = level >= params.LEVEL_ELEMENTS
+        self.check_relations = level >= params.LEVEL_FULL
         self.param = param
         self.map_path = map_path
         self.errh = error_handler.errh_list()
+        self.error_sinks = []
         self.icvn = None
         self.fic = None
         self.vriic = None
@@ -752,10 +765,10 @@ class X12ContextReader(object):
 
         #Get Map of Control Segments
         self.map_file = 'x12.control.00501.xml' if self.src.icvn == '00501' else 'x12.control.00401.xml'
-        self.control_map = map_if.load_map_file(self.map_file, param, self.map_path)
+        self.control_map = map_registry.load_map_file(self.map_file, param, self.map_path)
         self.map_index_if = map_index.map_index(self.map_path)
         self.x12_map_node = self.control_map.getnodebypath('/ISA_LOOP/ISA')
-        self.walker = walk_tree()
+        self.walker = walk_tree(cache_size=param.get('walk_cache_size') or 0)
 
     #{ Public Methods
     def iter_segments(self, loop_id=None):
@@ -802,7 +815,7 @@ class X12ContextReader(object):
                         if self.map_file is None:
                             raise pyx12.errors.EngineError("Map not found.  icvn=%s, fic=%s, vriic=%s" %
                                                            (icvn, fic, vriic))
-                        cur_map = map_if.load_map_file(self.map_file, self.param, self.map_path)
+                        cur_map = map_registry.load_map_file(self.map_file, self.param, self.map_path)
                         if cur_map.id == '837':
                             self.src.check_837_lx = True
                         else:
@@ -825,7 +838,7 @@ class X12ContextReader(object):
                                 err_str = "Map not found.  icvn=%s, fic=%s, vriic=%s, tspc=%s" % \
                                     (icvn, fic, vriic, tspc)
                                 raise pyx12.errors.EngineError(err_str)
-                            cur_map = map_if.load_map_file(self.map_file, self.param, self.map_path)
+                            cur_map = map_registry.load_map_file(self.map_file, self.param, self.map_path)
                             if cur_map.id == '837':
                                 self.src.check_837_lx = True
                             else:
@@ -833,6 +846,8 @@ class X12ContextReader(object):
                             self._apply_loop_count(self.x12_map_node, cur_map)
                             tpath = '/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT'
                             self.x12_map_node = cur_map.getnodebypath(tpath)
+                if self.check_elements:
+                    self.x12_map_node.is_valid(seg, errh, self.check_relations)
 
             node_x12path = self.x12_map_node.x12path
             # If we are in the requested tree, wait until we have the whole thing
@@ -852,6 +867,8 @@ class X12ContextReader(object):
                     if cur_data_node is None or self.x12_map_node is None:
                         raise errors.EngineError('Either cur_data_node or self.x12_map_node is None')
                     cur_data_node = self._add_segment(cur_data_node, self.x12_map_node, seg, pop_loops, push_loops)
+                if self.error_sinks:
+                    self._emit_errors(errh, seg)
             else:
                 if cur_tree is not None:
                     # We have completed a tree
@@ -871,15 +888,54 @@ class X12ContextReader(object):
                 errh.handle_errors(self.src.pop_errors())
                 # Handle errors captured in errh_list
                 cur_data_node.handle_errh_errors(errh)
+                if self.error_sinks:
+                    self._emit_errors(errh, seg)
                 if cur_data_node.id != 'ISA' and cur_data_node is not None:
                     assert cur_data_node.parent is not None, 'Node "%s" has no parent' % (cur_data_node.id)
                 yield cur_data_node
 
-    def register_error_callback(self, callback, err_type):
-        """
-        Future:  Callbacks for X12 validation errors
-        """
-        pass
+    def register_error_callback(self, callback, err_type=None):
+        """
+        Call a function with each X12 validation error, as the segment
+        with the error is read
+
+        @param callback: Called with an L{error event<error_sink.error_event>}
+        @type callback: callable
+        @param err_type: isa, gs, st, seg or ele.  If None, all errors
+        @type err_type: string
+        """
+        if err_type is not None:
+            if err_type not in error_sink.ERR_TYPES:
+                raise errors.EngineError('Unknown error type "%s"' % (err_type))
+            callback = error_sink.TypeFilter(callback, [err_type])
+        self.error_sinks.append(callback)
+
+    def _emit_errors(self, errh, seg):
+        """
+        Pass the errors of a segment to the registered callbacks
+        """
+        ids = (self.src.get_isa_id(), self.src.get_gs_id(), self.src.get_st_id())
+        line = self.src.get_cur_line()
+        events = []
+        for (err_cde, err_str) in errh.err_isa:
+            events.append(error_sink.error_event('isa', err_cde, err_str, None, line, *ids))
+        for (err_cde, err_str) in errh.err_gs:
+            events.append(error_sink.error_event('gs', err_cde, err_str, None, line, *ids))
+        for (err_cde, err_str) in errh.err_st:
+            events.append(error_sink.error_event('st', err_cde, err_str, None, line, *ids))
+        for (err_cde, err_str, err_val) in errh.err_seg:
+            events.append(error_sink.error_event('seg', err_cde, err_str, err_val, line, *ids))
+        for (err_cde, err_str, err_val, refdes) in errh.err_ele:
+            event = error_sink.error_event('ele', err_cde, err_str, err_val, line, *ids)
+            event['refdes'] = refdes
+            events.append(event)
+        for event in events:
+            if event['err_type'] in ('seg', 'ele'):
+                event['seg_id'] = seg.get_seg_id()
+                event['seg_count'] = self.src.get_seg_count()
+                event['ls_id'] = self.src.get_ls_id()
+            for sink in self.error_sinks:
+                sink(event)
 
     #{ Property Accessors
     @property
@@ -0,0 +1,199 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Fast scan of the envelope segments of an X12 file.
+
+Only the ISA, GS, ST, SE, GE and IEA segments are found and split.  They
+are located by their segment ID prefix in the raw buffer, so no objects
+are built for the body segments and no transaction level checks are done.
+The file is split into segments as L{RawX12File<rawx12file.RawX12File>}
+does, so the segment counts and byte offsets agree with X12Reader.
+"""
+
+import re
+
+# Intrapackage imports
+from pyx12.rawx12file import RawX12File, DEFAULT_BUFSIZE
+
+ENVELOPE_IDS = ('ISA', 'IEA', 'GS', 'GE', 'ST', 'SE')
+
+
+def _get_pattern(seg_term, ele_term):
+    """
+    A segment terminator followed by an empty segment, or by an envelope
+    segment ID and an element terminator
+    """
+    eol = ''.join([c for c in '\r\n' if c != seg_term])
+    return re.compile('%s%s(?:(?P<seg>(?: \\s*)?(?P<id>%s)%s)|%s)' % (
+        re.escape(seg_term), '[%s]*' % (re.escape(eol)) if eol else '',
+        '|'.join(ENVELOPE_IDS), re.escape(ele_term), re.escape(seg_term)))
+
+
+def iter_envelope_segments(fd, bufsize=DEFAULT_BUFSIZE):
+    """
+    Find the envelope segments of an X12 file
+
+    @param fd: File opened in binary mode, positioned at the start
+    @param bufsize: number of characters to read at a time
+    @type bufsize: int
+    @return: (segment ordinal, byte offset, byte offset after the segment
+        terminator, segment id, segment string with its terminator) for
+        each ISA, GS, ST, SE, GE and IEA.  Last, (count of segments, end
+        offset, end offset, None, None)
+    @rtype: iterator
+    """
+    raw = RawX12File(fd, bufsize)
+    seg_term = raw.seg_term
+    pattern = _get_pattern(seg_term, raw.ele_term)
+    buf = raw.buffer
+    pos = buf.find(seg_term)  # The ISA was checked by RawX12File
+    yield (0, 0, pos + 1, 'ISA', buf[:pos + 1])
+    base = 0  # byte offset of buf[0]
+    line = 1  # count of the segment terminators up to pos
+    while True:
+        last = buf.rfind(seg_term)
+        for m in pattern.finditer(buf, pos, last + 1):
+            term_pos = m.start()
+            line += buf.count(seg_term, pos + 1, term_pos + 1)
+            pos = term_pos
+            if m.start('seg') == -1:
+                # An empty segment ends the input
+                yield (line, base + pos + 1, base + pos + 1, None, None)
+                return
+            seg_end = buf.find(seg_term, m.end())
+            yield (line, base + m.start('seg'), base + seg_end + 1, m.group('id'),
+                   buf[m.start('id'):seg_end + 1])
+        line += buf.count(seg_term, pos + 1, last + 1)
+        pos = last
+        data = fd.read(bufsize)
+        if not data:
+            break
+        base += pos
+        buf = buf[pos:] + data
+        pos = 0
+    yield (line, base + pos + 1, base + pos + 1, None, None)
+
+
+def _int(str_val):
+    try:
+        return int(str_val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_value(values, idx):
+    return values[idx] if len(values) > idx else None
+
+
+def scan_envelopes(fd, bufsize=DEFAULT_BUFSIZE):
+    """
+    Get the envelope records of an X12 file
+
+    Each interchange, group and transaction set is a dict with the keys
+    offset, end (byte offsets), line (count of the segments before it) and
+    control_number.
+
+    An interchange also has sender_qualifier, sender, receiver_qualifier,
+    receiver, date, time, version (ISA12), usage (ISA15), the ISA segment
+    with its terminator (isa), its groups and group_count (IEA01).
+
+    A group also has fic, sender, receiver, date, time, vriic, its
+    transactions and transaction_count (GE01).
+
+    A transaction set also has id (ST01), seg_count (the count of its
+    segments including the ST and SE) and se_count (SE01).
+
+    The trailer counts are None if the trailer is missing or the count is
+    not a number.  An end is the offset of the next envelope segment if
+    the trailer is missing.
+
+    @param fd: File opened in binary mode, positioned at the start
+    @return: The interchanges
+    @rtype: list[dict]
+    """
+    interchanges = []
+    (isa, gs, st) = (None, None, None)
+    for (line, offset, end, seg_id, seg_str) in iter_envelope_segments(fd, bufsize):
+        if st is not None and seg_id != 'SE':
+            st['end'] = offset
+            st['seg_count'] = line - st['line']
+            st = None
+        if gs is not None and seg_id in ('GS', 'ISA', 'IEA', None):
+            gs['end'] = offset
+            gs = None
+        if isa is not None and seg_id in ('ISA', None):
+            isa['end'] = offset
+            isa = None
+        if seg_id is None:
+            break
+        values = seg_str[:-1].split(seg_str[len(seg_id)])
+        if seg_id == 'ISA':
+            isa = {'offset': offset, 'end': None, 'line': line,
+                   'control_number': _get_value(values, 13),
+                   'sender_qualifier': _get_value(values, 5),
+                   'sender': _get_value(values, 6),
+                   'receiver_qualifier': _get_value(values, 7),
+                   'receiver': _get_value(values, 8),
+                   'date': _get_value(values, 9),
+                   'time': _get_value(values, 10),
+                   'version': _get_value(values, 12),
+                   'usage': _get_value(values, 15),
+                   'isa': seg_str, 'groups': [], 'group_count': None}
+            interchanges.append(isa)
+        elif seg_id == 'IEA':
+            if isa is not None:
+                isa['end'] = end
+                isa['group_count'] = _int(_get_value(values, 1))
+                isa = None
+        elif seg_id == 'GS':
+            if isa is not None:
+                gs = {'offset': offset, 'end': None, 'line': line,
+                      'control_number': _get_value(values, 6),
+                      'fic': _get_value(values, 1),
+                      'sender': _get_value(values, 2),
+                      'receiver': _get_value(values, 3),
+                      'date': _get_value(values, 4),
+                      'time': _get_value(values, 5),
+                      'vriic': _get_value(values, 8),
+                      'transactions': [], 'transaction_count': None}
+                isa['groups'].append(gs)
+        elif seg_id == 'GE':
+            if gs is not None:
+                gs['end'] = end
+                gs['transaction_count'] = _int(_get_value(values, 1))
+                gs = None
+        elif seg_id == 'ST':
+            if gs is not None:
+                st = {'offset': offset, 'end': None, 'line': line,
+                      'control_number': _get_value(values, 2),
+                      'id': _get_value(values, 1),
+                      'seg_count': None, 'se_count': None}
+                gs['transactions'].append(st)
+        elif seg_id == 'SE':
+            if st is not None:
+                st['end'] = end
+                st['seg_count'] = line + 1 - st['line']
+                st['se_count'] = _int(_get_value(values, 1))
+                st = None
+    return interchanges
+
+
+def scan_file(filename, bufsize=DEFAULT_BUFSIZE):
+    """
+    Get the envelope records of an X12 file
+
+    @param filename: X12 file
+    @type filename: string
+    @return: The interchanges, as returned by L{scan_envelopes}
+    @rtype: list[dict]
+    """
+    with open(filename, 'rb') as fd:
+        return scan_envelopes(fd, bufsize)
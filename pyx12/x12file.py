@@ -23,12 +23,73 @@ import sys
 import logging
 
 # Intrapackage imports
+import pyx12.control_store
 import pyx12.errors
 import pyx12.segment
 from pyx12.rawx12file import RawX12File
 
 logger = logging.getLogger('pyx12.x12file')
 
+DEFAULT_BATCH_SIZE = 1000
+
+
+class EnvelopeState(object):
+    """
+    The open envelope loops and the control numbers already used
+
+    The control numbers are kept in sets, and the id of the outermost open
+    loop of each type in a field, so the lookups do not get slower as the
+    file grows.
+    """
+    _id_attrs = {'ISA': 'isa_id', 'GS': 'gs_id', 'ST': 'st_id', 'LS': 'ls_id'}
+
+    def __init__(self):
+        self.loops = []  # (loop type, control number), outermost first
+        self.isa_id = None
+        self.gs_id = None
+        self.st_id = None
+        self.ls_id = None
+        self.isa_ids = set()  # ISA13 values in the file
+        self.gs_ids = set()   # GS06 values in the current interchange
+        self.st_ids = set()   # ST02 values in the current group
+
+    def _set_id(self, loop_type):
+        for (loop_type1, loop_id) in self.loops:
+            if loop_type1 == loop_type:
+                setattr(self, self._id_attrs[loop_type], loop_id)
+                return
+        setattr(self, self._id_attrs[loop_type], None)
+
+    def push(self, loop_type, loop_id):
+        """
+        Open a loop
+
+        @param loop_type: ISA, GS, ST or LS
+        @type loop_type: string
+        @param loop_id: Control number of the loop
+        @type loop_id: string
+        """
+        self.loops.append((loop_type, loop_id))
+        self._set_id(loop_type)
+
+    def pop(self):
+        """
+        Close the innermost loop
+
+        @return: (loop type, control number)
+        @rtype: tuple(string, string)
+        """
+        loop = self.loops.pop()
+        self._set_id(loop[0])
+        return loop
+
+    def top(self):
+        """
+        @return: The innermost loop, (loop type, control number)
+        @rtype: tuple(string, string)
+        """
+        return self.loops[-1]
+
 
 class X12Base(object):
     """
@@ -41,16 +102,13 @@ class X12Base(object):
         Initialize the X12 file
         """
         self.err_list = []
-        self.loops = []
+        self.envelope = EnvelopeState()
         self.hl_stack = []
         self.gs_count = 0
         self.st_count = 0
         self.hl_count = 0
         self.seg_count = 0
         self.cur_line = 0
-        self.isa_ids = []
-        self.gs_ids = []
-        self.st_ids = []
         self.lx_count = 0
         self.check_837_lx = False
         self.isa_usage = None
@@ -59,6 +117,13 @@ class X12Base(object):
         self.subele_term = None
         self.repetition_term = None
 
+    @property
+    def loops(self):
+        """
+        The open envelope loops, (loop type, control number), outermost first
+        """
+        return self.envelope.loops
+
     def Close(self):
         """
         Complete any outstanding tasks
@@ -84,37 +149,37 @@ class X12Base(object):
             if len(seg_data) != 16:
                 raise pyx12.errors.X12Error('The ISA segment must have 16 elements (%s)' % (seg_data))
             interchange_control_number = seg_data.get_value('ISA13')
-            if interchange_control_number in self.isa_ids:
+            if interchange_control_number in self.envelope.isa_ids:
                 err_str = 'ISA Interchange Control Number '
                 err_str += '%s not unique within file' % (interchange_control_number)
                 self._isa_error('025', err_str)
-            self.loops.append(('ISA', interchange_control_number))
-            self.isa_ids.append(interchange_control_number)
+            self.envelope.push('ISA', interchange_control_number)
+            self.envelope.isa_ids.add(interchange_control_number)
             self.gs_count = 0
-            self.gs_ids = []
+            self.envelope.gs_ids = set()
             self.isa_usage = seg_data.get_value('ISA15')
         elif seg_id == 'GS':
             group_control_number = seg_data.get_value('GS06')
-            if group_control_number in self.gs_ids:
+            if group_control_number in self.envelope.gs_ids:
                 err_str = 'GS Interchange Control Number '
                 err_str += '%s not unique within file' % (group_control_number)
                 self._gs_error('6', err_str)
             self.gs_count += 1
-            self.gs_ids.append(group_control_number)
-            self.loops.append(('GS', group_control_number))
+            self.envelope.gs_ids.add(group_control_number)
+            self.envelope.push('GS', group_control_number)
             self.st_count = 0
-            self.st_ids = []
+            self.envelope.st_ids = set()
         elif seg_id == 'ST':
             self.hl_stack = []
             self.hl_count = 0
             transaction_control_number = seg_data.get_value('ST02')
-            if transaction_control_number in self.st_ids:
+            if transaction_control_number in self.envelope.st_ids:
                 err_str = 'ST Interchange Control Number '
                 err_str += '%s not unique within file' % (transaction_control_number)
                 self._st_error('23', err_str)
             self.st_count += 1
-            self.st_ids.append(transaction_control_number)
-            self.loops.append(('ST', transaction_control_number))
+            self.envelope.st_ids.add(transaction_control_number)
+            self.envelope.push('ST', transaction_control_number)
             self.seg_count = 1
             self.hl_count = 0
         #elif seg_id == 'LS':
@@ -125,15 +190,16 @@ class X12Base(object):
         #    del self.loops[-1]
         elif seg_id == 'HL':
             self.hl_count += 1
-            hl_count = seg_data.get_value('HL01')
+            hl_count = seg_data.get_value_at(0)  # HL01
             if self.hl_count != self._int(hl_count):
                 #raise pyx12.errors.X12Error, \
                 #   'My HL count %i does not match your HL count %s' \
                 #    % (self.hl_count, seg[1])
                 err_str = 'My HL count %i does not match your HL count %s' % (self.hl_count, hl_count)
                 self._seg_error('HL1', err_str)
-            if seg_data.get_value('HL02') != '':
-                hl_parent = self._int(seg_data.get_value('HL02'))
+            hl_parent = seg_data.get_value_at(1)  # HL02
+            if hl_parent != '':
+                hl_parent = self._int(hl_parent)
                 if hl_parent not in self.hl_stack:
                     err_str = 'HL parent (%i) is not a valid parent' % (hl_parent)
                     self._seg_error('HL2', err_str)
@@ -149,9 +215,10 @@ class X12Base(object):
             self.lx_count = 0
         elif self.check_837_lx and seg_id == 'LX':
             self.lx_count += 1
-            if seg_data.get_value('LX01') != '%i' % (self.lx_count):
+            lx01 = seg_data.get_value_at(0)
+            if lx01 != '%i' % (self.lx_count):
                 err_str = 'Your 2400/LX01 Service Line Number %s does not match my count of %i' % \
-                    (seg_data.get_value('LX01'), self.lx_count)
+                    (lx01, self.lx_count)
                 self._seg_error('LX', err_str)
         # count all regular segments
         if seg_id not in ('ISA', 'IEA', 'GS', 'GE', 'ST', 'SE'):
@@ -222,10 +289,7 @@ class X12Base(object):
 
         @rtype: string
         """
-        for loop in self.loops:
-            if loop[0] == 'ISA':
-                return loop[1]
-        return None
+        return self.envelope.isa_id
 
     def get_gs_id(self):
         """
@@ -233,10 +297,7 @@ class X12Base(object):
 
         @rtype: string
         """
-        for loop in self.loops:
-            if loop[0] == 'GS':
-                return loop[1]
-        return None
+        return self.envelope.gs_id
 
     def get_st_id(self):
         """
@@ -244,10 +305,7 @@ class X12Base(object):
 
         @rtype: string
         """
-        for loop in self.loops:
-            if loop[0] == 'ST':
-                return loop[1]
-        return None
+        return self.envelope.st_id
 
     def get_ls_id(self):
         """
@@ -255,10 +313,7 @@ class X12Base(object):
 
         @rtype: string
         """
-        for loop in self.loops:
-            if loop[0] == 'LS':
-                return loop[1]
-        return None
+        return self.envelope.ls_id
 
     def get_seg_count(self):
         """
@@ -293,14 +348,20 @@ class X12Reader(X12Base):
     errors can be retrieved using the pop_errors function
     """
 
-    def __init__(self, src_file_obj):
+    def __init__(self, src_file_obj, control_store=None):
         """
         Initialize the file X12 file reader
 
         @param src_file_obj: absolute path of source file or an open,
             readable file object
         @type src_file_obj: string or open file object
+        @param control_store: If not None, ISA and GS control numbers
+            received in earlier files are errors.  The file's control
+            numbers are added to the store as they are read
+        @type control_store: L{ControlNumberStore<control_store.ControlNumberStore>}
         """
+        self.control_store = control_store
+        self.control_keys = set()  # store keys read
         self.fd_in = None
         self.need_to_close = False
         try:
@@ -323,6 +384,7 @@ class X12Reader(X12Base):
         self.subele_term = subele_term
         self.repetition_term = repetition_term
         self.icvn = self.raw.icvn
+        self.control_source = self.fd_in.name if hasattr(self.fd_in, 'name') else None
 
     def __del__(self):
         try:
@@ -340,49 +402,124 @@ class X12Reader(X12Base):
         """
         X12Base._parse_segment(self, seg_data)
         seg_id = seg_data.get_seg_id()
+        if self.control_store is not None and seg_id in ('ISA', 'GS'):
+            self._check_control_store(seg_data)
         if seg_id == 'IEA':
-            if self.loops[-1][0] != 'ISA':
+            if self.envelope.top()[0] != 'ISA':
                 # Unterminated GS loop
-                err_str = 'Unterminated Loop %s' % (self.loops[-1][0])
+                err_str = 'Unterminated Loop %s' % (self.envelope.top()[0])
                 self._isa_error('024', err_str)
-                del self.loops[-1]
-            if self.loops[-1][1] != seg_data.get_value('IEA02'):
+                self.envelope.pop()
+            if self.envelope.top()[1] != seg_data.get_value('IEA02'):
                 err_str = 'IEA id=%s does not match ISA id=%s' % \
-                    (seg_data.get_value('IEA02'), self.loops[-1][1])
+                    (seg_data.get_value('IEA02'), self.envelope.top()[1])
                 self._isa_error('001', err_str)
             if self._int(seg_data.get_value('IEA01')) != self.gs_count:
                 err_str = 'IEA count for IEA02=%s is wrong' % \
                     (seg_data.get_value('IEA02'))
                 self._isa_error('021', err_str)
-            del self.loops[-1]
+            self.envelope.pop()
         elif seg_id == 'GE':
-            if self.loops[-1][0] != 'GS':
-                err_str = 'Unterminated segment %s' % (self.loops[-1][1])
+            if self.envelope.top()[0] != 'GS':
+                err_str = 'Unterminated segment %s' % (self.envelope.top()[1])
                 self._gs_error('3', err_str)
-                del self.loops[-1]
-            if self.loops[-1][1] != seg_data.get_value('GE02'):
+                self.envelope.pop()
+            if self.envelope.top()[1] != seg_data.get_value('GE02'):
                 err_str = 'GE id=%s does not match GS id=%s' % \
-                    (seg_data.get_value('GE02'), self.loops[-1][1])
+                    (seg_data.get_value('GE02'), self.envelope.top()[1])
                 self._gs_error('4', err_str)
             if self._int(seg_data.get_value('GE01')) != self.st_count:
                 err_str = 'GE count of %s for GE02=%s is wrong. I count %i'\
                     % (seg_data.get_value('GE01'),
                        seg_data.get_value('GE02'), self.st_count)
                 self._gs_error('5', err_str)
-            del self.loops[-1]
+            self.envelope.pop()
         elif seg_id == 'SE':
             se_trn_control_num = seg_data.get_value('SE02')
-            if self.loops[-1][0] != 'ST' or \
-                    self.loops[-1][1] != se_trn_control_num:
+            if self.envelope.top()[0] != 'ST' or \
+                    self.envelope.top()[1] != se_trn_control_num:
                 err_str = 'SE id=%s does not match ST id=%s' % \
-                    (se_trn_control_num, self.loops[-1][1])
+                    (se_trn_control_num, self.envelope.top()[1])
                 self._st_error('3', err_str)
             if self._int(seg_data.get_value('SE01')) != self.seg_count + 1:
                 err_str = 'SE count of %s for SE02=%s is wrong. I count %i'\
                     % (seg_data.get_value('SE01'),
                         se_trn_control_num, self.seg_count + 1)
                 self._st_error('4', err_str)
-            del self.loops[-1]
+            self.envelope.pop()
+
+    def _check_control_store(self, seg_data):
+        """
+        Check an ISA or GS control number against earlier files
+        """
+        seg_id = seg_data.get_seg_id()
+        if seg_id == 'ISA':
+            key = pyx12.control_store.get_isa_key(seg_data)
+        else:
+            key = pyx12.control_store.get_gs_key(seg_data)
+        if key in self.control_keys:
+            return
+        self.control_keys.add(key)
+        found = self.control_store.claim(key, self.control_source)
+        if found is None:
+            return
+        if seg_id == 'ISA':
+            err_str = 'ISA Interchange Control Number %s was already received in %s at %s' % \
+                (key[3], found[0], found[1])
+            self._isa_error('025', err_str)
+        else:
+            err_str = 'GS Interchange Control Number %s was already received in %s at %s' % \
+                (key[3], found[0], found[1])
+            self._gs_error('6', err_str)
+
+    def resume(self, offset, isa_line, isa_ids, gs_ids=(), st_ids=(), cur_line=0, end=None):
+        """
+        Continue reading at a segment boundary inside an interchange
+        The envelope state is set as it is after reading the segments
+        before offset, so the following segments are checked and counted
+        as in a read of the whole file.  The source must be seekable.
+
+        @param offset: Byte offset of the next segment
+        @type offset: int
+        @param isa_line: The enclosing ISA segment, with its terminator
+        @type isa_line: string
+        @param isa_ids: ISA control numbers read, ending with the enclosing ISA
+        @type isa_ids: list[string]
+        @param gs_ids: GS control numbers read in the enclosing interchange,
+            ending with the enclosing GS.  Empty if the next segment is a GS
+        @type gs_ids: list[string]
+        @param st_ids: ST control numbers read in the enclosing GS
+        @type st_ids: list[string]
+        @param cur_line: Count of the segments before offset
+        @type cur_line: int
+        @param end: If not None, stop reading at this byte offset
+        @type end: int
+        """
+        self.raw.set_isa(isa_line)
+        (seg_term, ele_term, subele_term, eol, repetition_term) = self.raw.get_term()
+        self.seg_term = seg_term
+        self.ele_term = ele_term
+        self.subele_term = subele_term
+        self.repetition_term = repetition_term
+        self.icvn = self.raw.icvn
+        isa_seg = pyx12.segment.Segment(isa_line[:-1], seg_term, ele_term, subele_term)
+        self.isa_usage = isa_seg.get_value('ISA15')
+        self.err_list = []
+        self.envelope = EnvelopeState()
+        self.envelope.isa_ids.update(isa_ids)
+        self.envelope.push('ISA', isa_ids[-1])
+        self.envelope.gs_ids.update(gs_ids)
+        self.gs_count = len(gs_ids)
+        if gs_ids:
+            self.envelope.push('GS', gs_ids[-1])
+        self.envelope.st_ids.update(st_ids)
+        self.st_count = len(st_ids)
+        self.hl_stack = []
+        self.hl_count = 0
+        self.seg_count = 0
+        self.lx_count = 0
+        self.cur_line = cur_line
+        self.raw.seek(offset, end)
 
     def __iter__(self):
         """
@@ -390,19 +527,53 @@ class X12Reader(X12Base):
         """
         self.err_list = []
         for line in self.raw:
-            # We have not yet incremented cur_line
-            if line.startswith(' ') :
-                err_str = 'Segment contains a leading space'
-                self._seg_error('1', err_str, None, src_line=self.cur_line + 1)
-                line = line.lstrip()
-            if line[-1] == self.ele_term:
-                err_str = 'Segment contains trailing element terminators'
-                self._seg_error('SEG1', err_str, None, src_line=self.cur_line + 1)
-            seg_data = pyx12.segment.Segment(line, self.seg_term, self.ele_term, self.subele_term)
-            self._parse_segment(seg_data)
-            yield(seg_data)
+            yield self._read_segment(line)
         #yield(None)
 
+    def iter_batches(self, n=DEFAULT_BATCH_SIZE):
+        """
+        Iterate over lists of input segments
+        The raw input is tokenized a chunk at a time.  Envelope and
+        segment counters are maintained as each segment is read, so
+        after a batch is returned the counters reflect its last segment.
+        Errors for the whole batch are available from pop_errors.
+
+        @param n: maximum number of segments in each batch
+        @type n: int
+        @rtype: list[L{segment<segment.Segment>}]
+        """
+        self.err_list = []
+        read_segment = self._read_segment
+        batch = []
+        for lines in self.raw.iter_chunks():
+            for line in lines:
+                batch.append(read_segment(line))
+                if len(batch) >= n:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _read_segment(self, line):
+        """
+        Create and check a segment from an input line
+
+        @param line: raw segment string, without the segment terminator
+        @type line: string
+        @rtype: L{segment<segment.Segment>}
+        """
+        # We have not yet incremented cur_line
+        if line.startswith(' '):
+            err_str = 'Segment contains a leading space'
+            self._seg_error('1', err_str, None, src_line=self.cur_line + 1)
+            line = line.lstrip()
+        if line[-1] == self.ele_term:
+            err_str = 'Segment contains trailing element terminators'
+            self._seg_error('SEG1', err_str, None, src_line=self.cur_line + 1)
+        seg_data = pyx12.segment.LazySegment(line, self.seg_term, self.ele_term, self.subele_term)
+        self._parse_segment(seg_data)
+        return seg_data
+
     def cleanup(self):
         """
         At EOF, check for missing loop trailers
@@ -511,11 +682,11 @@ class X12Writer(X12Base):
         @param loop_type: The current ending loop
         @type loop_type: string
         """
-        while len(self.loops) > 0 and self.loops[-1][0] != loop_type:
-            loop = self.loops.pop()
+        while len(self.loops) > 0 and self.envelope.top()[0] != loop_type:
+            loop = self.envelope.pop()
             self._close_loop(loop[0], loop[1])
         if len(self.loops) > 0:
-            loop = self.loops.pop()
+            loop = self.envelope.pop()
             self._close_loop(loop[0], loop[1])
 
     def _close_iea(self, id):
@@ -0,0 +1,195 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Byte offset index of the interchanges, functional groups and transaction
+sets in an X12 file.
+
+The file is scanned once for the envelope segments.  The index can be
+saved to a sidecar file next to the source and is rebuilt when the source
+changes.  A reader can then be positioned at any transaction set, with its
+envelope state restored from the index, so only that transaction set is
+parsed.
+"""
+
+import os
+import os.path
+import json
+import logging
+import tempfile
+
+# Intrapackage imports
+import pyx12.x12envelope
+import pyx12.x12file
+from pyx12.version import __version__
+
+# Increment when the layout of the index file changes
+INDEX_FORMAT = 2
+INDEX_SUFFIX = '.idx'
+
+logger = logging.getLogger('pyx12.x12index')
+
+
+def _str_values(obj):
+    """
+    Convert the unicode keys and values of a decoded JSON object to str
+    """
+    return dict([(str(k), str(v) if isinstance(v, unicode) else v) for (k, v) in obj.items()])
+
+
+class X12Index(object):
+    """
+    Envelope index of an X12 file
+
+    The interchanges, groups and transaction sets are the records of
+    L{scan_envelopes<x12envelope.scan_envelopes>}.
+    """
+    def __init__(self, filename, interchanges=None):
+        """
+        @param filename: The indexed X12 file
+        @type filename: string
+        @param interchanges: Interchange entries.  If None, the file is
+            scanned
+        @type interchanges: list[dict]
+        """
+        self.filename = filename
+        if interchanges is None:
+            with open(filename, 'rb') as fd:
+                interchanges = pyx12.x12envelope.scan_envelopes(fd)
+        self.interchanges = interchanges
+        self.transactions = []  # (interchange, group, transaction)
+        for isa in self.interchanges:
+            for gs in isa['groups']:
+                for st in gs['transactions']:
+                    self.transactions.append((isa, gs, st))
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def find_transaction(self, control_number, gs_control_number=None, isa_control_number=None):
+        """
+        Find a transaction set by its control numbers
+
+        @param control_number: ST02
+        @type control_number: string
+        @param gs_control_number: If not None, the GS06 of its group
+        @type gs_control_number: string
+        @param isa_control_number: If not None, the ISA13 of its interchange
+        @type isa_control_number: string
+        @return: Position of the first matching transaction set, or None
+        @rtype: int
+        """
+        for (n, (isa, gs, st)) in enumerate(self.transactions):
+            if st['control_number'] == control_number \
+                    and gs_control_number in (None, gs['control_number']) \
+                    and isa_control_number in (None, isa['control_number']):
+                return n
+        return None
+
+    def get_reader(self, n, fd=None):
+        """
+        Get a reader of one transaction set.  The reader yields the
+        segments from its ST to its SE, with the envelope state, segment
+        counts and line numbers of a read of the whole file.
+
+        @param n: Position of the transaction set in the file
+        @type n: int
+        @param fd: The indexed file, opened in binary mode.  If None, the
+            file is opened and closed by the reader
+        @rtype: L{X12Reader<x12file.X12Reader>}
+        """
+        (isa, gs, st) = self.transactions[n]
+        if fd is None:
+            src = pyx12.x12file.X12Reader(open(self.filename, 'rb'))
+            src.need_to_close = True
+        else:
+            src = pyx12.x12file.X12Reader(fd)
+        isa_pos = self.interchanges.index(isa)
+        gs_pos = isa['groups'].index(gs)
+        st_pos = gs['transactions'].index(st)
+        src.resume(st['offset'], isa['isa'],
+                   [x['control_number'] for x in self.interchanges[:isa_pos + 1]],
+                   [x['control_number'] for x in isa['groups'][:gs_pos + 1]],
+                   [x['control_number'] for x in gs['transactions'][:st_pos]],
+                   st['line'], st['end'])
+        return src
+
+    def save(self, index_filename=None):
+        """
+        Write the index to a sidecar file.  Failures are logged, not raised.
+
+        @param index_filename: If None, the source file name with
+            INDEX_SUFFIX added
+        @type index_filename: string
+        """
+        if index_filename is None:
+            index_filename = self.filename + INDEX_SUFFIX
+        stat = os.stat(self.filename)
+        doc = {'format': INDEX_FORMAT, 'version': __version__, 'size': stat.st_size,
+               'mtime': stat.st_mtime, 'interchanges': self.interchanges}
+        tmp_filename = None
+        try:
+            (fd, tmp_filename) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_filename)))
+            with os.fdopen(fd, 'wb') as fd_tmp:
+                json.dump(doc, fd_tmp)
+            os.rename(tmp_filename, index_filename)
+        except Exception:
+            logger.warning('Could not save index file "%s"' % (index_filename))
+            if tmp_filename is not None and os.path.isfile(tmp_filename):
+                os.remove(tmp_filename)
+
+    @classmethod
+    def load(cls, filename, index_filename=None):
+        """
+        Read the index of a file from its sidecar file
+
+        @param filename: The indexed X12 file
+        @type filename: string
+        @param index_filename: If None, the source file name with
+            INDEX_SUFFIX added
+        @type index_filename: string
+        @return: The index, or None if the sidecar file is missing,
+            unreadable or older than the source
+        @rtype: L{X12Index}
+        """
+        if index_filename is None:
+            index_filename = filename + INDEX_SUFFIX
+        try:
+            with open(index_filename, 'rb') as fd:
+                doc = json.load(fd, object_hook=_str_values)
+        except IOError:
+            return None
+        except Exception:
+            logger.warning('Index file "%s" is unreadable' % (index_filename))
+            return None
+        stat = os.stat(filename)
+        if doc.get('format') != INDEX_FORMAT or doc.get('version') != __version__ \
+                or doc.get('size') != stat.st_size or doc.get('mtime') != stat.st_mtime:
+            return None
+        return cls(filename, doc['interchanges'])
+
+
+def get_index(filename, index_filename=None):
+    """
+    Get the index of a file, from its sidecar file if it is current.
+    Otherwise scan the file and save the index.
+
+    @param filename: X12 file
+    @type filename: string
+    @param index_filename: If None, the source file name with INDEX_SUFFIX
+        added
+    @type index_filename: string
+    @rtype: L{X12Index}
+    """
+    index = X12Index.load(filename, index_filename)
+    if index is None:
+        index = X12Index(filename)
+        index.save(index_filename)
+    return index
@@ -16,14 +16,18 @@ Create XML, HTML, and 997/999 documents based on the data file.
 import logging
 
 # Intrapackage imports
+import pyx12.control_store
+import pyx12.error_ack
 import pyx12.error_handler
 import pyx12.error_997
 import pyx12.error_999
 import pyx12.error_html
 import pyx12.errors
 import pyx12.map_index
-import pyx12.map_if
+import pyx12.map_registry
+import pyx12.params
 import pyx12.x12file
+import pyx12.x12n_parallel
 from pyx12.map_walker import walk_tree
 import pyx12.x12xml_simple
 
@@ -46,8 +50,40 @@ def _reset_counter_to_gs_counts(walker):
     walker.counter.increment('/ISA_LOOP/GS_LOOP/GS')
 
 
+def write_ack(errh, fd_997, fic, vriic, term):
+    """
+    Write the 997 or 999 for the error tree, unless the source was itself
+    a 997/999
+
+    @param errh: Error handler
+    @type errh: L{error_handler.err_handler}
+    @param fd_997: 997/999 output document
+    @type fd_997: file descriptor
+    @param fic: Functional Identifier Code of the last GS loop
+    @param vriic: Version of the last GS loop
+    @param term: Source terminators
+    """
+    logger = logging.getLogger('pyx12')
+    #If this transaction is not a 997/999, generate one.
+    ack_type = pyx12.error_ack.get_ack_type(fic, vriic)
+    if fd_997 and ack_type == '997':
+        try:
+            visit_997 = pyx12.error_997.error_997_visitor(fd_997, term)
+            errh.accept(visit_997)
+            del visit_997
+        except Exception:
+            logger.exception('Failed to create 997 response')
+    if fd_997 and ack_type == '999':
+        try:
+            visit_999 = pyx12.error_999.error_999_visitor(fd_997, term)
+            errh.accept(visit_999)
+            del visit_999
+        except Exception:
+            logger.exception('Failed to create 999 response')
+
+
 def x12n_document(param, src_file, fd_997, fd_html,
-                  fd_xmldoc=None, xslt_files=None, map_path=None):
+                  fd_xmldoc=None, xslt_files=None, map_path=None, error_sinks=None):
     """
     Primary X12 validation function
     @param param: pyx12.param instance
@@ -59,165 +95,206 @@ def x12n_document(param, src_file, fd_997, fd_html,
     @type fd_html: file descriptor
     @param fd_xmldoc: XML output document
     @type fd_xmldoc: file descriptor
+    @param error_sinks: Receivers of the error events, as they are raised
+    @type error_sinks: list[callable]
     @rtype: boolean
+
+    If the parameter workers is more than 1, the transaction sets are
+    validated by a pool of worker processes.
+
+    The parameter validation_level selects the checks done, see
+    L{VALIDATION_LEVELS<params.VALIDATION_LEVELS>}.  At the envelope level
+    the transaction set maps are not used, and there is no XML output.
     """
+    level = pyx12.params.get_validation_level(param)
+    if level == pyx12.params.LEVEL_ENVELOPE and fd_xmldoc:
+        raise pyx12.errors.EngineError('The XML output needs the map of the transaction set')
+    check_structure = level >= pyx12.params.LEVEL_STRUCTURE
+    check_elements = level >= pyx12.params.LEVEL_ELEMENTS
+    check_relations = level >= pyx12.params.LEVEL_FULL
+    workers = param.get('workers')
+    if workers is not None and workers > 1 and check_structure:
+        return pyx12.x12n_parallel.x12n_document_parallel(param, src_file, fd_997, fd_html,
+                                                          fd_xmldoc, xslt_files, map_path, workers,
+                                                          error_sinks)
     logger = logging.getLogger('pyx12')
-    errh = pyx12.error_handler.err_handler()
+    # The error tree of the closed ST loops is only needed by the outputs
+    errh = pyx12.error_handler.err_handler(keep_tree=bool(fd_997 or fd_html))
+    for sink in error_sinks or []:
+        errh.add_sink(sink)
 
-    # Get X12 DATA file
+    control_store = None
+    if param.get('control_store'):
+        control_store = pyx12.control_store.ControlNumberStore(param.get('control_store'))
     try:
-        src = pyx12.x12file.X12Reader(src_file)
-    except pyx12.errors.X12Error:
-        logger.error('"%s" does not look like an X12 data file' % (src_file))
-        return False
+        # Get X12 DATA file
+        try:
+            src = pyx12.x12file.X12Reader(src_file, control_store)
+        except pyx12.errors.X12Error:
+            logger.error('"%s" does not look like an X12 data file' % (src_file))
+            return False
 
-    #Get Map of Control Segments
-    map_file = 'x12.control.00501.xml' if src.icvn == '00501' else 'x12.control.00401.xml'
-    logger.debug('X12 control file: %s' % (map_file))
-    control_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-    map_index_if = pyx12.map_index.map_index(map_path)
-    node = control_map.getnodebypath('/ISA_LOOP/ISA')
-    walker = walk_tree()
-    icvn = fic = vriic = tspc = None
-    cur_map = None  # we do not initially know the X12 transaction type
-    #XXX Generate TA1 if needed.
+        # Generate the 997/999 of each group as it is closed, unless the HTML
+        # output needs the whole error tree
+        ack = None
+        if fd_997 and not fd_html:
+            ack = pyx12.error_ack.ack_writer(errh, fd_997, src.get_term())
 
-    if fd_html:
-        html = pyx12.error_html.error_html(errh, fd_html, src.get_term())
-        html.header()
-        err_iter = pyx12.error_handler.err_iter(errh)
-    if fd_xmldoc:
-        xmldoc = pyx12.x12xml_simple.x12xml_simple(fd_xmldoc, param.get('simple_dtd'))
+        #Get Map of Control Segments
+        map_file = 'x12.control.00501.xml' if src.icvn == '00501' else 'x12.control.00401.xml'
+        logger.debug('X12 control file: %s' % (map_file))
+        control_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
+        map_index_if = pyx12.map_index.map_index(map_path)
+        node = control_map.getnodebypath('/ISA_LOOP/ISA')
+        walker = walk_tree(cache_size=param.get('walk_cache_size') or 0)
+        icvn = fic = vriic = tspc = None
+        cur_map = None  # we do not initially know the X12 transaction type
+        #XXX Generate TA1 if needed.
 
-    #basedir = os.path.dirname(src_file)
-    #erx = errh_xml.err_handler(basedir=basedir)
+        if fd_html:
+            html = pyx12.error_html.error_html(errh, fd_html, src.get_term())
+            html.header()
+            err_iter = pyx12.error_handler.err_iter(errh)
+        if fd_xmldoc:
+            xmldoc = pyx12.x12xml_simple.x12xml_simple(fd_xmldoc, param.get('simple_dtd'))
 
-    valid = True
-    for seg in src:
-        #find node
-        orig_node = node
+        #basedir = os.path.dirname(src_file)
+        #erx = errh_xml.err_handler(basedir=basedir)
 
-        if False:
-            print('--------------------------------------------')
-            print(seg)
-            print('--------------------------------------------')
-            # reset to control map for ISA and GS loops
-            print('------- counters before --------')
-            print(walker.counter._dict)
-        if seg.get_seg_id() == 'ISA':
-            node = control_map.getnodebypath('/ISA_LOOP/ISA')
-            walker.forceWalkCounterToLoopStart('/ISA_LOOP', '/ISA_LOOP/ISA')
-        elif seg.get_seg_id() == 'GS':
-            node = control_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
-            walker.forceWalkCounterToLoopStart('/ISA_LOOP/GS_LOOP', '/ISA_LOOP/GS_LOOP/GS')
-        else:
-            # from the current node, find the map node matching the segment
-            # keep track of the loops traversed
-            try:
-                (node, pop_loops, push_loops) = walker.walk(node, seg, errh,
-                    src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
-            except pyx12.errors.EngineError:
-                logger.error('Source file line %i' % (src.get_cur_line()))
-                raise
+        valid = True
+        for seg in src:
+            #find node
+            orig_node = node
 
-        if False:
-            print('------- counters after --------')
-            print(walker.counter._dict)
-        if node is None:
-            node = orig_node
-        else:
+            if False:
+                print('--------------------------------------------')
+                print(seg)
+                print('--------------------------------------------')
+                # reset to control map for ISA and GS loops
+                print('------- counters before --------')
+                print(walker.counter.getState())
             if seg.get_seg_id() == 'ISA':
-                errh.add_isa_loop(seg, src)
-                icvn = seg.get_value('ISA12')
-                errh.handle_errors(src.pop_errors())
-            elif seg.get_seg_id() == 'IEA':
-                errh.handle_errors(src.pop_errors())
-                errh.close_isa_loop(node, seg, src)
-                # Generate 997
-                #XXX Generate TA1 if needed.
+                node = control_map.getnodebypath('/ISA_LOOP/ISA')
+                walker.forceWalkCounterToLoopStart('/ISA_LOOP', '/ISA_LOOP/ISA')
             elif seg.get_seg_id() == 'GS':
-                fic = seg.get_value('GS01')
-                vriic = seg.get_value('GS08')
-                map_file_new = map_index_if.get_filename(icvn, vriic, fic)
-                if map_file != map_file_new:
-                    map_file = map_file_new
-                    if map_file is None:
-                        err_str = "Map not found.  icvn={}, fic={}, vriic={}".format(icvn, fic, vriic)
-                        raise pyx12.errors.EngineError(err_str)
-                    cur_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-                    src.check_837_lx = True if cur_map.id == '837' else False
-                    logger.debug('Map file: %s' % (map_file))
-                    #apply_loop_count(orig_node, cur_map)
-                    #reset_isa_counts(cur_map)
-                    #_reset_counter_to_isa_counts(walker)  # new counter
-                #reset_gs_counts(cur_map)
-                #_reset_counter_to_gs_counts(walker)  # new counter
-                node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
-                errh.add_gs_loop(seg, src)
-                errh.handle_errors(src.pop_errors())
-            elif seg.get_seg_id() == 'BHT':
-                # special case for 4010 837P
-                if vriic in ('004010X094', '004010X094A1'):
-                    tspc = seg.get_value('BHT02')
-                    logger.debug('icvn=%s, fic=%s, vriic=%s, tspc=%s' %
-                                 (icvn, fic, vriic, tspc))
-                    map_file_new = map_index_if.get_filename(icvn, vriic, fic, tspc)
-                    logger.debug('New map file: %s' % (map_file_new))
-                    if map_file != map_file_new:
-                        map_file = map_file_new
-                        if map_file is None:
-                            err_str = "Map not found.  icvn={}, fic={}, vriic={}, tspc={}".format(
-                                        icvn, fic, vriic, tspc)
-                            raise pyx12.errors.EngineError(err_str)
-                        cur_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-                        src.check_837_lx = True if cur_map.id == '837' else False
-                        logger.debug('Map file: %s' % (map_file))
-                        #apply_loop_count(node, cur_map)
-                        node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
-                errh.add_seg(node, seg, src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
-                errh.handle_errors(src.pop_errors())
-            elif seg.get_seg_id() == 'GE':
-                errh.handle_errors(src.pop_errors())
-                errh.close_gs_loop(node, seg, src)
-            elif seg.get_seg_id() == 'ST':
-                errh.add_st_loop(seg, src)
-                errh.handle_errors(src.pop_errors())
-            elif seg.get_seg_id() == 'SE':
-                errh.handle_errors(src.pop_errors())
-                errh.close_st_loop(node, seg, src)
+                node = control_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+                walker.forceWalkCounterToLoopStart('/ISA_LOOP/GS_LOOP', '/ISA_LOOP/GS_LOOP/GS')
+            elif not check_structure:
+                # The segments are not walked
+                node = None
             else:
-                errh.add_seg(node, seg, src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
-                errh.handle_errors(src.pop_errors())
+                # from the current node, find the map node matching the segment
+                # keep track of the loops traversed
+                try:
+                    (node, pop_loops, push_loops) = walker.walk(node, seg, errh,
+                        src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
+                except pyx12.errors.EngineError:
+                    logger.error('Source file line %i' % (src.get_cur_line()))
+                    raise
 
-            #errh.set_cur_line(src.get_cur_line())
-            valid &= node.is_valid(seg, errh)
-            #erx.handleErrors(src.pop_errors())
-            #erx.handleErrors(errh.get_errors())
-            #errh.reset()
+            if False:
+                print('------- counters after --------')
+                print(walker.counter.getState())
+            if node is None and check_structure:
+                node = orig_node
+            else:
+                if seg.get_seg_id() == 'ISA':
+                    errh.add_isa_loop(seg, src)
+                    icvn = seg.get_value('ISA12')
+                    errh.handle_errors(src.pop_errors())
+                elif seg.get_seg_id() == 'IEA':
+                    errh.handle_errors(src.pop_errors())
+                    errh.close_isa_loop(node, seg, src)
+                    # Generate 997
+                    #XXX Generate TA1 if needed.
+                elif seg.get_seg_id() == 'GS':
+                    fic = seg.get_value('GS01')
+                    vriic = seg.get_value('GS08')
+                    if check_structure:
+                        map_file_new = map_index_if.get_filename(icvn, vriic, fic)
+                        if map_file != map_file_new:
+                            map_file = map_file_new
+                            if map_file is None:
+                                err_str = "Map not found.  icvn={}, fic={}, vriic={}".format(icvn, fic, vriic)
+                                raise pyx12.errors.EngineError(err_str)
+                            cur_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
+                            src.check_837_lx = True if cur_map.id == '837' else False
+                            logger.debug('Map file: %s' % (map_file))
+                            #apply_loop_count(orig_node, cur_map)
+                            #reset_isa_counts(cur_map)
+                            #_reset_counter_to_isa_counts(walker)  # new counter
+                        #reset_gs_counts(cur_map)
+                        #_reset_counter_to_gs_counts(walker)  # new counter
+                        node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+                    errh.add_gs_loop(seg, src)
+                    errh.handle_errors(src.pop_errors())
+                elif seg.get_seg_id() == 'BHT':
+                    # special case for 4010 837P
+                    if check_structure and vriic in ('004010X094', '004010X094A1'):
+                        tspc = seg.get_value('BHT02')
+                        logger.debug('icvn=%s, fic=%s, vriic=%s, tspc=%s' %
+                                     (icvn, fic, vriic, tspc))
+                        map_file_new = map_index_if.get_filename(icvn, vriic, fic, tspc)
+                        logger.debug('New map file: %s' % (map_file_new))
+                        if map_file != map_file_new:
+                            map_file = map_file_new
+                            if map_file is None:
+                                err_str = "Map not found.  icvn={}, fic={}, vriic={}, tspc={}".format(
+                                            icvn, fic, vriic, tspc)
+                                raise pyx12.errors.EngineError(err_str)
+                            cur_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
+                            src.check_837_lx = True if cur_map.id == '837' else False
+                            logger.debug('Map file: %s' % (map_file))
+                            #apply_loop_count(node, cur_map)
+                            node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
+                    errh.add_seg(node, seg, src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
+                    errh.handle_errors(src.pop_errors())
+                elif seg.get_seg_id() == 'GE':
+                    errh.handle_errors(src.pop_errors())
+                    errh.close_gs_loop(node, seg, src)
+                elif seg.get_seg_id() == 'ST':
+                    errh.add_st_loop(seg, src)
+                    errh.handle_errors(src.pop_errors())
+                elif seg.get_seg_id() == 'SE':
+                    errh.handle_errors(src.pop_errors())
+                    errh.close_st_loop(node, seg, src)
+                else:
+                    errh.add_seg(node, seg, src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
+                    errh.handle_errors(src.pop_errors())
 
-        if fd_html:
-            if node is not None and node.is_first_seg_in_loop():
-                html.loop(node.get_parent())
-            err_node_list = []
-            while True:
-                try:
-                    err_iter.next()
-                    err_node = err_iter.get_cur_node()
-                    err_node_list.append(err_node)
-                except pyx12.errors.IterOutOfBounds:
-                    break
-            html.gen_seg(seg, src, err_node_list)
+                #errh.set_cur_line(src.get_cur_line())
+                if check_elements:
+                    valid &= node.is_valid(seg, errh, check_relations)
+                #erx.handleErrors(src.pop_errors())
+                #erx.handleErrors(errh.get_errors())
+                #errh.reset()
 
-        if fd_xmldoc:
-            xmldoc.seg(node, seg)
+            if fd_html:
+                if node is not None and node.is_first_seg_in_loop():
+                    html.loop(node.get_parent())
+                err_node_list = []
+                while True:
+                    try:
+                        err_iter.next()
+                        err_node = err_iter.get_cur_node()
+                        err_node_list.append(err_node)
+                    except pyx12.errors.IterOutOfBounds:
+                        break
+                html.gen_seg(seg, src, err_node_list)
 
-        if False:
-            print('\n\n')
-        #erx.Write(src.cur_line)
+            if fd_xmldoc:
+                xmldoc.seg(node, seg)
 
-    #erx.handleErrors(src.pop_errors())
-    src.cleanup()  # Catch any skipped loop trailers
-    errh.handle_errors(src.pop_errors())
+            if False:
+                print('\n\n')
+            #erx.Write(src.cur_line)
+
+        #erx.handleErrors(src.pop_errors())
+        src.cleanup()  # Catch any skipped loop trailers
+        errh.handle_errors(src.pop_errors())
+    finally:
+        if control_store is not None:
+            control_store.close()
     #erx.handleErrors(src.pop_errors())
     #erx.handleErrors(errh.get_errors())
 
@@ -231,22 +308,10 @@ def x12n_document(param, src_file, fd_997, fd_html,
     #visit_debug = pyx12.error_debug.error_debug_visitor(sys.stdout)
     #errh.accept(visit_debug)
 
-    #If this transaction is not a 997/999, generate one.
-    if fd_997 and fic != 'FA':
-        if vriic and vriic[:6] == '004010':
-            try:
-                visit_997 = pyx12.error_997.error_997_visitor(fd_997, src.get_term())
-                errh.accept(visit_997)
-                del visit_997
-            except Exception:
-                logger.exception('Failed to create 997 response')
-        if vriic and vriic[:6] == '005010':
-            try:
-                visit_999 = pyx12.error_999.error_999_visitor(fd_997, src.get_term())
-                errh.accept(visit_999)
-                del visit_999
-            except Exception:
-                logger.exception('Failed to create 999 response')
+    if ack is not None:
+        ack.finish(fic, vriic)
+    else:
+        write_ack(errh, fd_997, fic, vriic, src.get_term())
     del node
     del src
     del control_map
@@ -0,0 +1,654 @@
+######################################################################
+# Copyright (c)
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Validate the transaction sets of an X12N data file in parallel.
+
+The main process reads the file, checks the envelopes, builds the error
+tree and writes the outputs, as x12n_document does.  The segments of each
+run of ST/SE transaction sets are sent to a pool of worker processes,
+which walk the map and validate the segments.  A worker records the errors
+it finds, and the map node of each segment.  The main process applies
+them to the error tree in file order, so the 997/999, HTML and XML
+outputs are the same as for a serial run.
+
+A worker starts from a predicted walker state, the state at the end of a
+well formed previous transaction set.  The worker records every count it
+read from the starting state.  If the actual state differs in any of
+them, the transaction sets are validated again in the main process.
+"""
+
+import logging
+import multiprocessing
+from collections import deque
+
+# Intrapackage imports
+import pyx12.control_store
+import pyx12.error_ack
+import pyx12.error_handler
+import pyx12.error_html
+import pyx12.errors
+import pyx12.map_index
+import pyx12.map_registry
+import pyx12.params
+import pyx12.x12file
+import pyx12.x12xml_simple
+from pyx12.map_walker import walk_tree
+from pyx12.nodeCounter import NodeCounter, get_path_id, _path_parents, _path_strs
+
+# Most segments sent to a worker in one task
+BATCH_SIZE = 1000
+# Most tasks waiting for their results, for each worker
+TASKS_PER_WORKER = 4
+
+logger = logging.getLogger('pyx12.x12n_parallel')
+
+_node_indexes = {}  # id(map) -> (map, map file, nodes, {id(node): index})
+_map_indexes = {}   # map path -> map_index
+_worker_param = None
+_worker_map_path = None
+
+
+def _iter_map_nodes(node):
+    """
+    Iterate over every node of a map, in a fixed order
+    """
+    yield node
+    if node.is_map_root() or node.is_loop():
+        children = node.child_nodes
+    else:
+        children = node.children
+    for child in children:
+        for sub_node in _iter_map_nodes(child):
+            yield sub_node
+
+
+def _get_map(map_file, param, map_path):
+    """
+    Get a shared map, and index its nodes so they can be passed between
+    processes as (map file, index)
+
+    @rtype: pyx12.map_if
+    """
+    imap = pyx12.map_registry.load_map_file(map_file, param, map_path)
+    if id(imap) not in _node_indexes:
+        nodes = list(_iter_map_nodes(imap))
+        _node_indexes[id(imap)] = (imap, map_file, nodes,
+                                   dict([(id(node), idx) for (idx, node) in enumerate(nodes)]))
+    return imap
+
+
+def _get_node_ref(node):
+    """
+    @return: (map file, node index)
+    @rtype: tuple
+    """
+    map_root = node if node.is_map_root() else node.root
+    (imap, map_file, nodes, node_idx) = _node_indexes[id(map_root)]
+    return (map_file, node_idx[id(node)])
+
+
+def _get_node(node_ref, param, map_path):
+    """
+    @param node_ref: (map file, node index)
+    @rtype: L{node<map_if.x12_node>}
+    """
+    imap = _get_map(node_ref[0], param, map_path)
+    return _node_indexes[id(imap)][2][node_ref[1]]
+
+
+def _get_map_index(map_path):
+    map_index_if = _map_indexes.get(map_path)
+    if map_index_if is None:
+        map_index_if = pyx12.map_index.map_index(map_path)
+        _map_indexes[map_path] = map_index_if
+    return map_index_if
+
+
+class _SegmentId(object):
+    """
+    Stands in for a segment when only its ID is used
+    """
+    def __init__(self, seg_id):
+        self.seg_id = seg_id
+
+    def get_seg_id(self):
+        return self.seg_id
+
+
+class _SourceState(object):
+    """
+    The reader state after a segment was read.  Used in place of the reader
+    when the segment is handled after later segments have been read.
+    """
+    def __init__(self, src):
+        """
+        @param src: X12file source
+        @type src: L{X12file<x12file.X12Reader>}
+        """
+        self.cur_line = src.get_cur_line()
+        self.seg_count = src.get_seg_count()
+        self.st_count = src.st_count
+        self.isa_id = src.get_isa_id()
+        self.gs_id = src.get_gs_id()
+        self.st_id = src.get_st_id()
+        self.ls_id = src.get_ls_id()
+        self.errors = src.pop_errors()
+
+    def get_cur_line(self):
+        return self.cur_line
+
+    def get_seg_count(self):
+        return self.seg_count
+
+    def get_isa_id(self):
+        return self.isa_id
+
+    def get_gs_id(self):
+        return self.gs_id
+
+    def get_st_id(self):
+        return self.st_id
+
+    def get_ls_id(self):
+        return self.ls_id
+
+
+class _ErrorRecorder(object):
+    """
+    Records the error handler calls made by the walker and the map nodes,
+    to be applied to the error handler of the main process
+    """
+    def __init__(self):
+        self.calls = []
+
+    def pop_calls(self):
+        """
+        @return: The recorded calls, or None
+        """
+        calls = self.calls
+        self.calls = []
+        return calls or None
+
+    def add_seg(self, map_node, seg_data, seg_count, cur_line, ls_id):
+        node_ref = _get_node_ref(map_node) if map_node is not None else None
+        self.calls.append(('add_seg', (node_ref, seg_data.get_seg_id(), seg_count, cur_line, ls_id)))
+
+    def add_ele(self, map_node):
+        self.calls.append(('add_ele', (_get_node_ref(map_node),)))
+
+    def seg_error(self, err_cde, err_str, err_value=None, src_line=None):
+        self.calls.append(('seg_error', (err_cde, err_str, err_value, src_line)))
+
+    def ele_error(self, err_cde, err_str, bad_value, refdes=None):
+        self.calls.append(('ele_error', (err_cde, err_str, bad_value, refdes)))
+
+
+def _apply_calls(errh, calls, param, map_path):
+    """
+    Apply recorded error handler calls
+    """
+    for (name, args) in calls:
+        if name == 'add_seg':
+            (node_ref, seg_id, seg_count, cur_line, ls_id) = args
+            map_node = _get_node(node_ref, param, map_path) if node_ref is not None else None
+            errh.add_seg(map_node, _SegmentId(seg_id), seg_count, cur_line, ls_id)
+        elif name == 'add_ele':
+            errh.add_ele(_get_node(args[0], param, map_path))
+        else:
+            getattr(errh, name)(*args)
+
+
+class _TrackingCounter(NodeCounter):
+    """
+    Node counter which records the starting counts it depends on
+    """
+    def __init__(self, initialCounts=None):
+        NodeCounter.__init__(self, initialCounts)
+        self.reads = {}          # path id -> starting count read
+        self.written = set()     # path ids counted since the start
+        self.reset_ids = set()   # path ids whose children were reset
+
+    def _is_known(self, path_id):
+        """
+        Is the count no longer the starting count?
+        """
+        if path_id in self.written:
+            return True
+        parent_id = _path_parents[path_id]
+        while parent_id is not None:
+            if parent_id in self.reset_ids:
+                return True
+            parent_id = _path_parents[parent_id]
+        return False
+
+    def get_count(self, xpath):
+        path_id = get_path_id(xpath)
+        count = self._counts.get(path_id, 0)
+        if path_id not in self.reads and not self._is_known(path_id):
+            self.reads[path_id] = count
+        return count
+
+    def increment(self, xpath):
+        path_id = get_path_id(xpath)
+        self.get_count(path_id)
+        NodeCounter.increment(self, path_id)
+        self.written.add(path_id)
+
+    def reset_to_node(self, xpath):
+        path_id = get_path_id(xpath)
+        NodeCounter.reset_to_node(self, path_id)
+        self.reset_ids.add(path_id)
+
+    def get_changes(self):
+        """
+        @return: The starting counts read, the paths whose children were
+            reset, and the final counts of the paths counted
+        @rtype: (list[(string, int)], list[string], list[(string, int)])
+        """
+        reads = [(_path_strs[path_id], count) for (path_id, count) in self.reads.items()]
+        resets = [_path_strs[path_id] for path_id in self.reset_ids]
+        counts = [(_path_strs[path_id], self._counts[path_id])
+                  for path_id in self.written if path_id in self._counts]
+        return (reads, resets, counts)
+
+
+def _validate_segments(param, map_path, task):
+    """
+    Walk and validate a run of transaction set segments
+
+    @param task: (map file, icvn, fic, vriic, starting node reference,
+        starting counts, [(segment, segment count, line, LS id)])
+    @return: A result for each segment, the final node reference, the
+        final map file and the counter changes.  Each segment result is (walk errors, found,
+        node reference, validation errors, valid).
+    """
+    (map_file, icvn, fic, vriic, start_ref, start_counts, seg_list) = task
+    level = pyx12.params.get_validation_level(param)
+    cur_map = _get_map(map_file, param, map_path)
+    node = _get_node(start_ref, param, map_path)
+    walker = walk_tree(cache_size=param.get('walk_cache_size') or 0)
+    counter = _TrackingCounter(start_counts)
+    walker.counter = counter
+    errh = _ErrorRecorder()
+    results = []
+    for (seg, seg_count, cur_line, ls_id) in seg_list:
+        orig_node = node
+        try:
+            (node, pop_loops, push_loops) = walker.walk(node, seg, errh, seg_count, cur_line, ls_id)
+        except pyx12.errors.EngineError:
+            logger.error('Source file line %i' % (cur_line))
+            raise
+        walk_calls = errh.pop_calls()
+        if node is None:
+            node = orig_node
+            results.append((walk_calls, False, _get_node_ref(node), None, True))
+            continue
+        if seg.get_seg_id() == 'BHT' and vriic in ('004010X094', '004010X094A1'):
+            # special case for 4010 837P
+            tspc = seg.get_value('BHT02')
+            map_file_new = _get_map_index(map_path).get_filename(icvn, vriic, fic, tspc)
+            if map_file != map_file_new:
+                map_file = map_file_new
+                if map_file is None:
+                    err_str = "Map not found.  icvn={}, fic={}, vriic={}, tspc={}".format(
+                        icvn, fic, vriic, tspc)
+                    raise pyx12.errors.EngineError(err_str)
+                cur_map = _get_map(map_file, param, map_path)
+                node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
+        valid = True
+        if level >= pyx12.params.LEVEL_ELEMENTS:
+            valid = node.is_valid(seg, errh, level >= pyx12.params.LEVEL_FULL)
+        results.append((walk_calls, True, _get_node_ref(node), errh.pop_calls(), valid))
+    return (results, _get_node_ref(node), map_file, counter.get_changes())
+
+
+def _init_worker(param_values, map_path):
+    global _worker_param, _worker_map_path
+    _worker_param = pyx12.params.ParamsBase()
+    _worker_param.params.update(param_values)
+    _worker_map_path = map_path
+
+
+def _run_task(task):
+    return _validate_segments(_worker_param, _worker_map_path, task)
+
+
+class _ParallelDocument(object):
+    """
+    The main process side of a parallel validation
+    """
+    def __init__(self, param, src, errh, map_path, workers, fd_html, fd_xmldoc):
+        self.param = param
+        self.src = src
+        self.errh = errh
+        self.map_path = map_path
+        self.workers = workers
+        self.level = pyx12.params.get_validation_level(param)
+        self.walker = walk_tree(cache_size=param.get('walk_cache_size') or 0)
+        self.map_index_if = pyx12.map_index.map_index(map_path)
+        self.map_file = 'x12.control.00501.xml' if src.icvn == '00501' else 'x12.control.00401.xml'
+        logger.debug('X12 control file: %s' % (self.map_file))
+        self.control_map = _get_map(self.map_file, param, map_path)
+        self.cur_map = None  # we do not initially know the X12 transaction type
+        self.icvn = self.fic = self.vriic = None
+        self.walk_map_file = self.map_file  # map file of self.node
+        self.node = self.control_map.getnodebypath('/ISA_LOOP/ISA')
+        self.valid = True
+        self.errors = []  # reader errors not yet handled
+        self.pool = None
+        self.pending = deque()
+        self.html = None
+        self.xmldoc = None
+        if fd_html:
+            self.html = pyx12.error_html.error_html(errh, fd_html, src.get_term())
+            self.html.header()
+            self.err_iter = pyx12.error_handler.err_iter(errh)
+        if fd_xmldoc:
+            self.xmldoc = pyx12.x12xml_simple.x12xml_simple(fd_xmldoc, param.get('simple_dtd'))
+
+    def run(self):
+        """
+        Read the source.  Send runs of transaction set segments to the
+        workers, and handle the results and the other segments in order.
+        """
+        batch = []
+        batch_start = None
+        st_loops = 0  # ST loops read in the current GS loop
+        seg_iter = iter(self.src)
+        try:
+            while True:
+                try:
+                    seg = next(seg_iter)
+                except StopIteration:
+                    break
+                except Exception:
+                    # A serial run handles the segments read before the error first
+                    self._flush(batch, batch_start)
+                    raise
+                seg_id = seg.get_seg_id()
+                seg_src = _SourceState(self.src)
+                if batch and (seg_id in ('ISA', 'IEA', 'GS', 'GE')
+                              or (seg_id == 'ST' and batch[-1][0].get_seg_id() == 'SE'
+                                  and len(batch) >= BATCH_SIZE)):
+                    self._submit_batch(batch, batch_start)
+                    batch = []
+                if seg_id == 'ISA':
+                    self.icvn = seg.get_value('ISA12')
+                elif seg_id == 'GS':
+                    try:
+                        self._set_gs_map(seg)
+                    except Exception:
+                        self._flush(batch, batch_start)
+                        raise
+                    st_loops = 0
+                elif seg_id == 'ST' and self.cur_map is not None and not batch:
+                    batch_start = _predict_start(self.cur_map, st_loops)
+                if batch or (seg_id == 'ST' and self.cur_map is not None):
+                    batch.append((seg, seg_src))
+                    if seg_id == 'ST':
+                        st_loops += 1
+                    if self.pool is None:
+                        # Fork the workers after the first maps are loaded
+                        self.pool = multiprocessing.Pool(self.workers, _init_worker,
+                                                         (self.param.params, self.map_path))
+                else:
+                    self.pending.append(('seg', seg, seg_src, self.cur_map, self.map_file,
+                                         self.fic, self.vriic))
+                self._drain(self.workers * TASKS_PER_WORKER)
+            self._flush(batch, batch_start)
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+        self.src.cleanup()  # Catch any skipped loop trailers
+        self.errh.handle_errors(self.errors + self.src.pop_errors())
+        if self.html:
+            self.html.footer()
+        self.html = None
+        self.xmldoc = None
+
+    def _set_gs_map(self, seg):
+        """
+        Get the map for a GS loop, when the GS segment is read
+        """
+        self.fic = seg.get_value('GS01')
+        self.vriic = seg.get_value('GS08')
+        map_file_new = self.map_index_if.get_filename(self.icvn, self.vriic, self.fic)
+        if self.map_file != map_file_new:
+            self.map_file = map_file_new
+            if self.map_file is None:
+                err_str = "Map not found.  icvn={}, fic={}, vriic={}".format(self.icvn, self.fic, self.vriic)
+                raise pyx12.errors.EngineError(err_str)
+            self.cur_map = _get_map(self.map_file, self.param, self.map_path)
+            self.src.check_837_lx = True if self.cur_map.id == '837' else False
+            logger.debug('Map file: %s' % (self.map_file))
+
+    def _submit_batch(self, batch, batch_start):
+        seg_list = [(seg, seg_src.get_seg_count(), seg_src.get_cur_line(), seg_src.get_ls_id())
+                    for (seg, seg_src) in batch]
+        (start_ref, start_counts) = batch_start
+        task = (self.map_file, self.icvn, self.fic, self.vriic, start_ref, start_counts, seg_list)
+        self.pending.append(('batch', task, self.pool.apply_async(_run_task, (task,)),
+                             [seg_src for (seg, seg_src) in batch]))
+
+    def _flush(self, batch, batch_start):
+        """
+        Submit the open batch and handle everything pending
+        """
+        if batch:
+            self._submit_batch(batch, batch_start)
+        self._drain(0)
+
+    def _drain(self, max_pending):
+        while len(self.pending) > max_pending:
+            item = self.pending.popleft()
+            if item[0] == 'seg':
+                self._handle_seg(*item[1:])
+            else:
+                self._handle_batch(*item[1:])
+
+    def _output_seg(self, node, seg, seg_src):
+        if self.html:
+            if node is not None and node.is_first_seg_in_loop():
+                self.html.loop(node.get_parent())
+            err_node_list = []
+            while True:
+                try:
+                    self.err_iter.next()
+                    err_node = self.err_iter.get_cur_node()
+                    err_node_list.append(err_node)
+                except pyx12.errors.IterOutOfBounds:
+                    break
+            self.html.gen_seg(seg, seg_src, err_node_list)
+        if self.xmldoc:
+            self.xmldoc.seg(node, seg)
+
+    def _handle_found_seg(self, node, seg, seg_src):
+        """
+        Add the error tree nodes for a segment, as x12n_document does
+        """
+        errh = self.errh
+        seg_id = seg.get_seg_id()
+        errors = self.errors
+        self.errors = []
+        if seg_id == 'ISA':
+            errh.add_isa_loop(seg, seg_src)
+            errh.handle_errors(errors)
+        elif seg_id == 'IEA':
+            errh.handle_errors(errors)
+            errh.close_isa_loop(node, seg, seg_src)
+        elif seg_id == 'GS':
+            errh.add_gs_loop(seg, seg_src)
+            errh.handle_errors(errors)
+        elif seg_id == 'GE':
+            errh.handle_errors(errors)
+            errh.close_gs_loop(node, seg, seg_src)
+        elif seg_id == 'ST':
+            errh.add_st_loop(seg, seg_src)
+            errh.handle_errors(errors)
+        elif seg_id == 'SE':
+            errh.handle_errors(errors)
+            errh.close_st_loop(node, seg, seg_src)
+        else:
+            errh.add_seg(node, seg, seg_src.get_seg_count(), seg_src.get_cur_line(), seg_src.get_ls_id())
+            errh.handle_errors(errors)
+
+    def _handle_seg(self, seg, seg_src, gs_map, map_file, fic, vriic):
+        """
+        Walk, check and output a segment outside of a run of transaction
+        set segments
+        """
+        node = self.node
+        orig_node = node
+        self.errors.extend(seg_src.errors)
+        seg_id = seg.get_seg_id()
+        if seg_id == 'ISA':
+            node = self.control_map.getnodebypath('/ISA_LOOP/ISA')
+            self.walker.forceWalkCounterToLoopStart('/ISA_LOOP', '/ISA_LOOP/ISA')
+        elif seg_id == 'GS':
+            node = self.control_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+            self.walker.forceWalkCounterToLoopStart('/ISA_LOOP/GS_LOOP', '/ISA_LOOP/GS_LOOP/GS')
+        else:
+            try:
+                (node, pop_loops, push_loops) = self.walker.walk(node, seg, self.errh,
+                    seg_src.get_seg_count(), seg_src.get_cur_line(), seg_src.get_ls_id())
+            except pyx12.errors.EngineError:
+                logger.error('Source file line %i' % (seg_src.get_cur_line()))
+                raise
+        if node is None:
+            node = orig_node
+        else:
+            if seg_id == 'GS':
+                node = gs_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+                self.walk_map_file = map_file
+            elif seg_id == 'BHT' and vriic in ('004010X094', '004010X094A1'):
+                # special case for 4010 837P
+                tspc = seg.get_value('BHT02')
+                map_file_new = self.map_index_if.get_filename(self.icvn, vriic, fic, tspc)
+                if self.walk_map_file != map_file_new:
+                    if map_file_new is None:
+                        err_str = "Map not found.  icvn={}, fic={}, vriic={}, tspc={}".format(
+                            self.icvn, fic, vriic, tspc)
+                        raise pyx12.errors.EngineError(err_str)
+                    self.walk_map_file = map_file_new
+                    node = _get_map(map_file_new, self.param, self.map_path).getnodebypath(
+                        '/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
+            self._handle_found_seg(node, seg, seg_src)
+            if self.level >= pyx12.params.LEVEL_ELEMENTS:
+                self.valid &= node.is_valid(seg, self.errh, self.level >= pyx12.params.LEVEL_FULL)
+        self.node = node
+        self._output_seg(node, seg, seg_src)
+
+    def _handle_batch(self, task, async_result, seg_srcs):
+        """
+        Apply the worker results for a run of transaction set segments
+        """
+        (results, end_ref, end_map_file, (reads, resets, counts)) = async_result.get()
+        matched = task[0] == self.walk_map_file \
+            and _get_node(task[4], self.param, self.map_path) is self.node
+        for (path_str, count) in reads:
+            if not matched:
+                break
+            matched = self.walker.counter.get_count(path_str) == count
+        if not matched:
+            # The predicted starting state was wrong.  Validate from the
+            # actual state.
+            logger.debug('Validating transaction sets from line %i in the main process'
+                         % (seg_srcs[0].get_cur_line()))
+            task = (self.walk_map_file,) + task[1:4] \
+                + (_get_node_ref(self.node), self.walker.getCountState()) + task[6:]
+            (results, end_ref, end_map_file, (reads, resets, counts)) = _validate_segments(
+                self.param, self.map_path, task)
+        for ((seg, seg_count, cur_line, ls_id), seg_src, seg_result) in zip(task[6], seg_srcs, results):
+            (walk_calls, found, node_ref, valid_calls, valid) = seg_result
+            self.errors.extend(seg_src.errors)
+            if walk_calls:
+                _apply_calls(self.errh, walk_calls, self.param, self.map_path)
+            node = _get_node(node_ref, self.param, self.map_path)
+            if found:
+                self._handle_found_seg(node, seg, seg_src)
+                if valid_calls:
+                    _apply_calls(self.errh, valid_calls, self.param, self.map_path)
+                self.valid &= valid
+            self._output_seg(node, seg, seg_src)
+        for path_str in resets:
+            self.walker.counter.reset_to_node(path_str)
+        for (path_str, count) in counts:
+            self.walker.counter.setCount(path_str, count)
+        self.node = _get_node(end_ref, self.param, self.map_path)
+        self.walk_map_file = end_map_file
+
+
+def x12n_document_parallel(param, src_file, fd_997, fd_html,
+                           fd_xmldoc=None, xslt_files=None, map_path=None, workers=None,
+                           error_sinks=None):
+    """
+    X12 validation, with the transaction sets validated by a pool of
+    worker processes.  Arguments and result are the same as for
+    L{x12n_document<x12n_document.x12n_document>}.
+
+    @param workers: Number of worker processes.  If None, the number of CPUs
+    @type workers: int
+    @rtype: boolean
+    """
+    from pyx12.x12n_document import write_ack
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    errh = pyx12.error_handler.err_handler(keep_tree=bool(fd_997 or fd_html))
+    for sink in error_sinks or []:
+        errh.add_sink(sink)
+
+    control_store = None
+    if param.get('control_store'):
+        control_store = pyx12.control_store.ControlNumberStore(param.get('control_store'))
+    try:
+        # Get X12 DATA file
+        try:
+            src = pyx12.x12file.X12Reader(src_file, control_store)
+        except pyx12.errors.X12Error:
+            logger.error('"%s" does not look like an X12 data file' % (src_file))
+            return False
+
+        ack = None
+        if fd_997 and not fd_html:
+            ack = pyx12.error_ack.ack_writer(errh, fd_997, src.get_term())
+        doc = _ParallelDocument(param, src, errh, map_path, workers, fd_html, fd_xmldoc)
+        doc.run()
+    finally:
+        if control_store is not None:
+            control_store.close()
+    if ack is not None:
+        ack.finish(doc.fic, doc.vriic)
+    else:
+        write_ack(errh, fd_997, doc.fic, doc.vriic, src.get_term())
+    if not doc.valid or errh.get_error_count() > 0:
+        return False
+    return True
+
+
+def _predict_start(cur_map, st_loops):
+    """
+    Predict the walker state at the start of a transaction set, as it is
+    after a well formed previous transaction set in the same GS loop
+
+    @param cur_map: The map of the GS loop
+    @param st_loops: Count of the previous ST loops in the GS loop
+    @return: Reference to the starting node, and the starting counts
+    """
+    gs_node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+    counts = {gs_node.x12path.format(): 1}
+    if st_loops == 0:
+        return (_get_node_ref(gs_node), counts)
+    st_loop = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP')
+    se_node = st_loop.getnodebypath('SE')
+    counts[st_loop.x12path.format()] = st_loops
+    counts[se_node.x12path.format()] = 1
+    return (_get_node_ref(se_node), counts)